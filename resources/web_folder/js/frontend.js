@@ -1,50 +1,292 @@
+// Maximal number of cards inside the document. Older or newer cards are removed and loaded
+// again from the history of the backend while scrolling.
+const MAX_RENDERED_CARDS = 200
+const PAGE_SIZE = 50
 
+// Distance in pixel to the top or bottom at which the next page is loaded
+const SCROLL_MARGIN = 100
 
+const text_container = window.document.getElementById("text-container")
 
+// Remote learners open the page with ?session=<id>, the window of the local learner is
+// opened with the token which allows to control the application
+const PARAMETERS = new URLSearchParams(window.location.search)
+const SESSION_ID = PARAMETERS.get("session")
+const TOKEN = PARAMETERS.get("token")
 
+// History index of the first rendered card and the index after the last rendered card
+let first_index = 0
+let next_index = 0
+let history_total = 0
+
+let initialized = false
+let loading = false
+
+
+// Pending messages are sent together, they are shown in the order they were received.
+// The backend only sends the messages of the session of the page.
+eel.expose(update_batch)
+function update_batch(batch) {
+    const follow = is_at_bottom()
+
+    batch.forEach(update)
+
+    if (follow) {
+        trim_top()
+        text_container.scrollTo(0, text_container.scrollHeight)
+    }
+}
 
 eel.expose(update)
 function update(data) {
+    // Messages received before the first page are contained in the first page
+    if (!initialized) {
+        return
+    }
+
+    const index = data["history_index"]
+    const following = next_index === history_total
+
+    if (index !== undefined) {
+        history_total = Math.max(history_total, index + 1)
+    }
+
+    // Messages of a stream update the card which was created by their first message
+    if ("message_id" in data) {
+        const card = window.document.getElementById(card_id(data))
+
+        if (card !== null) {
+            set_card_text(card.querySelector("p"), data)
+
+            if (index !== undefined) {
+                card.dataset.index = index
+                if (next_index === index) {
+                    next_index = index + 1
+                }
+            }
+            return
+        }
+    }
 
-    console.log(data)
+    // Only add the card if the newest messages are shown
+    if (index !== undefined) {
+        if (index !== next_index) {
+            return
+        }
+        next_index = index + 1
+    } else if (!following) {
+        return
+    }
 
-    text = data["data"]
-    //text.strip()
-    text = text.replace("\n", "<br />")
+    text_container.appendChild(create_card(data))
+}
 
-    console.log(text)
+function card_id(data) {
+    if ("message_id" in data) {
+        return `card-${data["message_id"]}`
+    }
+    return `card-h${data["history_index"]}`
+}
 
+function create_card(data) {
     // Default lable and alignment
-    label = `User (${data["source"]})`
-    text_alignment = "align-self-end me-3"
+    let label = `User (${data["source"]})`
+    let text_alignment = "align-self-end me-3"
 
-    // 
     if (data["source"] === "llm") {
         label = `System (${data["source"]})`
         text_alignment = "align-self-start ms-3"
     }
 
+    const card = document.createElement("div")
+    card.id = card_id(data)
+    card.className = `card p-3 ${text_alignment} mt-4 w-50 bg-secondary text-light fs-5`
+    if ("history_index" in data) {
+        card.dataset.index = data["history_index"]
+    }
+
+    const title = document.createElement("div")
+    title.className = "fs-4 fw-bold card-title"
+    title.textContent = label
+
+    const body = document.createElement("div")
+    body.className = "card-body"
+
+    const card_text = document.createElement("p")
+    card_text.style.whiteSpace = "pre-wrap"
+    body.appendChild(card_text)
+
+    card.append(title, body)
+    set_card_text(card_text, data)
+
+    return card
+}
+
+function set_card_text(card_text, data) {
+    const text = data["data"]
+
+    // Partial messages of a text stream only contain the newly generated text
+    if (data["partial"] && !("stable" in data)) {
+        card_text.append(text)
+        return
+    }
+
+    card_text.replaceChildren()
+
+    // Hypotheses of the speech recognition contain the complete text, of which only
+    // the stable part is not expected to change anymore
+    if ("stable" in data && text.startsWith(data["stable"])) {
+        const unstable = document.createElement("span")
+        unstable.className = "opacity-50"
+        unstable.textContent = text.substring(data["stable"].length)
+
+        card_text.append(data["stable"], unstable)
+    } else {
+        card_text.append(text)
+    }
+}
+
+function is_at_bottom() {
+    return (
+        text_container.scrollHeight - text_container.scrollTop - text_container.clientHeight
+        < SCROLL_MARGIN
+    )
+}
+
+function render_page(messages) {
+    const fragment = document.createDocumentFragment()
+    messages.forEach(data => fragment.appendChild(create_card(data)))
+    return fragment
+}
+
+// Remove the oldest cards while the newest messages are shown
+function trim_top() {
+    const height = text_container.scrollHeight
+    while (text_container.children.length > MAX_RENDERED_CARDS) {
+        text_container.firstElementChild.remove()
+    }
+    first_index = Number(text_container.firstElementChild?.dataset.index ?? next_index)
+
+    // Keep the visible cards at their position
+    text_container.scrollTop -= height - text_container.scrollHeight
+}
+
+// Remove the newest cards while older messages are shown
+function trim_bottom() {
+    while (text_container.children.length > MAX_RENDERED_CARDS) {
+        const card = text_container.lastElementChild
+        if (card.dataset.index !== undefined) {
+            next_index = Number(card.dataset.index)
+        }
+        card.remove()
+    }
+}
+
+async function load_older() {
+    const start = Math.max(first_index - PAGE_SIZE, 0)
+    const page = await eel.get_history(start, first_index - start)()
+
+    const height = text_container.scrollHeight
+    text_container.prepend(render_page(page.messages))
+    first_index = start
+    history_total = page.total
+
+    // Keep the visible cards at their position
+    text_container.scrollTop += text_container.scrollHeight - height
+
+    trim_bottom()
+}
+
+async function load_newer() {
+    const page = await eel.get_history(next_index, PAGE_SIZE)()
+
+    text_container.appendChild(render_page(page.messages))
+    next_index += page.messages.length
+    history_total = page.total
+
+    trim_top()
+}
 
-    html = `
-<div id="card" class="card p-3 ${text_alignment} mt-4 w-50 bg-secondary text-light fs-5">
-    <div class="fs-4 fw-bold card-title">
-        ${label}
-    </div>
-    <div class="card-body">
-        <p>
-            ${text}
-        </p>
-    </div>
-</div>
+async function on_scroll() {
+    if (loading || !initialized) {
+        return
+    }
 
-`
+    loading = true
+    try {
+        if (text_container.scrollTop < SCROLL_MARGIN && first_index > 0) {
+            await load_older()
+        } else if (is_at_bottom() && next_index < history_total) {
+            await load_newer()
+        }
+    } finally {
+        loading = false
+    }
+}
 
-    text_container = window.document.getElementById("text-container")
+async function load_history() {
+    const page = await eel.get_history(null, PAGE_SIZE)()
+
+    text_container.replaceChildren(render_page(page.messages))
+    first_index = page.start
+    next_index = page.start + page.messages.length
+    history_total = page.total
+    initialized = true
 
-    text_container.innerHTML += html
     text_container.scrollTo(0, text_container.scrollHeight)
+}
 
 
+// Audio of the replies to a remote session, which is not played by the local device
+let audio_context = null
+let audio_end_time = 0
+
+eel.expose(play_audio)
+function play_audio(data, sampling_rate) {
+    if (audio_context === null) {
+        return
+    }
+
+    // 16 bit PCM data encoded as base64
+    const bytes = Uint8Array.from(atob(data), character => character.charCodeAt(0))
+    const pcm = new Int16Array(bytes.buffer)
+
+    const buffer = audio_context.createBuffer(1, pcm.length, sampling_rate)
+    const channel = buffer.getChannelData(0)
+    pcm.forEach((value, i) => { channel[i] = value / 32768 })
+
+    // The sentences are played one after another
+    const source = audio_context.createBufferSource()
+    source.buffer = buffer
+    source.connect(audio_context.destination)
+    audio_end_time = Math.max(audio_end_time, audio_context.currentTime)
+    source.start(audio_end_time)
+    audio_end_time += buffer.duration
+}
+
+
+// Input is only accepted once all modules of the pipeline are ready
+eel.expose(set_ready)
+function set_ready(ready) {
+    const button = document.getElementById("btn-submit-text-input")
+    button.disabled = !ready
+    button.textContent = ready ? "Send" : "Loading..."
+
+    for (const control of document.getElementsByClassName("btn-control")) {
+        control.disabled = !ready
+    }
+}
+
+// The recording and the application are controlled by the local learner only, the
+// backend rejects the commands of other pages
+if (SESSION_ID !== null) {
+    document.getElementById("control-buttons").classList.add("d-none")
+}
+
+
+// The commands are executed by the supervisor of the pipeline
+function send_command(event) {
+    eel.send_command(event.currentTarget.dataset.command)
 }
 
 
@@ -53,10 +295,25 @@ function send_text_to_backend() {
     text = text_input.value
     console.log("Send text")
     eel.process_frontend_text(text)
+
+    // Browsers only allow audio after an interaction of the user
+    if (SESSION_ID !== null && audio_context === null) {
+        audio_context = new AudioContext()
+    }
     text_input.value = ""
 }
 
 
 document.getElementById("btn-submit-text-input").addEventListener("click", send_text_to_backend)
+text_container.addEventListener("scroll", on_scroll)
+for (const control of document.getElementsByClassName("btn-control")) {
+    control.addEventListener("click", send_command)
+}
 
-eel.get_data()
\ No newline at end of file
+// The backend passes the page to its functions, which act within the session of the page
+eel.register_page(SESSION_ID, TOKEN)().then(registered => {
+    if (registered) {
+        load_history()
+        eel.is_pipeline_ready()().then(set_ready)
+    }
+})
@@ -1,15 +1,18 @@
 """This modules uses google text to speech API to convert the given text to speech."""
 
 from io import BytesIO
-from pygame import mixer
-from gtts import gTTS
-import time
+import numpy
 
-from core.processing import AbstractActionProcess
+from audio.tts_pipeline import AbstractTTSModule
 
 
-class gTTSModule(AbstractActionProcess):
-    def __init__(self, manager, output_queues=(), language="en", accent="com.au"):
+class gTTSModule(AbstractTTSModule):
+    # Sampling rate used to decode the received mp3 data
+    SAMPLING_RATE = 24000
+
+    def __init__(
+        self, manager, output_queues=(), language="en", accent="com.au", **kwargs
+    ):
         """This modules uses google text to speech API to convert the given text to speech.
 
         Args:
@@ -18,31 +21,41 @@ class gTTSModule(AbstractActionProcess):
         """
         self.language = language
         self.accent = accent
-        super().__init__(manager, "tts", output_queues=output_queues)
+        super().__init__(manager, output_queues=output_queues, **kwargs)
+
+    def synthesize(self, text, language=None):
+        # pylint: disable=import-outside-toplevel
+        from gtts import gTTS
+        from pygame import mixer, sndarray
 
-    def process(self, data_in):
-        audio = gTTS(data_in["data"], lang=self.language, tld=self.accent)
+        audio = gTTS(text, lang=self.language, tld=self.accent)
 
         mp3_fp = BytesIO()
         audio.write_to_fp(mp3_fp)
 
         mp3_fp.seek(0)
 
-        mixer.music.load(mp3_fp)
+        # Decode the mp3 data with the mixer, the playback is done by the audio sink
+        sound = mixer.Sound(file=mp3_fp)
+        samples = sndarray.array(sound)
 
-        mixer.music.play()
+        return samples.astype(numpy.float32) / 2**15, self.SAMPLING_RATE
 
-        # Wait until file is played
-        while mixer.music.get_busy():
-            time.sleep(0.1)
+    def cache_parameters(self, language=None):
+        return {"voice": self.accent, "language": self.language}
 
-        return None
+    def warm_up(self):
+        # pylint: disable=import-outside-toplevel
+        from pygame import mixer
 
-    def run(self, *args, **kwargs):
-        # Initialiaze the audio mixer
+        # Initialiaze the audio mixer, which is only used to decode the audio
+        mixer.init(frequency=self.SAMPLING_RATE, channels=1)
 
-        super().run(*args, **kwargs)
+        super().warm_up()
 
     def clean_up(self):
+        # pylint: disable=import-outside-toplevel
+        from pygame import mixer
+
+        super().clean_up()
         mixer.quit()
-        return super().clean_up()
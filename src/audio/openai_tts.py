@@ -1,43 +1,60 @@
 """Module for OpenAi TTS"""
 
 import os
-import random
 import numpy as np
-from openai import OpenAI
-import scipy
-import scipy.signal
-import sounddevice as sd
 
-from core.processing import AbstractActionProcess
+from audio.tts_pipeline import AbstractTTSModule, SoundDeviceSink
 
 
-class OpenAITTS(AbstractActionProcess):
+class OpenAITTS(AbstractTTSModule):
     """Module to convert text to speech using OpenAi TTS.
     See https://platform.openai.com/docs/guides/text-to-speech
     """
 
-    def __init__(self, manager, output_queues=(), audio_output_device=None):
-        """This modules uses Open Ai text to speech API to convert the given text to speech."""
+    # Sampling rate of the pcm response format
+    SAMPLING_RATE = 24000
+
+    def __init__(
+        self,
+        manager,
+        output_queues=(),
+        audio_output_device=None,
+        voice="alloy",
+        prefetch=3,
+        **kwargs,
+    ):
+        """This modules uses Open Ai text to speech API to convert the given text to speech.
+
+        Args:
+            audio_output_device (int or str, optional): Device used for the playback.
+            voice (str, optional): Voice of the speaker. The voice is part of the key of
+                                   the persistent audio cache, so it is fixed instead of
+                                   chosen randomly. Defaults to "alloy".
+            prefetch (int, optional): Number of sentences which are requested concurrently.
+                                   Defaults to 3.
+        """
         self.client = None
 
         self.audio_output_device = audio_output_device
-        self.output_sampling_rate = None
 
         # Model, options are "tts-1" and "tts-1-hd" for higher quality and cost
         self.model = "tts-1"
         # All voice options
         self.voices = ["alloy", "echo", "fable", "nova", "onyx", "shimmer"]
+        # Voice used for all sessions
+        self.voice = voice
         # Response format of the audio
         self.response_format = "pcm"
-        super().__init__(manager, "tts", output_queues=output_queues)
+        super().__init__(
+            manager, output_queues=output_queues, prefetch=prefetch, **kwargs
+        )
 
-    def process(self, data_in):
-        # Use
+    def synthesize(self, text, language=None):
         response = self.client.audio.speech.create(
             model=self.model,
-            voice=self.voices[random.randint(0, len(self.voices) - 1)],
+            voice=self.voice,
             response_format=self.response_format,
-            input=data_in["data"],
+            input=text,
         )
 
         # Parse the received data. Datatype is signed 16bit 24kHz
@@ -49,30 +66,29 @@ class OpenAITTS(AbstractActionProcess):
         # Adjust the values to bring them into a range of -1 to 1
         normalized_audio = converted_audio / 2**15
 
-        # Resample audio to sample rate of the audio output device
-        resample_scale = self.output_sampling_rate / 24e3
+        return normalized_audio, self.SAMPLING_RATE
 
-        resampled_audio = scipy.signal.resample_poly(
-            normalized_audio, resample_scale * 4, 4
-        )
+    def cache_parameters(self, language=None):
+        return {"model": self.model, "voice": self.voice}
 
-        # Play audio
-        sd.play(resampled_audio)
+    def create_sink(self):
+        return SoundDeviceSink(self.audio_output_device)
 
-        sd.wait()
+    def create_client(self):
+        """Create the client of the OpenAI API."""
+        # pylint: disable=import-outside-toplevel
+        from openai import OpenAI
 
-        return None
+        return OpenAI()
 
-    def run(self, *args, **kwargs):
-        self.client = OpenAI()
-        self.audio_output_device = os.environ.get("DEFAULT_AUDIODEVICE_OUTPUT", None)
-        sd.default.device = self.audio_output_device
-        print(sd.query_devices(self.audio_output_device))
-        self.output_sampling_rate = sd.query_devices(self.audio_output_device)[
-            "default_samplerate"
-        ]
-        super().run(*args, **kwargs)
+    def warm_up(self):
+        # The client is shared by the concurrent requests of the prefetched sentences
+        self.client = self.create_client()
+        self.audio_output_device = os.environ.get(
+            "DEFAULT_AUDIODEVICE_OUTPUT", self.audio_output_device
+        )
+        super().warm_up()
 
     def clean_up(self):
+        super().clean_up()
         self.client.close()
-        return super().clean_up()
@@ -0,0 +1,169 @@
+"""Module containing the resampling of audio data, which is shared by all modules.
+
+The resampling uses rational polyphase filters. The filter of each pair of sampling rates is
+only designed once.
+"""
+
+from __future__ import annotations
+
+import functools
+import math
+from fractions import Fraction
+
+import numpy
+
+
+@functools.lru_cache(maxsize=None)
+def rational_factors(in_rate: float, out_rate: float) -> tuple:
+    """Return the up and down sampling factors to convert between the sampling rates."""
+    factor = Fraction(int(round(out_rate)), int(round(in_rate)))
+    return factor.numerator, factor.denominator
+
+
+@functools.lru_cache(maxsize=32)
+def design_filter(up: int, down: int) -> numpy.ndarray:
+    """Return the low pass filter for the given factors. It is the same filter which is used
+    by default by `scipy.signal.resample_poly`."""
+    # pylint: disable=import-outside-toplevel
+    import scipy.signal
+
+    max_rate = max(up, down)
+    half_length = 10 * max_rate
+    taps = scipy.signal.firwin(
+        2 * half_length + 1, 1.0 / max_rate, window=("kaiser", 5.0)
+    )
+
+    # The filter is shared, so it must not be modified
+    taps.flags.writeable = False
+    return taps
+
+
+def resample(data: numpy.ndarray, in_rate: float, out_rate: float) -> numpy.ndarray:
+    """Resample the complete audio data.
+
+    Args:
+        data (numpy.ndarray): The mono audio data.
+        in_rate (float): Sampling rate of the data.
+        out_rate (float): Target sampling rate.
+
+    Returns:
+        numpy.ndarray: The resampled float32 data.
+    """
+    data = numpy.asarray(data, dtype=numpy.float32)
+
+    up, down = rational_factors(in_rate, out_rate)
+    if up == down:
+        return data
+
+    # pylint: disable=import-outside-toplevel
+    import scipy.signal
+
+    return scipy.signal.resample_poly(
+        data, up, down, window=design_filter(up, down)
+    ).astype(numpy.float32, copy=False)
+
+
+class StreamingResampler:
+    """Resamples audio which is received in chunks.
+
+    The filter state is carried from one chunk to the next, so the concatenated output is
+    the same as resampling the concatenated input with `resample`.
+    """
+
+    def __init__(self, in_rate: float, out_rate: float):
+        """Constructor.
+
+        Args:
+            in_rate (float): Sampling rate of the input.
+            out_rate (float): Sampling rate of the output.
+        """
+        self.up, self.down = rational_factors(in_rate, out_rate)
+
+        self._identity = self.up == self.down
+        if self._identity:
+            return
+
+        taps = design_filter(self.up, self.down) * self.up
+        self._delay = (len(taps) - 1) // 2
+
+        # Split the filter into one sub filter per phase. The taps are reversed, so that
+        # they can be applied to ascending windows of the input.
+        self._tap_count = math.ceil(len(taps) / self.up)
+        self._polyphase = numpy.zeros((self.up, self._tap_count), dtype=numpy.float32)
+        for phase in range(self.up):
+            phase_taps = taps[phase :: self.up]
+            self._polyphase[phase, : len(phase_taps)] = phase_taps
+        self._polyphase = self._polyphase[:, ::-1].copy()
+
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the filter state to start a new stream."""
+        if self._identity:
+            return
+
+        # The input before the first sample is treated as zero
+        self._history = numpy.zeros(self._tap_count - 1, dtype=numpy.float32)
+        self._history_start = -(self._tap_count - 1)
+        self._received = 0
+        self._produced = 0
+
+    def process(self, chunk: numpy.ndarray) -> numpy.ndarray:
+        """Add a chunk of input data and return all output samples which can be computed."""
+        if self._identity:
+            return numpy.asarray(chunk, dtype=numpy.float32)
+
+        self._received += len(chunk)
+        buffer = numpy.concatenate(
+            (self._history, numpy.asarray(chunk, dtype=numpy.float32))
+        )
+
+        # Last output sample whose filter window ends inside the received input
+        last = (self._received * self.up - 1 - self._delay) // self.down
+        outputs = numpy.arange(self._produced, max(last + 1, self._produced))
+
+        if len(outputs) == 0:
+            self._history = buffer
+            return numpy.zeros(0, dtype=numpy.float32)
+
+        positions = outputs * self.down + self._delay
+        phases = positions % self.up
+        window_starts = (
+            positions // self.up - (self._tap_count - 1) - self._history_start
+        )
+
+        windows = numpy.lib.stride_tricks.sliding_window_view(buffer, self._tap_count)
+        result = numpy.einsum(
+            "ij,ij->i", self._polyphase[phases], windows[window_starts]
+        ).astype(numpy.float32, copy=False)
+
+        self._produced += len(outputs)
+
+        # Keep the input which is needed for the next output sample
+        next_start = (self._produced * self.down + self._delay) // self.up - (
+            self._tap_count - 1
+        )
+        self._history = buffer[next_start - self._history_start :].copy()
+        self._history_start = next_start
+
+        return result
+
+    def flush(self) -> numpy.ndarray:
+        """Return the remaining output samples, treating the input after the last received
+        sample as zero. The resampler is reset afterwards."""
+        if self._identity:
+            return numpy.zeros(0, dtype=numpy.float32)
+
+        total = math.ceil(self._received * self.up / self.down)
+        missing = total - self._produced
+
+        result = numpy.zeros(0, dtype=numpy.float32)
+        if missing > 0:
+            required_input = math.ceil(
+                ((total - 1) * self.down + self._delay + 1) / self.up
+            )
+            padding = max(required_input - self._received, 0)
+            result = self.process(numpy.zeros(padding, dtype=numpy.float32))[:missing]
+
+        self.reset()
+        return result
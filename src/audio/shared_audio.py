@@ -0,0 +1,193 @@
+"""Module containing a shared memory ring buffer to pass audio data between processes
+without sending the samples through a queue."""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, replace
+from multiprocessing import shared_memory
+
+import numpy
+
+_SLOT_FREE = 0
+_SLOT_WRITTEN = 1
+
+# The samples start at a multiple of this offset inside the shared memory block
+_DATA_ALIGNMENT = 64
+
+# Rings which were attached by name inside the current process
+_ATTACHED_RINGS: dict = dict()
+
+
+@dataclass(frozen=True)
+class AudioSlot:
+    """Descriptor of one audio block stored inside a `SharedAudioRing`. Only this small
+    descriptor is send over the queues. Each receiver of a slot gets its own descriptor,
+    which differs in `reader`."""
+
+    ring_name: str
+    slot_count: int
+    slot_length: int
+    slot: int
+    length: int
+    sampling_rate: float
+    reader: int = 0
+    max_readers: int = 1
+
+    def read(self) -> numpy.ndarray:
+        """Return a view of the stored float32 samples. The view is only valid until the slot
+        is released."""
+        return SharedAudioRing.attach(self).view(self)
+
+    def release(self) -> None:
+        """Release the slot for this reader. The producer reuses the slot once all its
+        readers released it."""
+        SharedAudioRing.attach(self).release(self)
+
+    def for_reader(self, reader: int) -> AudioSlot:
+        """Return the descriptor of the same slot for another reader."""
+        return replace(self, reader=reader)
+
+
+class SharedAudioRing:
+    """Ring of fixed size float32 slots inside a shared memory block.
+
+    The ring is intended for a single producer. The producer writes into a free slot and
+    sends the returned `AudioSlot` to the consumers, which release the slot after they are
+    done with the data. If a slot is read by several consumers, each consumer gets the
+    descriptor of its own reader. Every reader has its own flag per slot, which only the
+    reader clears, so the consumers do not need a lock.
+    """
+
+    def __init__(
+        self,
+        slot_count: int = 4,
+        slot_length: int = 30 * 48000,
+        name: str = None,
+        create: bool = True,
+        max_readers: int = 1,
+    ):
+        """Constructor.
+
+        Args:
+            slot_count (int, optional): Number of slots inside the ring. Defaults to 4.
+            slot_length (int, optional): Maximal number of samples per slot. Defaults to 30 * 48000.
+            name (str, optional): Name of the shared memory block. Required if create is false.
+            create (bool, optional): Create a new block instead of attaching to an existing one.
+            max_readers (int, optional): Maximal number of consumers of one slot. Defaults to 1.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.slot_count = slot_count
+        self.slot_length = slot_length
+        self.max_readers = max_readers
+
+        header_size = -(-slot_count * max_readers // _DATA_ALIGNMENT) * _DATA_ALIGNMENT
+        data_size = slot_count * slot_length * numpy.dtype(numpy.float32).itemsize
+
+        self._owner = create
+        self._memory = shared_memory.SharedMemory(
+            name=name, create=create, size=header_size + data_size
+        )
+
+        # Flag of each reader of each slot, which is set until the reader released it
+        self._state = numpy.ndarray(
+            (slot_count, max_readers), dtype=numpy.uint8, buffer=self._memory.buf
+        )
+        self._slots = numpy.ndarray(
+            (slot_count, slot_length),
+            dtype=numpy.float32,
+            buffer=self._memory.buf,
+            offset=header_size,
+        )
+
+        if create:
+            self._state[:] = _SLOT_FREE
+
+        self._next_slot = 0
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory block."""
+        return self._memory.name
+
+    @classmethod
+    def attach(cls, descriptor: AudioSlot) -> SharedAudioRing:
+        """Return the ring the given descriptor belongs to. The ring is only attached once
+        per process."""
+        ring = _ATTACHED_RINGS.get(descriptor.ring_name, None)
+        if ring is None:
+            ring = cls(
+                descriptor.slot_count,
+                descriptor.slot_length,
+                name=descriptor.ring_name,
+                create=False,
+                max_readers=descriptor.max_readers,
+            )
+            _ATTACHED_RINGS[descriptor.ring_name] = ring
+
+        return ring
+
+    def write(
+        self, data: numpy.ndarray, sampling_rate: float, readers: int = 1
+    ) -> AudioSlot | None:
+        """Copy the data into the next free slot.
+
+        Args:
+            data (numpy.ndarray): The float32 samples.
+            sampling_rate (float): Sampling rate of the samples.
+            readers (int, optional): Number of consumers which have to release the slot. The
+                                     descriptor of reader i is `for_reader(i)`. Defaults to 1.
+
+        Returns:
+            AudioSlot: The descriptor of the first reader of the written slot, or None if all
+                       slots are in use.
+        """
+        if not 1 <= readers <= self.max_readers:
+            raise ValueError(
+                f"A slot can be read by 1 to {self.max_readers} consumers, got {readers}"
+            )
+
+        length = min(len(data), self.slot_length)
+        if length < len(data):
+            self.logger.warning(
+                f"Audio block with {len(data)} samples truncated to {self.slot_length}"
+            )
+
+        for offset in range(self.slot_count):
+            slot = (self._next_slot + offset) % self.slot_count
+            if not self._state[slot].any():
+                break
+        else:
+            return None
+
+        self._slots[slot, :length] = data[:length]
+        self._state[slot, :readers] = _SLOT_WRITTEN
+        self._next_slot = (slot + 1) % self.slot_count
+
+        return AudioSlot(
+            self.name,
+            self.slot_count,
+            self.slot_length,
+            slot,
+            length,
+            sampling_rate,
+            max_readers=self.max_readers,
+        )
+
+    def view(self, descriptor: AudioSlot) -> numpy.ndarray:
+        """Return a view on the samples of the given slot."""
+        return self._slots[descriptor.slot, : descriptor.length]
+
+    def release(self, descriptor: AudioSlot) -> None:
+        """Mark the given slot as released by the reader of the descriptor."""
+        self._state[descriptor.slot, descriptor.reader] = _SLOT_FREE
+
+    def close(self) -> None:
+        """Close the shared memory and remove it if this ring created it."""
+        # The numpy views have to be dropped before the buffer can be closed
+        del self._state
+        del self._slots
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
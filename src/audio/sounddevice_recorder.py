@@ -1,70 +1,134 @@
 """Module containing the Audio recording logic with the sounddevice library."""
 
 import logging
+import time
+import uuid
+from queue import Full
 import numpy
-import torch
 
-import sounddevice as sd
+from audio.shared_audio import SharedAudioRing
+from audio.vad import UtteranceSegmenter
+from core.transport import as_transport
 
 
 class SoundDeviceRecorderModule:
     """This module records the specified device and provides the recorded data over a shared memory
-    to other modules. New data availability is signaled through an event.
+    to other modules. Only a descriptor of the shared memory slot is send over the output queues.
     """
 
     def __init__(
         self,
         manager,
-        model_device,
+        model_device=None,
         output_queues=None,
         duration: int = 30,
-        device=sd.default.device[0],
+        device=None,
+        streaming: bool = False,
+        frame_duration: float = 0.03,
+        slot_count: int = 4,
+        max_receivers: int = 4,
+        interim_interval: float = None,
+        barge_in: bool = False,
+        **segmenter_kwargs,
     ):
         """Constructor.
 
         Args:
             duration (int, optional): The length of each recorded data block in
                                         seconds. Defaults to 30.
-            device (int or str, optional): Defaults to sounddevice.default.device[0].
+            device (int or str, optional): Recorded device. Defaults to the default input
+                                        device.
+            streaming (bool, optional): If true the recording is split into utterances by a
+                                        voice activity detector and each utterance is send as
+                                        soon as it is finished. Defaults to False.
+            frame_duration (float, optional): Length of the audio blocks in seconds which are
+                                        analysed in streaming mode. Defaults to 0.03.
+            slot_count (int, optional): Number of audio blocks which can be waiting for
+                                        processing inside the shared memory. Defaults to 4.
+            max_receivers (int, optional): Maximal number of connected modules which read the
+                                        shared memory. If more modules are connected, they
+                                        receive copies of the audio. Defaults to 4.
+            interim_interval (float, optional): If set, the audio of the active utterance is send
+                                        as partial message in this interval in seconds while
+                                        streaming. Defaults to None.
+            barge_in (bool, optional): If true, the learner interrupts the current reply by
+                                        speaking. Once a new utterance contains enough speech,
+                                        the earlier turns are cancelled through the control
+                                        bus, which stops the playback. Requires streaming.
+                                        Defaults to False.
+            segmenter_kwargs: Additional parameter for the `UtteranceSegmenter`.
         """
         self.logger = logging.getLogger(self.__class__.__name__)
 
-        self.device_settings = sd.query_devices(device)
-
-        self.output_queues = manager.list()
+        self.output_queues = as_transport(manager).list()
         if output_queues is not None:
             self.output_queues.extend(output_queues)
 
         self.model_device = model_device
 
+        # Set by the pipeline, used to cancel the earlier turns on barge in
+        self.control_bus = None
+
         self._duration = duration
-        self.sampling_rate = self.device_settings["default_samplerate"]
+        self.sampling_rate = self._query_sampling_rate(device)
         self.buffer = numpy.ndarray(
             int(self._duration * self.sampling_rate), dtype=numpy.float32
         )
         self._buffered_amount = 0
         self._block_size = int(1 * self.sampling_rate)
 
+        # Recorded audio is passed to the following modules through shared memory
+        self._ring = SharedAudioRing(
+            slot_count, len(self.buffer), max_readers=max_receivers
+        )
+
+        self.streaming = streaming
+        self._segmenter = None
+        if self.streaming:
+            self._block_size = int(frame_duration * self.sampling_rate)
+
+            if interim_interval is not None:
+                segmenter_kwargs["on_partial"] = self._send_partial
+                segmenter_kwargs["partial_interval"] = interim_interval
+
+            if barge_in:
+                segmenter_kwargs["on_start"] = self._barge_in
+
+            self._segmenter = UtteranceSegmenter(
+                self.sampling_rate,
+                self._send_utterance,
+                frame_duration=frame_duration,
+                max_duration=self._duration,
+                **segmenter_kwargs,
+            )
+
+        # Utterances are identified by this id together with their index
+        self._stream_id = uuid.uuid4().hex
+        self._sequence = 0
+
         self.logger.debug("Created Audio Stream with device %s", str(device))
         self.device = device
         self._audio_input_stream = None
 
+    def _query_sampling_rate(self, device) -> float:
+        """Return the default sampling rate of the recorded device."""
+        # pylint: disable=import-outside-toplevel
+        import sounddevice as sd
+
+        self.device_settings = sd.query_devices(device, "input")
+        return self.device_settings["default_samplerate"]
+
     # pylint: disable=unused-argument
     def _audio_callback(self, indata, frames, time, status):
         """Callback function for an audio InputStream."""
-        # self.audio_buffer[:] = indata[:, 0]
+        if self.streaming:
+            self._segmenter.process(indata[:, 0])
+            return
 
         if self._buffered_amount < self._duration * self.sampling_rate:
             self.logger.debug("Extended dataset with length: %i ", int(len(indata)))
         else:
-            self.logger.debug("Send dataset with length: %i ", int(len(self.buffer)))
-
-            shared_mem = torch.tensor(
-                self.buffer, dtype=torch.float16
-            )  # .to(self.model_device)
-
-            for queue in self.output_queues:
-                queue.put(shared_mem)
+            self._send_buffer(self.buffer)
 
             self._buffered_amount = 0
 
@@ -80,17 +144,94 @@ class SoundDeviceRecorderModule:
         self._audio_input_stream.stop()
         self._audio_input_stream = None
 
-        shared_mem = torch.tensor(
-            self.buffer[: self._buffered_amount], dtype=torch.float16
-        )
+        if self.streaming:
+            self._segmenter.flush()
+        else:
+            self._send_buffer(self.buffer[: self._buffered_amount])
+
+        self._buffered_amount = 0
+
+    def _send_utterance(self, buffer: numpy.ndarray) -> None:
+        """Send a finished utterance as final message of its stream."""
+        self._send_buffer(buffer, **self._stream_data(final=True))
+        self._sequence = 0
+
+    def _send_partial(self, buffer: numpy.ndarray) -> None:
+        """Send the audio of the active utterance as partial message."""
+        self._send_buffer(buffer, **self._stream_data(final=False))
+
+    def _barge_in(self) -> None:
+        """Cancel the turns which were started before the current utterance."""
+        if self.control_bus is None:
+            return
+
+        turn_id = self._turn_id()
+        self.logger.info(f"Barge in of turn {turn_id}")
+        self.control_bus.cancel(turn_id=turn_id, before=time.time())
+
+    def _turn_id(self) -> str:
+        return f"{self._stream_id}-{self._segmenter.utterance_index}"
+
+    def _stream_data(self, final: bool) -> dict:
+        stream_data = {
+            "message_id": self._turn_id(),
+            # Copied into the messages of the following modules, unlike the message id
+            "turn_id": self._turn_id(),
+            "sequence": self._sequence,
+            "partial": not final,
+            "final": final,
+        }
+        self._sequence += 1
+        return stream_data
+
+    def _send_buffer(self, buffer: numpy.ndarray, **kwargs) -> None:
+        """Send the given audio data to the following modules. The kwargs are added to
+        the send dict."""
+        self.logger.debug("Send dataset with length: %i ", int(len(buffer)))
+
+        # Each module releases the slot with its own descriptor
+        queues = list(self.output_queues)
+        shared = len(queues) <= self._ring.max_readers
+        slot = None
+        if shared:
+            slot = self._ring.write(buffer, self.sampling_rate, max(len(queues), 1))
 
         output = dict()
-        output["data"] = shared_mem
+        if slot is not None:
+            output["data"] = slot
+        elif not shared:
+            self.logger.debug(
+                f"{len(queues)} modules read the audio, but only {self._ring.max_readers} "
+                "can share the memory, sending a copy instead"
+            )
+            output["data"] = numpy.array(buffer, dtype=numpy.float32)
+        elif kwargs.get("partial", False):
+            # Partial data is only a preview, so it can be skipped if the receiver is busy
+            self.logger.debug("Shared audio buffer is full, skipped partial data")
+            return
+        else:
+            # All slots are still in use, fall back to sending a copy of the data
+            self.logger.warning("Shared audio buffer is full, sending a copy instead")
+            output["data"] = numpy.array(buffer, dtype=numpy.float32)
 
-        for queue in self.output_queues:
-            queue.put(output)
+        output.update(kwargs)
+        # Start of the latency measurement of the pipeline
+        output["sent_time"] = time.time()
 
-        self._buffered_amount = 0
+        # The audio callback must not block, so bounded queues which are full are skipped
+        for reader, queue in enumerate(queues):
+            if slot is not None:
+                output = {**output, "data": slot.for_reader(reader)}
+
+            try:
+                queue.put_nowait(output)
+            except Full:
+                self.logger.warning("Input queue of a module is full, dropped audio")
+                if slot is not None:
+                    output["data"].release()
+
+        if len(queues) == 0 and slot is not None:
+            slot.release()
 
     def start(self) -> None:
         """Start the audio recording."""
@@ -100,15 +241,26 @@ class SoundDeviceRecorderModule:
 
         self.logger.info("Started audio recording")
 
+        # pylint: disable=import-outside-toplevel
+        import sounddevice as sd
+
         self._audio_input_stream = sd.InputStream(
             callback=self._audio_callback,
             device=self.device,
             channels=1,
-            blocksize=int(1 * self.sampling_rate),
+            blocksize=self._block_size,
             samplerate=self.sampling_rate,
         )
         self._audio_input_stream.start()
 
+    def close(self) -> None:
+        """Stop the recording and free the shared memory."""
+        if self.is_active():
+            self._audio_input_stream.stop()
+            self._audio_input_stream = None
+
+        self._ring.close()
+
     def is_active(self) -> bool:
         """Is the audio currently being recorded."""
         if self._audio_input_stream is not None:
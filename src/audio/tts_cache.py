@@ -0,0 +1,153 @@
+"""Module containing the on disk cache for synthesized speech."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy
+
+
+class TTSCache:
+    """Content addressed cache which stores synthesized audio as numpy files.
+
+    The files are loaded as memory maps. The total size of the cache is limited, if it is
+    exceeded the least recently used entries are removed. The methods are thread safe.
+    """
+
+    DEFAULT_DIRECTORY = os.path.join(
+        os.path.expanduser("~"), ".cache", "ai_language_learning_assistant", "tts"
+    )
+
+    def __init__(self, directory: str = None, max_bytes: int = 512 * 2**20):
+        """Constructor.
+
+        Args:
+            directory (str, optional): Directory of the cache files. Defaults to DEFAULT_DIRECTORY.
+            max_bytes (int, optional): Maximal size of all cache files. Defaults to 512 MiB.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.directory = directory if directory is not None else self.DEFAULT_DIRECTORY
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        # Maps the key to the file size. The order is the order of the last access.
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key(
+        engine: str,
+        model: str = None,
+        voice: str = None,
+        language: str = None,
+        speed: float = None,
+        text: str = "",
+    ) -> str:
+        """Return the cache key of the given synthesis parameter."""
+        parameter = json.dumps(
+            [engine, model, voice, language, speed, text], ensure_ascii=False
+        )
+        return hashlib.sha256(parameter.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> tuple | None:
+        """Return the cached audio data as memory map and its sampling rate, or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+
+            path = self._path(key)
+            try:
+                data = numpy.load(path, mmap_mode="r")
+                # Update the access time, which is used to restore the order after a restart
+                os.utime(path)
+            except (OSError, ValueError):
+                # The file was removed or is broken, e.g. by another process using the cache
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return data["audio"], int(data["sampling_rate"][0])
+
+    def put(self, key: str, audio: numpy.ndarray, sampling_rate: int) -> None:
+        """Store the float32 audio data and its sampling rate."""
+        data = numpy.zeros(
+            (),
+            dtype=[
+                ("sampling_rate", numpy.int32, (1,)),
+                ("audio", numpy.float32, (len(audio),)),
+            ],
+        )
+        data["sampling_rate"] = sampling_rate
+        data["audio"] = audio
+
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            numpy.save(file, data)
+        os.replace(temporary_path, path)
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries[key]
+            self._entries[key] = os.path.getsize(path)
+            self._entries.move_to_end(key)
+            self._size += self._entries[key]
+
+            self._evict()
+
+    def stats(self) -> dict:
+        """Return the hit and miss counter as well as the size of the cache."""
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests > 0 else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._size,
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _load_index(self) -> None:
+        """Restore the entries of a previous session ordered by their last access."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[: -len(".npy")], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._entries) > 0:
+            key = next(iter(self._entries))
+            self.logger.debug(f"Evict {key} from the cache")
+            self._remove(key)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _remove(self, key: str) -> None:
+        self._size -= self._entries.pop(key, 0)
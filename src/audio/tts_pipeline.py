@@ -0,0 +1,673 @@
+"""Module containing the incremental text to speech pipeline which is shared by the TTS modules.
+
+The incoming text is split into sentences. The sentences are synthesized one after another
+in a background thread and written to an audio sink, so that the next sentence is
+synthesized while the current one is played. Each session has its own pipeline, the audio
+of the local session is played on the output device, the audio of the other sessions is
+sent to the connected modules.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from abc import abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy
+
+from audio.resampling import resample
+from audio.tts_cache import TTSCache
+from core.processing import AbstractActionProcess
+from core.workers import SESSION_KEY
+
+# End of a sentence followed by optional closing quotes or brackets and whitespace.
+# Sentences ending with full width punctuation do not require trailing whitespace.
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+|(?<=[。！？])|\n+")
+
+
+class SentenceSplitter:
+    """Splits a stream of text pieces into complete sentences."""
+
+    def __init__(self, min_length: int = 1):
+        """Constructor.
+
+        Args:
+            min_length (int, optional): Shorter sentences are merged with the following one.
+                                        Defaults to 1.
+        """
+        self.min_length = min_length
+        self._buffer = ""
+
+    def feed(self, text: str) -> list:
+        """Add text to the splitter and return the sentences which are complete."""
+        self._buffer += text
+
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            sentence = self._buffer[start : match.end()].strip()
+            if len(sentence) >= self.min_length and match.end() < len(self._buffer):
+                sentences.append(sentence)
+                start = match.end()
+
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> str | None:
+        """Return the remaining text, which is not terminated by a sentence end."""
+        sentence = self._buffer.strip()
+        self._buffer = ""
+        return sentence if sentence else None
+
+
+class AudioSink:
+    """Interface of the output for the synthesized audio."""
+
+    sampling_rate: int = 24000
+
+    def start(self) -> None:
+        """Prepare the sink for playback."""
+
+    @abstractmethod
+    def write(self, audio: numpy.ndarray) -> None:
+        """Queue the float32 audio data for playback. This should not block until the audio
+        was played."""
+
+    def is_idle(self) -> bool:
+        """Return true if all queued audio was played."""
+        return True
+
+    def wait(self, timeout: float = None) -> bool:
+        """Wait until all queued audio was played.
+
+        Returns:
+            bool: False if the timeout was reached.
+        """
+        end_time = None if timeout is None else time.time() + timeout
+        while not self.is_idle():
+            if end_time is not None and time.time() > end_time:
+                return False
+            time.sleep(0.01)
+
+        return True
+
+    def clear(self) -> None:
+        """Drop the queued audio and stop the current playback as soon as possible."""
+
+    def close(self) -> None:
+        """Stop the playback and free all resources."""
+
+
+class NullSink(AudioSink):
+    """Sink which drops the audio. It is intended for tests and benchmarks."""
+
+    def __init__(self, sampling_rate: int = 24000, realtime: bool = False):
+        """Constructor.
+
+        Args:
+            sampling_rate (int, optional): Sampling rate of the sink. Defaults to 24000.
+            realtime (bool, optional): Simulate the playback duration of the audio, so that
+                                       the sink is busy as long as a real device would be.
+                                       Defaults to False.
+        """
+        self.sampling_rate = sampling_rate
+        self.realtime = realtime
+
+        # Time at which each block was written, its duration and the total written audio
+        self.write_times = []
+        self.played_duration = 0.0
+
+        self._busy_until = 0.0
+
+    def write(self, audio: numpy.ndarray) -> None:
+        now = time.time()
+        duration = len(audio) / self.sampling_rate
+
+        self.write_times.append(now)
+        self.played_duration += duration
+
+        if self.realtime:
+            self._busy_until = max(self._busy_until, now) + duration
+
+    def is_idle(self) -> bool:
+        return time.time() >= self._busy_until
+
+    def clear(self) -> None:
+        self._busy_until = min(self._busy_until, time.time())
+
+
+class SoundDeviceSink(AudioSink):
+    """Sink which plays the audio through one persistent sounddevice output stream."""
+
+    def __init__(self, device=None, block_duration: float = 0.02):
+        """Constructor.
+
+        Args:
+            device (int or str, optional): Output device. Defaults to the default device.
+            block_duration (float, optional): Length of the blocks requested by the audio
+                                              stream in seconds. Defaults to 0.02.
+        """
+        # pylint: disable=import-outside-toplevel
+        import sounddevice as sd
+
+        self._sd = sd
+        self.device = device
+        self.sampling_rate = int(sd.query_devices(device, "output")["default_samplerate"])
+        self._block_size = int(block_duration * self.sampling_rate)
+
+        self._queue = queue.Queue()
+        self._current = None
+        self._position = 0
+        self._stream = None
+
+        # The queued audio is dropped by the callback, which owns the current audio
+        self._clear_requested = False
+
+    def start(self) -> None:
+        self._stream = self._sd.OutputStream(
+            samplerate=self.sampling_rate,
+            blocksize=self._block_size,
+            device=self.device,
+            channels=1,
+            dtype="float32",
+            callback=self._callback,
+        )
+        self._stream.start()
+
+    # pylint: disable=unused-argument
+    def _callback(self, outdata, frames, time_info, status) -> None:
+        """Callback function for the audio OutputStream."""
+        if self._clear_requested:
+            self._clear_requested = False
+            self._current = None
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+        filled = 0
+        while filled < frames:
+            if self._current is None:
+                try:
+                    self._current = self._queue.get_nowait()
+                    self._position = 0
+                except queue.Empty:
+                    break
+
+            amount = min(frames - filled, len(self._current) - self._position)
+            outdata[filled : filled + amount, 0] = self._current[
+                self._position : self._position + amount
+            ]
+            filled += amount
+            self._position += amount
+
+            if self._position >= len(self._current):
+                self._current = None
+
+        # Play silence if no audio is available
+        outdata[filled:, 0] = 0
+
+    def write(self, audio: numpy.ndarray) -> None:
+        self._queue.put(numpy.asarray(audio, dtype=numpy.float32))
+
+    def is_idle(self) -> bool:
+        return self._current is None and self._queue.empty()
+
+    def clear(self) -> None:
+        # Takes effect with the next block, i.e. within the block duration
+        self._clear_requested = True
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class MessageSink(AudioSink):
+    """Sink which passes the audio to a function instead of playing it, e.g. to send it to
+    the browser of a remote session."""
+
+    def __init__(
+        self, send: Callable[[numpy.ndarray, int], None], sampling_rate: int = 24000
+    ):
+        """Constructor.
+
+        Args:
+            send (Callable[[numpy.ndarray, int], None]): Called with the float32 audio data
+                                                        and its sampling rate.
+            sampling_rate (int, optional): Sampling rate of the sink. Defaults to 24000.
+        """
+        self.send = send
+        self.sampling_rate = sampling_rate
+
+    def write(self, audio: numpy.ndarray) -> None:
+        self.send(audio, self.sampling_rate)
+
+
+class IncrementalTTSPipeline:
+    """Synthesizes queued sentences in a background thread and writes the audio to a sink.
+
+    With a prefetch larger than one, the following sentences are synthesized concurrently
+    while the current one is synthesized or played. Their audio is written in order.
+    """
+
+    def __init__(
+        self,
+        synthesize: Callable[[str, str], tuple],
+        sink: AudioSink,
+        on_written: Callable[[float, float], None] = None,
+        on_dropped: Callable[[str], None] = None,
+        prefetch: int = 1,
+    ):
+        """Constructor.
+
+        Args:
+            synthesize (Callable[[str, str], tuple]): Function which converts a sentence and
+                    its language into a tuple of float32 audio data and its sampling rate.
+            sink (AudioSink): The output of the synthesized audio.
+            on_written (Callable[[float, float], None], optional): Called with the submit
+                    time and origin time of a sentence after its audio was written.
+            on_dropped (Callable[[str], None], optional): Called with a sentence which was
+                    not synthesized because its deadline passed.
+            prefetch (int, optional): Maximal number of sentences which are synthesized
+                    concurrently. Defaults to 1.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.synthesize = synthesize
+        self.sink = sink
+        self.on_written = on_written
+        self.on_dropped = on_dropped
+        self.prefetch = prefetch
+
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(prefetch) if prefetch > 1 else None
+
+        # Sentences whose origin time is before this time are skipped
+        self._cancel_before = 0.0
+
+        # Origin time of the reply whose start was skipped because its deadline passed
+        self._stale_origin = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        """Start the playback and synthesis."""
+        self.sink.start()
+        self._thread.start()
+
+    def submit(
+        self,
+        sentence: str,
+        language: str = None,
+        origin_time: float = None,
+        deadline: float = None,
+    ) -> None:
+        """Queue a sentence for synthesis.
+
+        Args:
+            sentence (str): The text of the sentence.
+            language (str, optional): Language of the sentence.
+            origin_time (float, optional): Time at which the pipeline received the input
+                    which lead to this sentence. It is passed to `on_written`.
+            deadline (float, optional): The sentence is skipped if its synthesis did not
+                    start before this time. The following sentences with the same origin
+                    time are skipped as well, so that a reply is not played from its middle.
+        """
+        self._queue.put((sentence, language, time.time(), origin_time, deadline))
+
+    def cancel(self, before: float) -> None:
+        """Stop the playback and skip the queued sentences whose origin time is before the
+        given time. Sentences without origin time are not skipped. It can be called from any
+        thread."""
+        self._cancel_before = max(self._cancel_before, before)
+        self.sink.clear()
+
+    def is_idle(self) -> bool:
+        """Return true if all sentences were synthesized and played."""
+        return self._queue.unfinished_tasks == 0 and self.sink.is_idle()
+
+    def stop(self, timeout: float = None) -> None:
+        """Synthesize the remaining sentences and stop the pipeline."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self.sink.close()
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _run(self) -> None:
+        # Sentences whose synthesis was started, with the future of their audio
+        pending = deque()
+        stopping = False
+
+        while not stopping or pending:
+            # Only wait for new sentences if there is nothing to write
+            while not stopping and len(pending) < self.prefetch:
+                try:
+                    item = self._queue.get(block=len(pending) == 0)
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    stopping = True
+                    self._queue.task_done()
+                elif self._is_cancelled(item) or self._is_stale(item):
+                    self._queue.task_done()
+                else:
+                    pending.append((item, self._start(item)))
+
+            if pending:
+                self._write(*pending.popleft())
+
+    def _is_stale(self, item: tuple) -> bool:
+        """Return true and report the sentence if its deadline passed, e.g. because the
+        playback fell behind."""
+        origin_time, deadline = item[3], item[4]
+        if origin_time is None or origin_time != self._stale_origin:
+            if deadline is None or time.time() <= deadline:
+                return False
+            self._stale_origin = origin_time
+
+        if self.on_dropped is not None:
+            self.on_dropped(item[0])
+        return True
+
+    def _is_cancelled(self, item: tuple) -> bool:
+        origin_time = item[3]
+        return origin_time is not None and origin_time < self._cancel_before
+
+    def _start(self, item: tuple):
+        """Start the synthesis of the sentence if sentences are prefetched."""
+        if self._executor is None:
+            return None
+
+        return self._executor.submit(self.synthesize, item[0], item[1])
+
+    def _write(self, item: tuple, future=None) -> None:
+        """Wait for the audio of the sentence and write it to the sink."""
+        sentence, language, submit_time, origin_time, _ = item
+        try:
+            if self._is_cancelled(item):
+                if future is not None:
+                    future.cancel()
+                return
+
+            if future is not None:
+                audio, sampling_rate = future.result()
+            else:
+                audio, sampling_rate = self.synthesize(sentence, language)
+            audio = self._resample(audio, sampling_rate)
+
+            self.logger.debug(
+                f"Synthesized {len(audio) / self.sink.sampling_rate:.2f}s audio "
+                f"{time.time() - submit_time:.3f}s after submit"
+            )
+
+            # The sentence may have been cancelled during the synthesis
+            if self._is_cancelled(item):
+                return
+
+            self.sink.write(audio)
+
+            if self.on_written is not None:
+                self.on_written(submit_time, origin_time)
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.logger.exception("Failed to synthesize sentence")
+        finally:
+            self._queue.task_done()
+
+    def _resample(self, audio: numpy.ndarray, sampling_rate: int) -> numpy.ndarray:
+        """Resample the audio to the sampling rate of the sink."""
+        return resample(audio, sampling_rate, self.sink.sampling_rate)
+
+
+class AbstractTTSModule(AbstractActionProcess):
+    """Base class of the TTS modules. The received text is split into sentences, which are
+    played while the following sentences are synthesized.
+
+    Partial messages of a stream are accepted, so that the first sentence can be played
+    before the complete text was generated. The deadline of a message only applies to the
+    start of the reply, a reply whose first sentence was played is played completely.
+
+    The messages without session id belong to the local learner, whose audio is played by
+    the sink of `create_sink`. The audio of the other sessions is sent as 16 bit PCM data to
+    the connected modules, e.g. the GUI which plays it in the browser of the session.
+    """
+
+    accepts_partial = True
+
+    def __init__(
+        self,
+        manager,
+        *args,
+        output_queues=(),
+        cache_directory: str = None,
+        cache_max_bytes: int = 512 * 2**20,
+        use_cache: bool = True,
+        prefetch: int = 1,
+        max_sessions: int = 32,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            cache_directory (str, optional): Directory of the synthesized audio cache.
+                                Defaults to the TTS_CACHE_DIRECTORY environment variable
+                                or TTSCache.DEFAULT_DIRECTORY.
+            cache_max_bytes (int, optional): Maximal size of the cache. Defaults to 512 MiB.
+            use_cache (bool, optional): Cache the synthesized audio. Defaults to True.
+            prefetch (int, optional): Maximal number of sentences which are synthesized
+                                concurrently. Defaults to 1.
+            max_sessions (int, optional): Number of sessions above which the pipelines of
+                                idle sessions are stopped. Defaults to 32.
+        """
+        self.sink = None
+        self.prefetch = prefetch
+        self.max_sessions = max_sessions
+
+        # Pipeline of each session, the local session has the id None
+        self.pipelines = dict()
+
+        self.cache = None
+        self.use_cache = use_cache
+        self.cache_directory = cache_directory
+        self.cache_max_bytes = cache_max_bytes
+
+        # Sentence splitter for each active stream
+        self._splitters = dict()
+
+        # Streams whose first sentence was submitted
+        self._started_streams = set()
+
+        super().__init__(manager, "tts", *args, output_queues=output_queues, **kwargs)
+
+    @abstractmethod
+    def synthesize(self, text: str, language: str = None) -> tuple:
+        """Convert the text to speech.
+
+        Returns:
+            tuple: The float32 audio data in the range of -1 to 1 and its sampling rate.
+        """
+
+    def cache_parameters(self, language: str = None) -> dict:
+        """Return the parameter which influence the synthesized audio besides the text.
+        They are used as part of the cache key.
+
+        Returns:
+            dict: Values for the model, voice, language and speed arguments of `TTSCache.key`.
+        """
+        return {"language": language}
+
+    def create_sink(self) -> AudioSink:
+        """Create the sink used for the playback of the local session."""
+        return SoundDeviceSink()
+
+    def create_session_sink(self, session_id) -> AudioSink:
+        """Create the sink of a remote session, which sends the audio to the connected
+        modules."""
+        return MessageSink(functools.partial(self._send_audio, session_id))
+
+    def warm_up(self):
+        if self.use_cache:
+            self.cache = TTSCache(
+                self.cache_directory or os.environ.get("TTS_CACHE_DIRECTORY", None),
+                self.cache_max_bytes,
+            )
+
+        self.sink = self.create_sink()
+        self.pipelines[None] = self._start_pipeline(self.sink, None)
+
+    def _start_pipeline(self, sink: AudioSink, session_id) -> IncrementalTTSPipeline:
+        pipeline = IncrementalTTSPipeline(
+            self._synthesize_cached,
+            sink,
+            on_written=functools.partial(self._record_written, session_id=session_id),
+            on_dropped=self._record_dropped,
+            prefetch=self.prefetch,
+        )
+        pipeline.start()
+
+        return pipeline
+
+    def _pipeline(self, session_id) -> IncrementalTTSPipeline:
+        """Return the pipeline of a session and start it for a new session."""
+        pipeline = self.pipelines.get(session_id, None)
+        if pipeline is not None:
+            return pipeline
+
+        if len(self.pipelines) > self.max_sessions:
+            self._stop_idle_pipelines()
+
+        self.logger.info(f"Start the pipeline of session {session_id}")
+        pipeline = self._start_pipeline(self.create_session_sink(session_id), session_id)
+        self.pipelines[session_id] = pipeline
+
+        return pipeline
+
+    def _stop_idle_pipelines(self) -> None:
+        for session_id, pipeline in list(self.pipelines.items()):
+            if session_id is not None and pipeline.is_idle():
+                del self.pipelines[session_id]
+                pipeline.stop()
+
+    def process(self, data_in):
+        language = data_in.get("language", None)
+        message_id = data_in.get("message_id", None)
+
+        if message_id is None:
+            sentences = self._split(data_in["data"])
+        elif self.is_partial(data_in):
+            splitter = self._splitters.setdefault(message_id, SentenceSplitter())
+            sentences = splitter.feed(data_in["data"])
+        elif message_id in self._splitters:
+            # The final message contains the complete text, but only the remaining part
+            # was not played yet
+            remaining = self._splitters.pop(message_id).flush()
+            sentences = [remaining] if remaining is not None else []
+        else:
+            sentences = self._split(data_in["data"])
+
+        # Only the first sentence of a reply has to be started before the deadline
+        origin_time = self.trace_start(data_in)
+        deadline = data_in.get("deadline", None)
+        if message_id in self._started_streams:
+            deadline = None
+
+        pipeline = self._pipeline(data_in.get(SESSION_KEY, None))
+        for sentence in sentences:
+            pipeline.submit(sentence, language, origin_time, deadline)
+            deadline = None
+
+        if message_id is not None:
+            if not self.is_partial(data_in):
+                self._started_streams.discard(message_id)
+            elif sentences:
+                self._started_streams.add(message_id)
+
+        return None
+
+    def _is_stale(self, in_data: dict) -> bool:
+        # The following messages of a stream which was accepted are not dropped, otherwise
+        # the reply would be cut off
+        if in_data.get("message_id", None) in self._splitters:
+            return False
+
+        return super()._is_stale(in_data)
+
+    def on_cancel(self, session_id, before):
+        pipeline = self.pipelines.get(session_id, None)
+        if pipeline is not None:
+            pipeline.cancel(before)
+
+    def on_superseded(self, data_in):
+        # The stream of a cancelled turn does not receive further messages
+        message_id = data_in.get("message_id", None)
+        if message_id is not None:
+            self._splitters.pop(message_id, None)
+            self._started_streams.discard(message_id)
+
+    def _record_written(
+        self, submit_time: float, origin_time: float = None, session_id=None
+    ) -> None:
+        """Record the synthesis time and the latency from the input of the pipeline until
+        the audio is queued for playback."""
+        now = time.time()
+        self.metrics.observe("synthesis_seconds", now - submit_time)
+        if origin_time is not None:
+            self.metrics.observe("origin_to_audio_seconds", now - origin_time)
+
+    def _send_audio(self, session_id, audio: numpy.ndarray, sampling_rate: int) -> None:
+        """Send the audio of a remote session to the connected modules."""
+        pcm = (numpy.clip(audio, -1.0, 1.0) * (2**15 - 1)).astype(numpy.int16)
+        self.send_output(
+            self.create_output_data(
+                pcm, session_id=session_id, sampling_rate=sampling_rate
+            )
+        )
+
+    def _record_dropped(self, sentence: str) -> None:
+        self.logger.debug(f"Skipped stale sentence: {sentence}")
+        self.metrics.increment("dropped_stale_sentences_total")
+
+    def _synthesize_cached(self, text: str, language: str = None) -> tuple:
+        """Return the audio from the cache or synthesize and store it."""
+        if self.cache is None:
+            return self.synthesize(text, language)
+
+        key = TTSCache.key(
+            self.__class__.__name__, text=text, **self.cache_parameters(language)
+        )
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.logger.debug(f"Cache hit, statistic: {self.cache.stats()}")
+            return cached
+
+        audio, sampling_rate = self.synthesize(text, language)
+        self.cache.put(key, numpy.asarray(audio, dtype=numpy.float32), sampling_rate)
+
+        return audio, sampling_rate
+
+    @staticmethod
+    def _split(text: str) -> list:
+        splitter = SentenceSplitter()
+        sentences = splitter.feed(text)
+        remaining = splitter.flush()
+        if remaining is not None:
+            sentences.append(remaining)
+
+        return sentences
+
+    def clean_up(self):
+        for pipeline in self.pipelines.values():
+            pipeline.stop()
+
+        if self.cache is not None:
+            self.logger.info(f"TTS cache statistic: {self.cache.stats()}")
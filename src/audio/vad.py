@@ -0,0 +1,316 @@
+"""Module containing the voice activity detection used to split a continuous audio stream
+into utterances."""
+
+from __future__ import annotations
+
+import math
+from typing import Callable
+
+import numpy
+
+
+class EnergyVoiceActivityDetector:
+    """Simple energy based voice activity detector with an adaptive noise floor.
+
+    A frame is classified as speech if its level is above the estimated noise floor by at
+    least `margin_db` and above the absolute threshold `min_level_db`. The noise floor follows
+    the non speech frames quickly and the speech frames slowly, so that it also reaches a
+    background noise which is classified as speech at the start.
+    """
+
+    def __init__(
+        self,
+        margin_db: float = 12.0,
+        min_level_db: float = -50.0,
+        noise_adaption: float = 0.05,
+        speech_adaption: float = 0.003,
+        initial_noise_floor_db: float = -60.0,
+    ):
+        """Constructor.
+
+        Args:
+            margin_db (float, optional): Required distance to the noise floor. Defaults to 12.
+            min_level_db (float, optional): Absolute level below which a frame is never
+                                            considered speech. Defaults to -50.
+            noise_adaption (float, optional): Smoothing factor used to track the noise floor
+                                            on non speech frames. Defaults to 0.05.
+            speech_adaption (float, optional): Smoothing factor used to track the noise
+                                            floor on speech frames. Defaults to 0.003.
+            initial_noise_floor_db (float, optional): Start value of the noise floor. Defaults to -60.
+        """
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+        self.noise_adaption = noise_adaption
+        self.speech_adaption = speech_adaption
+        self.initial_noise_floor_db = initial_noise_floor_db
+        self.noise_floor_db = initial_noise_floor_db
+
+    def reset(self) -> None:
+        """Reset the noise floor estimation."""
+        self.noise_floor_db = self.initial_noise_floor_db
+
+    def is_speech(self, frame: numpy.ndarray) -> bool:
+        """Classify a single frame of float audio data in the range of -1 to 1."""
+        # The dot product avoids allocating a temporary array for the squared values
+        energy = float(numpy.dot(frame, frame)) / max(len(frame), 1)
+        level_db = 10 * math.log10(energy + 1e-12)
+
+        speech = (
+            level_db > self.noise_floor_db + self.margin_db
+            and level_db > self.min_level_db
+        )
+
+        adaption = self.speech_adaption if speech else self.noise_adaption
+        self.noise_floor_db += adaption * (level_db - self.noise_floor_db)
+
+        return speech
+
+
+class UtteranceSegmenter:
+    """Splits a continuous stream of audio blocks into utterances.
+
+    The audio is stored inside a preallocated ring buffer. A finished utterance is passed to
+    `on_utterance` as soon as enough trailing silence has been detected, or when the
+    utterance reaches the maximal duration. If `on_partial` is set, the audio of the active
+    utterance is passed to it in regular intervals while the user is still speaking.
+    """
+
+    def __init__(
+        self,
+        sampling_rate: float,
+        on_utterance: Callable[[numpy.ndarray], None],
+        vad: EnergyVoiceActivityDetector = None,
+        frame_duration: float = 0.03,
+        max_duration: float = 30,
+        trailing_silence: float = 0.6,
+        min_speech_duration: float = 0.25,
+        pre_roll: float = 0.3,
+        on_partial: Callable[[numpy.ndarray], None] = None,
+        partial_interval: float = 0.5,
+        on_start: Callable[[], None] = None,
+    ):
+        """Constructor.
+
+        Args:
+            sampling_rate (float): Sampling rate of the incoming audio.
+            on_utterance (Callable[[numpy.ndarray], None]): Called with each finished utterance.
+                                            The array is only valid during the call.
+            vad (EnergyVoiceActivityDetector, optional): Detector used to classify the frames.
+            frame_duration (float, optional): Length of the analysed frames in seconds. Defaults to 0.03.
+            max_duration (float, optional): Maximal length of one utterance in seconds. Defaults to 30.
+            trailing_silence (float, optional): Silence in seconds which ends an utterance. Defaults to 0.6.
+            min_speech_duration (float, optional): Utterances with less speech are dropped. Defaults to 0.25.
+            pre_roll (float, optional): Audio in seconds kept before the speech onset. Defaults to 0.3.
+            on_partial (Callable[[numpy.ndarray], None], optional): Called with the audio of the
+                                            active utterance. The array is only valid during the call.
+            partial_interval (float, optional): Interval in seconds between the calls of
+                                            on_partial. Defaults to 0.5.
+            on_start (Callable[[], None], optional): Called once per utterance as soon as it
+                                            contains enough speech, i.e. long before it is
+                                            finished.
+        """
+        self.sampling_rate = sampling_rate
+        self.on_utterance = on_utterance
+        self.on_partial = on_partial
+        self.on_start = on_start
+        self.vad = vad if vad is not None else EnergyVoiceActivityDetector()
+
+        self._frame_length = max(int(frame_duration * sampling_rate), 1)
+        self._max_length = int(max_duration * sampling_rate)
+        self._trailing_frames = max(int(trailing_silence / frame_duration), 1)
+        self._min_speech_frames = max(int(min_speech_duration / frame_duration), 1)
+        self._pre_roll_length = int(pre_roll * sampling_rate)
+        self._partial_length = int(partial_interval * sampling_rate)
+
+        self._ring = numpy.zeros(
+            self._max_length + self._pre_roll_length + self._frame_length,
+            dtype=numpy.float32,
+        )
+        self._output = numpy.zeros(self._max_length, dtype=numpy.float32)
+
+        self._frame = numpy.zeros(self._frame_length, dtype=numpy.float32)
+        self._frame_fill = 0
+
+        # Absolute sample positions inside the stream
+        self._written = 0
+        self._utterance_start = None
+        self._speech_frames = 0
+        self._silent_frames = 0
+        self._last_partial = 0
+
+        # Stream position in samples at which the last emitted utterance ended
+        self.last_utterance_end = 0
+
+        # Number of the current utterance, it is increased after each utterance
+        self.utterance_index = 0
+
+    def reset(self) -> None:
+        """Drop all buffered audio."""
+        self._frame_fill = 0
+        self._written = 0
+        self._utterance_start = None
+        self._speech_frames = 0
+        self._silent_frames = 0
+        self.last_utterance_end = 0
+        self._last_partial = 0
+        self.vad.reset()
+
+    def process(self, block: numpy.ndarray) -> None:
+        """Add a block of mono audio data to the segmenter."""
+        offset = 0
+        length = len(block)
+        while offset < length:
+            amount = min(self._frame_length - self._frame_fill, length - offset)
+            self._frame[self._frame_fill : self._frame_fill + amount] = block[
+                offset : offset + amount
+            ]
+            self._frame_fill += amount
+            offset += amount
+
+            if self._frame_fill == self._frame_length:
+                self._process_frame()
+                self._frame_fill = 0
+
+    def flush(self) -> None:
+        """Emit the currently active utterance, e.g. when the recording is stopped."""
+        if self._frame_fill > 0:
+            self._write(self._frame[: self._frame_fill])
+            self._frame_fill = 0
+
+        if (
+            self._utterance_start is not None
+            and self._speech_frames >= self._min_speech_frames
+        ):
+            self._emit(self._written)
+        elif self._utterance_start is not None:
+            self.utterance_index += 1
+
+        self._utterance_start = None
+        self._speech_frames = 0
+        self._silent_frames = 0
+
+    def _process_frame(self) -> None:
+        frame_start = self._written
+        self._write(self._frame)
+
+        speech = self.vad.is_speech(self._frame)
+
+        if self._utterance_start is None:
+            if speech:
+                self._utterance_start = max(
+                    frame_start - self._pre_roll_length,
+                    self._written - len(self._ring),
+                    0,
+                )
+                self._speech_frames = 1
+                self._silent_frames = 0
+                self._last_partial = self._written
+                self._notify_start()
+            return
+
+        if speech:
+            self._speech_frames += 1
+            self._silent_frames = 0
+            self._notify_start()
+        else:
+            self._silent_frames += 1
+
+        if self._silent_frames >= self._trailing_frames:
+            if self._speech_frames >= self._min_speech_frames:
+                self._emit(self._written)
+            else:
+                self.utterance_index += 1
+            self._utterance_start = None
+            self._speech_frames = 0
+            self._silent_frames = 0
+        elif self._written - self._utterance_start >= self._max_length:
+            # Split overlong utterances but keep the current one running
+            self._emit(self._utterance_start + self._max_length)
+            self._utterance_start += self._max_length
+            self._speech_frames = 0 if not speech else 1
+            self._last_partial = self._written
+        elif (
+            self.on_partial is not None
+            and self._written - self._last_partial >= self._partial_length
+            and self._speech_frames >= self._min_speech_frames
+        ):
+            self._last_partial = self._written
+            self.on_partial(self._copy(self._utterance_start, self._written))
+
+    def _notify_start(self) -> None:
+        """Call on_start when the active utterance reaches the minimal speech duration."""
+        if self.on_start is not None and self._speech_frames == self._min_speech_frames:
+            self.on_start()
+
+    def _write(self, data: numpy.ndarray) -> None:
+        capacity = len(self._ring)
+        position = self._written % capacity
+        first = min(len(data), capacity - position)
+        self._ring[position : position + first] = data[:first]
+        self._ring[: len(data) - first] = data[first:]
+        self._written += len(data)
+
+    def _emit(self, end: int) -> None:
+        self.last_utterance_end = end
+        self.on_utterance(self._copy(self._utterance_start, end))
+        self.utterance_index += 1
+
+    def _copy(self, start: int, end: int) -> numpy.ndarray:
+        """Copy the audio between the stream positions into the output buffer."""
+        start = max(start, end - self._max_length)
+        length = end - start
+
+        capacity = len(self._ring)
+        position = start % capacity
+        first = min(length, capacity - position)
+        self._output[:first] = self._ring[position : position + first]
+        self._output[first:length] = self._ring[: length - first]
+
+        return self._output[:length]
+
+
+def read_wav(path: str) -> tuple[numpy.ndarray, int]:
+    """Read a wav file and return the first channel as float32 data and its sampling rate."""
+    # pylint: disable=import-outside-toplevel
+    from scipy.io import wavfile
+
+    sampling_rate, data = wavfile.read(path)
+
+    if data.ndim > 1:
+        data = data[:, 0]
+
+    if data.dtype == numpy.uint8:
+        # 8 bit wav files are unsigned, the silence is 128
+        data = (data.astype(numpy.float32) - 128) / 128
+    elif numpy.issubdtype(data.dtype, numpy.integer):
+        data = data.astype(numpy.float32) / float(numpy.iinfo(data.dtype).max + 1)
+
+    return data.astype(numpy.float32, copy=False), sampling_rate
+
+
+def segment_wav(path: str, block_duration: float = 0.03, **kwargs) -> list:
+    """Split a wav file into utterances the same way as a live recording.
+
+    The file is fed to an `UtteranceSegmenter` in blocks of `block_duration` seconds,
+    which mimics the callbacks of an audio input stream. Additional keyword arguments
+    are passed to the segmenter.
+
+    Returns:
+        list: A list of (start time, end time, audio) tuples for each utterance.
+    """
+    data, sampling_rate = read_wav(path)
+    utterances = []
+
+    def _on_utterance(audio: numpy.ndarray) -> None:
+        end = segmenter.last_utterance_end / sampling_rate
+        start = end - len(audio) / sampling_rate
+        utterances.append((start, end, audio.copy()))
+
+    segmenter = UtteranceSegmenter(sampling_rate, _on_utterance, **kwargs)
+
+    block_length = max(int(block_duration * sampling_rate), 1)
+    for offset in range(0, len(data), block_length):
+        segmenter.process(data[offset : offset + block_length])
+    segmenter.flush()
+
+    return utterances
@@ -0,0 +1,149 @@
+"""Module containing a recorder which plays WAV files in place of a microphone."""
+
+from __future__ import annotations
+
+import threading
+import time
+import wave
+
+import numpy
+
+from audio.sounddevice_recorder import SoundDeviceRecorderModule
+
+
+def read_wav(path: str) -> tuple:
+    """Return the first channel of a 16 bit PCM WAV file as float32 data and its sampling
+    rate."""
+    with wave.open(path, "rb") as file:
+        if file.getsampwidth() != 2:
+            raise ValueError(f"{path} is not a 16 bit PCM WAV file")
+
+        frames = file.readframes(file.getnframes())
+        data = numpy.frombuffer(frames, dtype=numpy.int16)[:: file.getnchannels()]
+
+        return data.astype(numpy.float32) / 2**15, file.getframerate()
+
+
+def write_wav(path: str, data: numpy.ndarray, sampling_rate: int) -> None:
+    """Write float32 data in the range of -1 to 1 as 16 bit PCM WAV file."""
+    with wave.open(path, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(sampling_rate)
+        file.writeframes(
+            (numpy.clip(data, -1.0, 1.0) * (2**15 - 1)).astype(numpy.int16).tobytes()
+        )
+
+
+class _WavStream:
+    """Replaces the sounddevice input stream. It passes the audio blocks of the files to the
+    callback of the recorder from a background thread."""
+
+    def __init__(
+        self, audio: numpy.ndarray, block_size: int, callback, interval: float
+    ):
+        self.audio = audio
+        self.block_size = block_size
+        self.callback = callback
+        self.interval = interval
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def active(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self) -> None:
+        next_time = time.time()
+        for start in range(0, len(self.audio) - self.block_size + 1, self.block_size):
+            if self._stop.is_set():
+                return
+
+            block = self.audio[start : start + self.block_size]
+            self.callback(block[:, None], len(block), None, None)
+
+            # The blocks are passed at the pace of a real device, or faster
+            if self.interval > 0:
+                next_time += self.interval
+                time.sleep(max(next_time - time.time(), 0))
+
+
+class WavFileRecorderModule(SoundDeviceRecorderModule):
+    """Recorder which plays WAV files instead of recording a device. It is intended for
+    benchmarks and tests without a microphone."""
+
+    def __init__(
+        self,
+        manager,
+        paths: list,
+        output_queues=None,
+        speed: float = 1.0,
+        repeat: int = 1,
+        trailing_silence: float = 1.0,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            paths (list): Paths of the 16 bit PCM WAV files, which are played one after
+                          another. All files need the same sampling rate.
+            speed (float, optional): Playback speed relative to real time, 0 plays the files
+                                     as fast as possible. Defaults to 1.
+            repeat (int, optional): Number of times the files are played. Defaults to 1.
+            trailing_silence (float, optional): Silence in seconds added after the files, so
+                                     that the last utterance is finished. Defaults to 1.
+            kwargs: Parameter of the `SoundDeviceRecorderModule`.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+
+        audio = []
+        self._file_sampling_rate = None
+        for path in paths:
+            data, sampling_rate = read_wav(path)
+            if self._file_sampling_rate not in (None, sampling_rate):
+                raise ValueError(f"{path} has a different sampling rate")
+
+            self._file_sampling_rate = sampling_rate
+            audio.append(data)
+
+        audio.append(
+            numpy.zeros(
+                int(trailing_silence * self._file_sampling_rate), dtype=numpy.float32
+            )
+        )
+        self.audio = numpy.concatenate(audio * repeat)
+        self.speed = speed
+
+        kwargs.setdefault("device", None)
+        super().__init__(manager, output_queues=output_queues, **kwargs)
+
+    def _query_sampling_rate(self, device) -> float:
+        return self._file_sampling_rate
+
+    @property
+    def duration(self) -> float:
+        """Duration of the played audio in seconds."""
+        return len(self.audio) / self.sampling_rate
+
+    def start(self) -> None:
+        """Start playing the files."""
+        if self.is_active():
+            return
+
+        self.logger.info("Started playing the WAV files")
+
+        interval = self._block_size / self.sampling_rate / self.speed if self.speed else 0
+        self._audio_input_stream = _WavStream(
+            self.audio, self._block_size, self._audio_callback, interval
+        )
+        self._audio_input_stream.start()
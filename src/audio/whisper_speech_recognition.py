@@ -1,9 +1,12 @@
 """Module for the Speech Recognition using whisper. See https://openai.com/index/whisper/ for more."""
 
+from __future__ import annotations
+
 import time
-import whisper
-import scipy
+import numpy
 
+from audio.resampling import resample
+from audio.shared_audio import AudioSlot
 from core.processing import AbstractActionProcess
 
 
@@ -13,57 +16,254 @@ class WhisperSpeechRecognitionModule(AbstractActionProcess):
     # Duration of one segment. This should be longer than the processing
     SEGMENT_DURATION = 30  # seconds
 
+    # The hypotheses of a stream are kept by the worker which processes the stream
+    serialize_sessions = True
+
+    # Everything the learner said is transcribed, a barge in only interrupts the replies
+    cancellable = False
+
     def __init__(
-        self, manager, input_fs, output_queues=(), target_languages=("en", "de", "ja")
+        self,
+        manager,
+        input_fs,
+        output_queues=(),
+        target_languages=("en", "de", "ja"),
+        model_name="base",
+        batch_size=1,
+        quantize=False,
+        interim_results=False,
+        interim_compute_fraction=0.5,
     ):
+        """Constructor.
+
+        Args:
+            input_fs (float): Sampling rate of the received audio.
+            target_languages (tuple, optional): Transcriptions in other languages are dropped.
+            model_name (str, optional): Name of the whisper model, e.g. "tiny", "base" or
+                                        "small". Defaults to "base".
+            batch_size (int, optional): Maximal number of queued segments which are decoded
+                                        together. Defaults to 1.
+            quantize (bool, optional): Use a dynamic int8 quantized model. This is only
+                                       supported on the CPU. Defaults to False.
+            interim_results (bool, optional): Decode the partial audio of an active
+                                       utterance and send the hypothesis as partial message.
+                                       Defaults to False.
+            interim_compute_fraction (float, optional): Maximal fraction of the time which is
+                                       spent on decoding partial audio. Defaults to 0.5.
+        """
         self._target_fs = 16000
         self.input_fs = input_fs
         self.model = None
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.quantize = quantize
+
+        # Partial audio is only processed if interim results are requested
+        self.accepts_partial = interim_results
+        self.interim_compute_fraction = interim_compute_fraction
+        self._interim_end_time = 0.0
+        self._interim_duration = 0.0
+
+        # Last hypothesis of each active utterance
+        self._hypotheses = dict()
 
         self.target_languages = target_languages
 
         super().__init__(manager, "stt", output_queues=output_queues)
 
-    def run(self, *args, **kwargs):
-        self.model = whisper.load_model("base", self.get_process_device())
+    def warm_up(self):
+        # pylint: disable=import-outside-toplevel
+        import whisper
 
-        super().run(*args, **kwargs)
+        device = self.get_process_device()
+
+        if self.quantize:
+            device = "cpu"
+
+        self.model = whisper.load_model(self.model_name, device)
+
+        if self.quantize:
+            self.model = self._quantize_model(self.model)
+
+    @staticmethod
+    def _quantize_model(model):
+        """Return a copy of the model with dynamic int8 quantized linear layers."""
+        # pylint: disable=import-outside-toplevel
+        import torch
+
+        # Whisper uses a subclass of the linear layer, which is not replaced by the
+        # quantization. On the CPU it behaves like the base class, so it can be swapped.
+        for module in model.modules():
+            if isinstance(module, torch.nn.Linear):
+                module.__class__ = torch.nn.Linear
+
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
 
     def process(self, data_in):
-        self.logger.debug("Started Audio Processing")
+        return self.process_batch([data_in])[0]
 
-        start_time = time.time()
-        data = data_in["data"]
+    def process_batch(self, batch):
+        outputs = [None] * len(batch)
 
-        data.to(self.get_process_device())
+        # Final audio has priority, partial audio is only decoded if there is time left
+        finals = [i for i, data_in in enumerate(batch) if not self.is_partial(data_in)]
+        if len(finals) > 0:
+            results = self._decode([batch[i]["data"] for i in finals])
+            for i, result in zip(finals, results):
+                outputs[i] = self._create_output(result, batch[i])
 
-        # Calculate the duration based on sampling rate and length of data
-        duration = int(len(data) / self.input_fs)
+        for i in self._select_partials(batch):
+            outputs[i] = self._process_partial(batch[i])
 
-        # Resample audio to the correct input sampling rate
-        resampled_audio = scipy.signal.resample(data, duration * self._target_fs)
+        return outputs
 
-        # Trim or pad the data to 30s
-        pad_or_trim_audio = whisper.pad_or_trim(resampled_audio)
+    def _decode(self, segments: list) -> list:
+        """Decode the audio segments in one batch."""
+        # pylint: disable=import-outside-toplevel
+        import torch
+        import whisper
+
+        self.logger.debug(f"Started Audio Processing of {len(segments)} segments")
+
+        start_time = time.time()
 
-        # Calculate the mel spectrogram
-        mel = whisper.log_mel_spectrogram(pad_or_trim_audio).to(self.model.device)
+        # Whisper always processes segments of 30s, batching the segments avoids running
+        # the encoder on the padding of each segment one after another
+        mels = []
+        audio_duration = 0
+        for data in segments:
+            audio = self._resample(data)
+            audio_duration += len(audio) / self._target_fs
 
-        options = whisper.DecodingOptions(fp16=True)
+            # Trim or pad the data to 30s
+            pad_or_trim_audio = whisper.pad_or_trim(audio)
+
+            # Calculate the mel spectrogram
+            mels.append(
+                whisper.log_mel_spectrogram(
+                    pad_or_trim_audio, self.model.dims.n_mels
+                )
+            )
+
+        mel = torch.stack(mels).to(self.model.device)
+
+        options = whisper.DecodingOptions(fp16=self.model.device.type == "cuda")
 
         # Do the actual inteference
-        result = whisper.decode(self.model, mel, options)
+        results = whisper.decode(self.model, mel, options)
         end_time = time.time()
 
-        # Debut time outputs
-        self.logger.debug(
-            f"Detected language {result.language} in {end_time - start_time}"
+        # Debug time outputs
+        processing_time = end_time - start_time
+        self.logger.info(
+            f"Decoded {len(segments)} segments with {audio_duration:.2f}s audio in "
+            f"{processing_time:.2f}s, real time factor "
+            f"{processing_time / max(audio_duration, 1e-6):.3f}"
         )
+
+        return results
+
+    def _select_partials(self, batch: list) -> list:
+        """Return the index of the partial audio which should be decoded. This is only the
+        newest audio of each utterance, and only if the compute budget allows it."""
+        finished = {
+            data_in.get("message_id", None)
+            for data_in in batch
+            if not self.is_partial(data_in)
+        }
+
+        newest = dict()
+        for i, data_in in enumerate(batch):
+            if self.is_partial(data_in) and data_in["message_id"] not in finished:
+                newest[data_in["message_id"]] = i
+
+        # Limit the time spent on partial audio, so that the final decoding is not delayed
+        pause = self._interim_duration * (1 / self.interim_compute_fraction - 1)
+        if time.time() < self._interim_end_time + pause:
+            newest.clear()
+
+        selected = list(newest.values())
+
+        # The audio of skipped partials is not needed anymore
+        for i, data_in in enumerate(batch):
+            if self.is_partial(data_in) and i not in selected:
+                self._release(data_in["data"])
+
+        return selected
+
+    def _process_partial(self, data_in: dict) -> dict | None:
+        """Decode the audio of an active utterance and create the partial message."""
+        start_time = time.time()
+        result = self._decode([data_in["data"]])[0]
+        self._interim_end_time = time.time()
+        self._interim_duration = self._interim_end_time - start_time
+
+        if result.language not in self.target_languages:
+            return None
+
+        # The common beginning of two successive hypotheses is considered stable
+        message_id = data_in["message_id"]
+        previous = self._hypotheses.get(message_id, "").split(" ")
+        current = result.text.split(" ")
+        stable_words = 0
+        while (
+            stable_words < min(len(previous), len(current))
+            and previous[stable_words] == current[stable_words]
+        ):
+            stable_words += 1
+        self._hypotheses[message_id] = result.text
+
+        return self.create_stream_data(
+            result.text,
+            message_id,
+            data_in["sequence"],
+            stable=" ".join(current[:stable_words]),
+            language=result.language,
+        )
+
+    @staticmethod
+    def _release(data) -> None:
+        if isinstance(data, AudioSlot):
+            data.release()
+
+    def _resample(self, data) -> numpy.ndarray:
+        """Return the received audio resampled to the sampling rate of the model."""
+        # Audio from the recorder is stored inside shared memory
+        slot = data if isinstance(data, AudioSlot) else None
+        if slot is not None:
+            data = slot.read()
+
+        # Resample audio to the correct input sampling rate
+        resampled_audio = resample(data, self.input_fs, self._target_fs)
+
+        # The resampled data is a copy, so the shared memory can be reused
+        if slot is not None:
+            slot.release()
+
+        return resampled_audio
+
+    def _create_output(self, result, data_in: dict) -> dict | None:
+        self.logger.debug(f"Detected language {result.language}")
         self.logger.debug(f"Detected Text: {result.text}")
 
+        message_id = data_in.get("message_id", None)
+        self._hypotheses.pop(message_id, None)
+
         if result.language in self.target_languages:
             self.logger.debug("Send Data")
 
+            if message_id is not None:
+                # Replaces the partial results of the utterance
+                return self.create_stream_data(
+                    result.text,
+                    message_id,
+                    data_in["sequence"],
+                    final=True,
+                    language=result.language,
+                )
+
             return self.create_output_data(result.text, language=result.language)
         else:
             self.logger.debug(
@@ -1,55 +1,73 @@
 """Module to convert text to speech using xTTS v2."""
 
-import sounddevice as sd
-from TTS.api import TTS
+import numpy
 
-from core.processing import AbstractActionProcess
+from audio.tts_pipeline import AbstractTTSModule
 
 
-import random
-
-
-class XTTSV2Module(AbstractActionProcess):
+class XTTSV2Module(AbstractTTSModule):
     """Module to convert text to speech using xTTS v2.
     See https://huggingface.co/coqui/XTTS-v2.
 
     Args:
-        AbstractActionProcess (_type_): _description_
+        AbstractTTSModule (_type_): _description_
     """
 
-    def __init__(self, manager, output_queues=(), language="en"):
-        """This modules uses google text to speech API to convert the given text to speech."""
+    # Sampling rate of the generated audio
+    SAMPLING_RATE = 24000
+
+    def __init__(
+        self, manager, output_queues=(), language="en", speaker=None, speed=2, **kwargs
+    ):
+        """This modules uses google text to speech API to convert the given text to speech.
+
+        Args:
+            language (str, optional): Default language of the TTS. Defaults to "en".
+            speaker (str, optional): Speaker of the TTS. The speaker is part of the key of
+                                     the persistent audio cache, so if not set the first
+                                     speaker of the model is used instead of a random one.
+                                     Defaults to None.
+            speed (float, optional): Speed of the speech. Defaults to 2.
+        """
         self.language = language
+        self.speed = speed
 
         self.module = None
-        self.speakers = None
+        self.speaker = speaker
 
-        super().__init__(manager, "tts", output_queues=output_queues)
+        super().__init__(manager, output_queues=output_queues, **kwargs)
 
-    def process(self, data_in):
+    def synthesize(self, text, language=None):
         audio = self.module.tts(
-            data_in["data"],
-            speaker=self.module.speakers[
-                random.randint(0, len(self.module.speakers) - 1)
-            ],
-            language=data_in["language"],
-            speed=2,
+            text,
+            speaker=self.speaker,
+            language=language if language is not None else self.language,
+            speed=self.speed,
         )
 
-        sd.play(audio, samplerate=int(24e3))
+        return numpy.asarray(audio, dtype=numpy.float32), self.SAMPLING_RATE
 
-        sd.wait()
+    def cache_parameters(self, language=None):
+        return {
+            "model": "xtts_v2",
+            "voice": self.speaker,
+            "language": language if language is not None else self.language,
+            "speed": self.speed,
+        }
 
-        return None
+    def warm_up(self):
+        # pylint: disable=import-outside-toplevel
+        from TTS.api import TTS
 
-    def run(self, *args, **kwargs):
         self.module = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(
             self.get_process_device()
         )
-        self.speakers = self.module.speakers[29]
+        # Use the same speaker after each restart
+        if self.speaker is None:
+            self.speaker = self.module.speakers[0]
 
-        super().run(*args, **kwargs)
+        super().warm_up()
 
     def clean_up(self):
+        super().clean_up()
         del self.module
-        return super().clean_up()
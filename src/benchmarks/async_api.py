@@ -0,0 +1,106 @@
+"""Benchmark of the API modules against the local mock of the OpenAI API.
+
+Sends the messages of several sessions to the synchronous and the async GPT-4o mini module
+and reports the throughput, the latency, the retries of the failed requests and how many
+requests the server handled concurrently over how many connections. No network access or
+API key is required. The replies and retries of the async module are checked by
+`tests/test_async_api.py`. Run from the src folder with `python -m benchmarks.async_api`.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.results import percentile
+from benchmarks.mock_openai import MockOpenAIServer
+from core.transport import DirectTransport
+from text.gpt4o_mini import GPT4oMiniTextProcessingModule
+from text.gpt4o_mini_async import AsyncGPT4oMiniTextProcessingModule
+
+
+def _run(module_type: str, concurrency: int, args) -> dict:
+    server = MockOpenAIServer(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        failure_rate=args.failure_rate,
+        seed=0,
+    )
+    server.start()
+
+    # The environment is inherited by the process of the module
+    os.environ["OPENAI_BASE_URL"] = server.url
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+    transport = DirectTransport()
+    if module_type == "async":
+        module = AsyncGPT4oMiniTextProcessingModule(
+            transport, stream=args.stream, max_concurrency=concurrency
+        )
+        module.retry_base_delay = args.retry_delay
+    else:
+        module = GPT4oMiniTextProcessingModule(transport, stream=args.stream)
+
+    result_queue = transport.queue()
+    module.add_output_queue(result_queue)
+
+    module.start()
+    if not module.wait_ready(60):
+        module.terminate()
+        server.stop()
+        raise RuntimeError(f"The {module_type} module did not finish its warm up")
+
+    start_time = time.time()
+    for i in range(args.messages):
+        module.input_queue.put(
+            {"data": f"Message {i}", "session_id": i % args.sessions}
+        )
+
+    latencies = []
+    received = 0
+    while received < args.messages:
+        result = result_queue.get()
+        if module.is_partial(result):
+            continue
+
+        received += 1
+        latencies.append(time.time() - start_time)
+    duration = time.time() - start_time
+
+    module.terminate()
+    module.join()
+    server.stop()
+
+    return {
+        "module": module_type,
+        "max_concurrency": concurrency,
+        "messages": args.messages,
+        "duration_s": duration,
+        "messages_per_s": args.messages / duration,
+        "completion_s_p50": percentile(latencies, 50),
+        "completion_s_max": max(latencies),
+        **server.stats(),
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=32)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--retry-delay", type=float, default=0.1)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    # The synchronous client retries failed requests itself
+    print(json.dumps(_run("sync", 1, args)))
+    for concurrency in args.concurrency:
+        print(json.dumps(_run("async", concurrency, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark of the audio transport between the recorder and the speech recognition.
+
+Compares sending torch float16 tensors through manager queues with sending shared memory
+slot descriptors. Run from the src folder with `python -m benchmarks.audio_transport`.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import statistics
+import time
+
+import numpy
+
+from audio.shared_audio import AudioSlot, SharedAudioRing
+
+
+def _consume(input_queue, result_queue, chunk_count: int) -> None:
+    """Receive the chunks, convert them to float32 like the speech recognition and record
+    the latency of each chunk."""
+    latencies = []
+    for _ in range(chunk_count):
+        data_in = input_queue.get()
+        data = data_in["data"]
+
+        if isinstance(data, AudioSlot):
+            audio = numpy.array(data.read(), dtype=numpy.float32)
+            data.release()
+        else:
+            audio = data.numpy().astype(numpy.float32)
+
+        latencies.append(time.time() - data_in["send_time"])
+
+    result_queue.put((latencies, time.time(), len(audio)))
+
+
+def _run(transport: str, chunk: numpy.ndarray, chunk_count: int) -> dict:
+    manager = mp.Manager()
+    input_queue = manager.Queue()
+    result_queue = manager.Queue()
+
+    ring = None
+    if transport == "shared_memory":
+        ring = SharedAudioRing(4, len(chunk))
+
+    consumer = mp.Process(target=_consume, args=(input_queue, result_queue, chunk_count))
+    consumer.start()
+
+    start_time = time.time()
+    for _ in range(chunk_count):
+        if ring is not None:
+            slot = ring.write(chunk, 48000)
+            # Wait for the consumer if all slots are in use
+            while slot is None:
+                time.sleep(0.0005)
+                slot = ring.write(chunk, 48000)
+            data = slot
+        else:
+            # pylint: disable=import-outside-toplevel
+            import torch
+
+            data = torch.tensor(chunk, dtype=torch.float16)
+
+        input_queue.put({"data": data, "send_time": time.time()})
+
+    latencies, end_time, _ = result_queue.get()
+    consumer.join()
+
+    if ring is not None:
+        ring.close()
+    manager.shutdown()
+
+    latencies = sorted(latencies)
+    megabytes = chunk.nbytes * chunk_count / 1e6
+    return {
+        "transport": transport,
+        "chunks": chunk_count,
+        "chunk_megabytes": chunk.nbytes / 1e6,
+        "throughput_mb_s": megabytes / (end_time - start_time),
+        "latency_ms_mean": statistics.mean(latencies) * 1e3,
+        "latency_ms_p50": latencies[len(latencies) // 2] * 1e3,
+        "latency_ms_max": latencies[-1] * 1e3,
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk-duration", type=float, default=5.0)
+    parser.add_argument("--sampling-rate", type=int, default=48000)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument(
+        "--transport",
+        choices=("manager_queue", "shared_memory"),
+        action="append",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    chunk = rng.uniform(
+        -1, 1, int(args.chunk_duration * args.sampling_rate)
+    ).astype(numpy.float32)
+
+    for transport in args.transport or ("manager_queue", "shared_memory"):
+        print(json.dumps(_run(transport, chunk, args.chunks)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Benchmark of the input policies with a synthetic slow stage.
+
+A producer sends messages faster than a slow module can process them. For each input policy
+the benchmark reports how many messages were processed or dropped, how long the producer
+was blocked and how old the processed messages were. Run from the src folder with
+`python -m benchmarks.backpressure`.
+"""
+
+import argparse
+import json
+import time
+from queue import Empty
+
+from benchmarks.results import percentile
+from core.processing import AbstractActionProcess
+from core.transport import DirectTransport
+
+
+class SlowActionProcess(AbstractActionProcess):
+    """Module which takes a fixed time to process each message."""
+
+    accepts_partial = True
+
+    def __init__(self, manager, process_time: float, output_queues=()):
+        """Constructor.
+
+        Args:
+            process_time (float): Processing time of each message in seconds.
+        """
+        self.process_time = process_time
+        super().__init__(manager, "other", output_queues=output_queues)
+
+    def process(self, data_in):
+        time.sleep(self.process_time)
+        return self.create_output_data(data_in["data"], created=data_in["created"])
+
+    def clean_up(self):
+        pass
+
+
+def _run(
+    policy: str,
+    queue_size: int,
+    message_count: int,
+    interval: float,
+    process_time: float,
+    ttl: float,
+    partial: bool,
+) -> dict:
+    transport = DirectTransport()
+
+    module = SlowActionProcess(transport, process_time)
+    module.configure_input(queue_size, policy)
+
+    result_queue = transport.queue()
+    module.add_output_queue(result_queue)
+
+    module.start()
+    module.wait_ready()
+
+    # All messages except the last are partial messages of one stream, if requested
+    start_time = time.time()
+    blocked_time = 0.0
+    for i in range(message_count):
+        data = {"data": i, "created": time.time()}
+        if partial:
+            data.update(
+                AbstractActionProcess.create_stream_data(
+                    i, "stream", i, final=i == message_count - 1
+                )
+            )
+            data["created"] = time.time()
+        if ttl is not None:
+            data["deadline"] = time.time() + ttl
+
+        put_time = time.time()
+        module.input_queue.put(data)
+        blocked_time += time.time() - put_time
+
+        time.sleep(interval)
+    send_duration = time.time() - start_time
+
+    # The last message is never dropped by the coalesce policy, so wait for it
+    ages = []
+    timeout = max(process_time * queue_size, 1.0) + 1.0
+    while True:
+        try:
+            result = result_queue.get(timeout=timeout)
+        except Empty:
+            break
+        ages.append(time.time() - result["created"])
+        if result["data"] == message_count - 1:
+            break
+
+    module.terminate()
+    module.join()
+
+    return {
+        "policy": policy,
+        "queue_size": queue_size,
+        "ttl_s": ttl,
+        "sent": message_count,
+        "processed": len(ages),
+        "dropped": message_count - len(ages),
+        "producer_blocked_s": blocked_time,
+        "send_duration_s": send_duration,
+        "age_ms_p50": percentile(ages, 50) * 1e3 if ages else None,
+        "age_ms_max": max(ages) * 1e3 if ages else None,
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.01)
+    parser.add_argument("--process-time", type=float, default=0.05)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--ttl", type=float, default=0.5)
+    args = parser.parse_args()
+
+    runs = (
+        ("block", 0, None, False),
+        ("block", args.queue_size, None, False),
+        ("drop_oldest", args.queue_size, None, False),
+        ("coalesce", args.queue_size, None, True),
+        ("block", 0, args.ttl, False),
+    )
+    for policy, queue_size, ttl, partial in runs:
+        print(
+            json.dumps(
+                _run(
+                    policy,
+                    queue_size,
+                    args.messages,
+                    args.interval,
+                    args.process_time,
+                    ttl,
+                    partial,
+                )
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""End to end benchmark of the complete pipeline without microphone, models or network.
+
+The pipeline is built from the same configuration as main.py, but the recorder plays WAV
+files and the speech recognition, text and TTS modules use the deterministic stub engines of
+`benchmarks.stub_engines`. The GUI runs headless. The benchmark reports the throughput, the
+latency from the end of an utterance until the reply text and until its first audio, the
+latency of each stage and the peak memory of each process as JSON, together with the
+commit, so that runs can be compared. With `--barge-in` each utterance interrupts the reply
+to the previous one and the time until the playback is stopped is reported. Run from the src
+folder with `python -m benchmarks.end_to_end`, without WAV files a fixture with synthetic
+utterances is created.
+"""
+
+from __future__ import annotations
+
+import argparse
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+from queue import Empty
+
+import numpy
+
+from audio.wav_recorder import write_wav
+from benchmarks.results import DEFAULT_CONFIG, git_commit, quantiles
+from core.metrics import summarize
+from core.processing import AbstractActionProcess
+from core.registry import (
+    MODULE_KEYS,
+    Pipeline,
+    load_config,
+    module_class,
+    register_module,
+)
+from core.supervisor import Supervisor
+
+register_module("stub_whisper", "benchmarks.stub_engines:StubWhisperModule")
+register_module("stub_gpt", "benchmarks.stub_engines:StubGPTModule")
+register_module("stub_tts", "benchmarks.stub_engines:StubOpenAITTS")
+
+# Stub which replaces each module type of the configuration
+STUB_TYPES = {
+    "sounddevice_recorder": "wav_recorder",
+    "whisper": "stub_whisper",
+    "gpt4o_mini": "stub_gpt",
+    "gpt4o_mini_async": "stub_gpt",
+    "phi": "stub_gpt",
+    "gemma": "stub_gpt",
+    "openai_tts": "stub_tts",
+    "xtts_v2": "stub_tts",
+    "gtts": "stub_tts",
+}
+
+
+def create_fixture(
+    path: str,
+    utterances: int,
+    utterance_duration: float = 1.5,
+    pause: float = 1.5,
+    sampling_rate: int = 16000,
+) -> None:
+    """Write a WAV file with synthetic utterances separated by pauses. The utterances are
+    harmonic tones with a syllable like envelope, which the voice activity detector
+    classifies as speech."""
+    rng = numpy.random.default_rng(0)
+
+    time_axis = numpy.arange(int(utterance_duration * sampling_rate)) / sampling_rate
+    envelope = 0.6 + 0.4 * numpy.sin(2 * numpy.pi * 4 * time_axis)
+    utterance = (
+        0.2
+        * envelope
+        * sum(
+            numpy.sin(2 * numpy.pi * 160 * harmonic * time_axis) / harmonic
+            for harmonic in range(1, 6)
+        )
+    )
+
+    parts = []
+    for _ in range(utterances):
+        parts.append(rng.normal(0, 1e-4, int(pause * sampling_rate)))
+        parts.append(utterance + rng.normal(0, 1e-3, len(utterance)))
+    parts.append(rng.normal(0, 1e-4, int(pause * sampling_rate)))
+
+    write_wav(path, numpy.concatenate(parts).astype(numpy.float32), sampling_rate)
+
+
+def _accepted_parameters(cls: type) -> set:
+    """Return the names of the constructor parameter of the class and the base classes to
+    which it passes its keyword arguments."""
+    names = set()
+    for base in cls.__mro__:
+        if "__init__" not in base.__dict__:
+            continue
+
+        parameters = inspect.signature(base.__init__).parameters
+        names.update(parameters)
+        if not any(p.kind == p.VAR_KEYWORD for p in parameters.values()):
+            break
+
+    return names
+
+
+def stub_config(config: dict, stub_parameters: dict, store_path: str) -> dict:
+    """Return the configuration with the engines replaced by stubs.
+
+    Args:
+        config (dict): The pipeline configuration of the application.
+        stub_parameters (dict): Additional parameter of each stub type.
+        store_path (str): Path of the session database of the GUI.
+    """
+    modules = dict()
+    for name, module in config["modules"].items():
+        module_type = STUB_TYPES.get(module["type"], module["type"])
+        parameters = dict(stub_parameters.get(module_type, {}))
+
+        if module_type == "eel_gui":
+            parameters.update(headless=True, session_store_path=store_path)
+
+        # Parameter of the replaced engine, e.g. the model name, are removed
+        accepted = _accepted_parameters(module_class(module_type))
+        modules[name] = {
+            **{
+                key: value
+                for key, value in module.items()
+                if key in MODULE_KEYS or (key in accepted and key != "device")
+            },
+            **parameters,
+            "type": module_type,
+        }
+
+        # The benchmark does not continue a stored conversation
+        if "resume_session" in modules[name]:
+            modules[name]["resume_session"] = None
+
+    return {**config, "modules": modules}
+
+
+class _MemorySampler:
+    """Samples the resident memory of processes in a background thread."""
+
+    def __init__(self, processes: dict, interval: float = 0.2):
+        """Constructor.
+
+        Args:
+            processes (dict): Maps a name to the process id.
+            interval (float, optional): Time between two samples. Defaults to 0.2.
+        """
+        self.processes = processes
+        self.interval = interval
+        self.peak = {name: 0 for name in processes}
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> dict:
+        """Stop the sampling and return the peak memory of each process in MiB."""
+        self._stop.set()
+        self._thread.join()
+        return {name: peak / 2**20 for name, peak in self.peak.items()}
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            for name, pid in self.processes.items():
+                rss = _rss_bytes(pid)
+                if rss is not None:
+                    self.peak[name] = max(self.peak[name], rss)
+            self._stop.wait(self.interval)
+
+
+def _rss_bytes(pid: int) -> int | None:
+    """Return the resident memory of a process, or None if it cannot be determined."""
+    try:
+        # pylint: disable=import-outside-toplevel
+        import psutil
+
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:  # pylint: disable=broad-exception-caught
+        return None
+
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def run(config: dict, wav_paths: list, args) -> dict:
+    """Run the stubbed pipeline on the WAV files and return the results."""
+    work_directory = tempfile.mkdtemp(prefix="benchmark-")
+
+    # The metrics of the modules are collected for the latency of each stage
+    os.environ["METRICS_DIRECTORY"] = os.path.join(work_directory, "metrics")
+    os.environ["METRICS_INTERVAL"] = "1"
+
+    stub_parameters = {
+        "wav_recorder": {
+            "paths": wav_paths,
+            "speed": args.speed,
+            "repeat": args.repeat,
+            "barge_in": args.barge_in,
+        },
+        "stub_whisper": {
+            "latency": args.stt_latency,
+            "real_time_factor": args.stt_real_time_factor,
+        },
+        "stub_gpt": {
+            "latency": args.llm_latency,
+            "token_delay": args.token_delay,
+            "reply_words": args.reply_words,
+        },
+        "stub_tts": {"latency": args.tts_latency},
+    }
+    pipeline = Pipeline(
+        stub_config(
+            config, stub_parameters, os.path.join(work_directory, "sessions.db")
+        )
+    )
+
+    recorder = next(
+        module
+        for name, module in pipeline.modules.items()
+        if pipeline.config["modules"][name]["type"] == "wav_recorder"
+    )
+
+    # The replies and the written audio are also sent to the benchmark
+    collector = pipeline.transport.queue()
+    for module in pipeline.processes:
+        if module.label in ("llm", "tts"):
+            module.add_output_queue(collector)
+
+    supervisor = Supervisor(pipeline)
+
+    start_time = time.time()
+    supervisor.start()
+    ready_time = time.time()
+
+    # The recorder runs inside the main process
+    processes = {"main": os.getpid()}
+    for name, module in pipeline.modules.items():
+        if isinstance(module, AbstractActionProcess):
+            processes[name] = module.pid
+
+    sampler = _MemorySampler(processes)
+    sampler.start()
+
+    reply_latencies = []
+    first_token_latencies = []
+    first_audio_latencies = []
+    cancel_latencies = []
+    streams = set()
+    audio_origins = set()
+
+    recorder.start()
+    feed_start_time = time.time()
+    last_message_time = feed_start_time
+    while time.time() - feed_start_time < args.timeout:
+        try:
+            data = collector.get(timeout=0.1)
+        except Empty:
+            # Done once the files were played and no message arrived for a while
+            if (
+                not recorder.is_active()
+                and time.time() - last_message_time > args.idle_timeout
+            ):
+                break
+            continue
+
+        now = time.time()
+        last_message_time = now
+
+        if data["source"] == "tts" and "cancel_latency" in data:
+            cancel_latencies.append(data["cancel_latency"])
+            continue
+
+        if data["source"] == "tts":
+            origin_time = data.get("origin_time", None)
+            if origin_time is not None and origin_time not in audio_origins:
+                audio_origins.add(origin_time)
+                first_audio_latencies.append(now - origin_time)
+            continue
+
+        origin_time = AbstractActionProcess.trace_start(data)
+        if origin_time is None:
+            continue
+
+        message_id = data.get("message_id", None)
+        if message_id is not None and message_id not in streams:
+            streams.add(message_id)
+            first_token_latencies.append(now - origin_time)
+
+        if not AbstractActionProcess.is_partial(data):
+            reply_latencies.append(now - origin_time)
+    duration = last_message_time - feed_start_time
+
+    memory = sampler.stop()
+
+    shutdown_time = time.time()
+    supervisor.shutdown()
+    shutdown_duration = time.time() - shutdown_time
+
+    return {
+        "commit": git_commit(),
+        "config": args.config,
+        "parameter": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("config", "wav", "output")
+        },
+        "audio_s": recorder.duration,
+        "ready_s": ready_time - start_time,
+        "shutdown_s": shutdown_duration,
+        "duration_s": duration,
+        "replies": len(reply_latencies),
+        "replies_per_s": len(reply_latencies) / duration if duration > 0 else 0.0,
+        "reply_latency_s": quantiles(reply_latencies),
+        "first_token_latency_s": quantiles(first_token_latencies),
+        "first_audio_latency_s": quantiles(first_audio_latencies),
+        "cancelled_turns": len(cancel_latencies),
+        "cancel_latency_s": quantiles(cancel_latencies),
+        "rss_mib": memory,
+        "stages": summarize(os.environ["METRICS_DIRECTORY"]),
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default=DEFAULT_CONFIG)
+    parser.add_argument("--wav", nargs="*", default=None, help="16 bit PCM WAV files")
+    parser.add_argument("--utterances", type=int, default=8)
+    parser.add_argument("--pause", type=float, default=1.5, help="Seconds between utterances")
+    parser.add_argument(
+        "--barge-in", action="store_true", help="Interrupt the replies by the next utterance"
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--stt-latency", type=float, default=0.1)
+    parser.add_argument("--stt-real-time-factor", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--reply-words", type=int, default=20)
+    parser.add_argument("--tts-latency", type=float, default=0.15)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--idle-timeout", type=float, default=5.0)
+    parser.add_argument("--output", help="Append the result as JSON line to this file")
+    args = parser.parse_args()
+
+    wav_paths = args.wav
+    if not wav_paths:
+        wav_paths = [os.path.join(tempfile.mkdtemp(prefix="fixture-"), "utterances.wav")]
+        create_fixture(wav_paths[0], args.utterances, pause=args.pause)
+
+    result = run(load_config(args.config), wav_paths, args)
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as file:
+            file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark of the transports used to connect the processing modules.
+
+Sends messages through a chain of relay modules. The message rate is measured with all
+messages sent at once, the latency percentiles with round trips of single messages, so that
+they do not contain the time a message waits behind the others. Run from the src folder
+with `python -m benchmarks.message_bus`.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+from benchmarks.results import percentile
+from core.processing import AbstractActionProcess
+from core.transport import DirectTransport, ManagerTransport
+
+
+class RelayActionProcess(AbstractActionProcess):
+    """Module which forwards the received data unchanged."""
+
+    def __init__(self, manager, output_queues=()):
+        super().__init__(manager, "other", output_queues=output_queues)
+
+    def process(self, data_in):
+        return self.create_output_data(data_in["data"])
+
+    def clean_up(self):
+        pass
+
+
+def _message_rate(modules: list, result_queue, message_count: int) -> float:
+    """Return the messages per second, if all messages are sent at once."""
+    start_time = time.perf_counter()
+    for i in range(message_count):
+        modules[0].input_queue.put({"data": i})
+
+    for _ in range(message_count):
+        result_queue.get()
+
+    return message_count / (time.perf_counter() - start_time)
+
+
+def _latencies(modules: list, result_queue, round_trips: int) -> list:
+    """Return the latency of single messages, each is sent after the previous arrived."""
+    latencies = []
+    for i in range(round_trips):
+        start_time = time.perf_counter()
+        modules[0].input_queue.put({"data": i})
+        result_queue.get()
+        latencies.append(time.perf_counter() - start_time)
+
+    return latencies
+
+
+def _run(
+    transport_name: str, chain_length: int, message_count: int, round_trips: int
+) -> dict:
+    manager = None
+    if transport_name == "manager":
+        manager = mp.Manager()
+        transport = ManagerTransport(manager)
+    else:
+        transport = DirectTransport()
+
+    modules = [RelayActionProcess(transport) for _ in range(chain_length)]
+    for module, next_module in zip(modules, modules[1:]):
+        module.connect_output_to(next_module)
+
+    result_queue = transport.queue()
+    modules[-1].add_output_queue(result_queue)
+
+    for module in modules:
+        module.start()
+
+    # Warm up the chain so that the process start up is not measured
+    modules[0].input_queue.put({"data": -1})
+    result_queue.get()
+
+    messages_per_s = _message_rate(modules, result_queue, message_count)
+    latencies = _latencies(modules, result_queue, round_trips)
+
+    for module in modules:
+        module.terminate()
+        module.join()
+
+    if manager is not None:
+        manager.shutdown()
+
+    return {
+        "transport": transport_name,
+        "chain_length": chain_length,
+        "messages": message_count,
+        "messages_per_s": messages_per_s,
+        "round_trips": round_trips,
+        "latency_ms_p50": percentile(latencies, 50) * 1e3,
+        "latency_ms_p99": percentile(latencies, 99) * 1e3,
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chain-length", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--round-trips", type=int, default=200)
+    parser.add_argument(
+        "--transport", choices=("manager", "direct"), action="append", default=None
+    )
+    args = parser.parse_args()
+
+    for transport in args.transport or ("manager", "direct"):
+        print(json.dumps(_run(transport, args.chain_length, args.messages, args.round_trips)))
+
+
+if __name__ == "__main__":
+    main()
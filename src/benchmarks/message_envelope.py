@@ -0,0 +1,145 @@
+"""Benchmark of the message envelope against pickling the message dicts.
+
+Measures the serialization of a streamed text message and of 30 s of float32 audio, once
+with pickle like a `multiprocessing.Queue` and once with the frames of `core.message`, and
+the round trip of the messages through an echo process with the direct and the framed
+transport. Run from the src folder with `python -m benchmarks.message_envelope`.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import time
+from multiprocessing.reduction import ForkingPickler
+
+import numpy
+
+from benchmarks.results import percentile
+from core.message import Message, decode, encode
+from core.transport import DirectTransport, FramedTransport
+
+
+def _create_message(payload: str) -> dict:
+    if payload == "text":
+        data = "Where is the train station? It is next to the old market."
+    else:
+        sampling_rate = 16000 if payload == "audio_16k" else 48000
+        data = numpy.random.default_rng(0).uniform(-1, 1, 30 * sampling_rate)
+        data = data.astype(numpy.float32)
+
+    return {
+        "data": data,
+        "trace_id": "2f1e6a3c",
+        "session_id": "default",
+        "source": "llm",
+        "language": "en",
+        "message_id": "9b0d4c1e",
+        "sequence": 3,
+        "partial": True,
+        "final": False,
+        "sent_time": time.time(),
+        "trace": [
+            {"stage": "recorder", "start": time.time(), "end": time.time()},
+            {"stage": "stt", "start": time.time(), "end": time.time()},
+        ],
+    }
+
+
+def _measure(function, repeat: int) -> float:
+    """Return the median duration of the function in microseconds."""
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start_time)
+
+    return percentile(durations, 50) * 1e6
+
+
+def _run_codec(payload: str, repeat: int) -> dict:
+    message = _create_message(payload)
+    pickled = bytes(ForkingPickler.dumps(message))
+    frames = encode(Message.from_dict(message))
+
+    return {
+        "benchmark": "codec",
+        "payload": payload,
+        "pickle_bytes": len(pickled),
+        "envelope_bytes": sum(memoryview(frame).nbytes for frame in frames),
+        "pickle_dumps_us": _measure(lambda: ForkingPickler.dumps(message), repeat),
+        "pickle_loads_us": _measure(lambda: ForkingPickler.loads(pickled), repeat),
+        "envelope_encode_us": _measure(
+            lambda: encode(Message.from_dict(message)), repeat
+        ),
+        "envelope_decode_us": _measure(lambda: decode(frames).to_dict(), repeat),
+    }
+
+
+def _echo(input_queue, output_queue) -> None:
+    while True:
+        data_in = input_queue.get()
+        if data_in is None:
+            return
+        output_queue.put(data_in)
+
+
+def _run_queue(transport_name: str, payload: str, message_count: int) -> dict:
+    transport = FramedTransport() if transport_name == "framed" else DirectTransport()
+    input_queue = transport.queue()
+    output_queue = transport.queue()
+
+    process = mp.Process(target=_echo, args=(input_queue, output_queue))
+    process.start()
+
+    message = _create_message(payload)
+    input_queue.put(message)
+    output_queue.get()
+
+    # One message at a time, so that the latency does not include the waiting time
+    latencies = []
+    start_time = time.time()
+    for _ in range(message_count):
+        send_time = time.perf_counter()
+        input_queue.put(message)
+        output_queue.get()
+        latencies.append(time.perf_counter() - send_time)
+    end_time = time.time()
+
+    input_queue.put(None)
+    process.join()
+
+    return {
+        "benchmark": "queue",
+        "transport": transport_name,
+        "payload": payload,
+        "messages": message_count,
+        "messages_per_s": message_count / (end_time - start_time),
+        "round_trip_ms_p50": percentile(latencies, 50) * 1e3,
+        "round_trip_ms_p99": percentile(latencies, 99) * 1e3,
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument(
+        "--payload",
+        choices=("text", "audio_16k", "audio_48k"),
+        action="append",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    payloads = args.payload or ("text", "audio_16k", "audio_48k")
+    for payload in payloads:
+        print(json.dumps(_run_codec(payload, args.repeat)))
+
+    for payload in payloads:
+        for transport in ("direct", "framed"):
+            print(json.dumps(_run_queue(transport, payload, args.messages)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Local HTTP server which stands in for the OpenAI API.
+
+The server answers chat completions, with and without streaming, and speech requests after
+a configurable latency. A part of the requests can fail with a server error to exercise the
+retries of the modules. Run it from the src folder with
+`python -m benchmarks.mock_openai --port 8000` and start the application with
+`OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockOpenAIServer:
+    """Mock of the chat completion and speech endpoints of the OpenAI API."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.1,
+        token_delay: float = 0.01,
+        failure_rate: float = 0.0,
+        seed: int = None,
+    ):
+        """Constructor.
+
+        Args:
+            host (str, optional): Address of the server. Defaults to "127.0.0.1".
+            port (int, optional): Port of the server, 0 selects a free port. Defaults to 0.
+            latency (float, optional): Time until the first response byte in seconds.
+                                       Defaults to 0.1.
+            token_delay (float, optional): Time between two streamed tokens in seconds.
+                                       Defaults to 0.01.
+            failure_rate (float, optional): Fraction of the requests which fail with a
+                                       server error. Defaults to 0.
+            seed (int, optional): Seed of the failures.
+        """
+        self.latency = latency
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+
+        self.requests = 0
+        self.failures = 0
+        self.connections = 0
+        self.active = 0
+        self.max_active = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Base url of the API, which is passed to the client."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> None:
+        """Start the server in a background thread."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        """Return the number of requests, failures, connections and the maximal number of
+        concurrent requests."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "connections": self.connections,
+                "max_concurrent": self.max_active,
+            }
+
+    def _begin(self) -> bool:
+        """Count a request and return false if it should fail."""
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+            if self._random.random() < self.failure_rate:
+                self.failures += 1
+                return False
+
+        return True
+
+    def _end(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handler of one connection. The connections are kept open between requests."""
+
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:  # pylint: disable=protected-access
+                    server.connections += 1
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+                # pylint: disable=protected-access
+                if not server._begin():
+                    time.sleep(server.latency)
+                    self._send_json(
+                        503, {"error": {"message": "Mock failure", "type": "server_error"}}
+                    )
+                    server._end()
+                    return
+
+                try:
+                    time.sleep(server.latency)
+                    if self.path.endswith("/chat/completions"):
+                        self._chat_completion(body)
+                    elif self.path.endswith("/audio/speech"):
+                        self._speech(body)
+                    else:
+                        self._send_json(404, {"error": {"message": "Unknown endpoint"}})
+                finally:
+                    server._end()
+
+            def _send_json(self, status: int, data: dict) -> None:
+                content = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _chat_completion(self, body: dict) -> None:
+                # The reply repeats the last message
+                reply = f"Mock reply to: {body['messages'][-1]['content']}"
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+                if not body.get("stream", False):
+                    self._send_json(
+                        200,
+                        {
+                            "id": completion_id,
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": body["model"],
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "message": {"role": "assistant", "content": reply},
+                                    "finish_reason": "stop",
+                                }
+                            ],
+                        },
+                    )
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                for token in reply.split(" "):
+                    self._send_event(
+                        {
+                            "id": completion_id,
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": body["model"],
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "delta": {"content": token + " "},
+                                    "finish_reason": None,
+                                }
+                            ],
+                        }
+                    )
+                    time.sleep(server.token_delay)
+
+                self._send_chunk(b"data: [DONE]\n\n")
+                self._send_chunk(b"")
+
+            def _send_event(self, data: dict) -> None:
+                self._send_chunk(f"data: {json.dumps(data)}\n\n".encode())
+
+            def _send_chunk(self, content: bytes) -> None:
+                self.wfile.write(f"{len(content):x}\r\n".encode() + content + b"\r\n")
+                self.wfile.flush()
+
+            def _speech(self, body: dict) -> None:
+                # Silent 16 bit pcm audio at 24 kHz, 50 ms per character
+                content = bytes(2 * 1200 * len(body["input"]))
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/pcm")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
+
+
+def main() -> None:
+    """Run the mock server until it is interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        port=args.port,
+        latency=args.latency,
+        token_delay=args.token_delay,
+        failure_rate=args.failure_rate,
+    )
+    server.start()
+    print(f"Mock OpenAI API at {server.url}")
+
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Load test of one pipeline which serves many concurrent learners.
+
+The pipeline is built from the configuration of main.py with the stub engines of
+`benchmarks.stub_engines`, but without recorder and speech recognition: each simulated
+learner is a remote browser session, which sends its text to the headless GUI, waits for
+the reply and its first audio, and thinks before the next turn. Optionally a noisy session
+sends a burst of messages at the start, to compare the session scheduling of the text
+module. The benchmark reports the latencies, the throughput, the fairness between the
+learners and whether each session stored exactly its own conversation. Run from the src
+folder with `python -m benchmarks.multi_session`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from queue import Empty
+
+from benchmarks.end_to_end import stub_config
+from benchmarks.results import DEFAULT_CONFIG, git_commit, quantiles
+from core.processing import AbstractActionProcess
+from core.registry import Pipeline, load_config
+from core.supervisor import Supervisor
+from core.workers import SESSION_KEY
+
+# Module types which need a microphone and are not used by remote sessions
+_AUDIO_INPUT_TYPES = ("sounddevice_recorder", "whisper")
+
+
+def text_config(config: dict) -> dict:
+    """Return the configuration without the modules of the audio input."""
+    removed = {
+        name
+        for name, module in config["modules"].items()
+        if module["type"] in _AUDIO_INPUT_TYPES
+    }
+
+    modules = dict()
+    for name, module in config["modules"].items():
+        if name in removed:
+            continue
+
+        modules[name] = dict(module)
+        if "wait_for" in module:
+            modules[name]["wait_for"] = [
+                other for other in module["wait_for"] if other not in removed
+            ]
+
+    edges = [
+        edge
+        for edge in config.get("edges", [])
+        if edge["from"] not in removed and edge["to"] not in removed
+    ]
+
+    return {**config, "modules": modules, "edges": edges}
+
+
+def _learner(
+    session_id: str, gui_queue, replies: queue.Queue, args, results: list
+) -> None:
+    """Send the turns of one learner and record the latency of each reply."""
+    rng = random.Random(session_id)
+
+    for turn in range(args.turns):
+        if args.think_time > 0:
+            time.sleep(rng.expovariate(1 / args.think_time))
+
+        start_time = time.time()
+        gui_queue.put(
+            {
+                "data": f"Question {turn} of {session_id}",
+                "source": "frontend",
+                "sent_time": start_time,
+                SESSION_KEY: session_id,
+            }
+        )
+
+        result = {"session": session_id, "first_token": None, "reply": None, "audio": None}
+        deadline = start_time + args.turn_timeout
+        while result["reply"] is None or result["audio"] is None:
+            try:
+                data = replies.get(timeout=max(deadline - time.time(), 0))
+            except Empty:
+                break
+
+            # Late audio of the previous turn is ignored
+            now = time.time()
+            if data["source"] == "tts":
+                if data.get("origin_time", None) == start_time and result["audio"] is None:
+                    result["audio"] = now - start_time
+                continue
+
+            if AbstractActionProcess.trace_start(data) != start_time:
+                continue
+            if result["first_token"] is None:
+                result["first_token"] = now - start_time
+            if not AbstractActionProcess.is_partial(data):
+                result["reply"] = now - start_time
+
+        results.append(result)
+
+
+def _route(collector, sessions: dict, stop: threading.Event) -> None:
+    """Pass the replies and the audio events to the queue of their session."""
+    while not stop.is_set():
+        try:
+            data = collector.get(timeout=0.1)
+        except Empty:
+            continue
+
+        replies = sessions.get(data.get(SESSION_KEY, None), None)
+        if replies is not None:
+            replies.put(data)
+
+
+def _stored_messages(store_path: str) -> dict:
+    """Return the number of stored messages and replies of each session."""
+    connection = sqlite3.connect(store_path)
+    rows = connection.execute(
+        "SELECT session_id, source, COUNT(*) FROM messages GROUP BY session_id, source"
+    ).fetchall()
+    connection.close()
+
+    stored = dict()
+    for session_id, source, count in rows:
+        stored.setdefault(session_id, {})[source] = count
+
+    return stored
+
+
+def _jain_index(values: list) -> float | None:
+    """Return Jain's fairness index of the values, 1 if all values are equal."""
+    if len(values) == 0 or sum(values) == 0:
+        return None
+
+    return sum(values) ** 2 / (len(values) * sum(value**2 for value in values))
+
+
+def run(config: dict, args) -> dict:
+    """Run the learners against the stubbed pipeline and return the results."""
+    work_directory = tempfile.mkdtemp(prefix="benchmark-")
+    store_path = os.path.join(work_directory, "sessions.db")
+
+    stub_parameters = {
+        "stub_gpt": {
+            "latency": args.llm_latency,
+            "token_delay": args.token_delay,
+            "reply_words": args.reply_words,
+        },
+        "stub_tts": {"latency": args.tts_latency},
+    }
+    config = stub_config(text_config(config), stub_parameters, store_path)
+    for module in config["modules"].values():
+        if module["type"] == "stub_gpt":
+            module["session_scheduling"] = args.scheduling
+            if args.llm_workers > 1:
+                module["workers"] = args.llm_workers
+
+    pipeline = Pipeline(config)
+    gui = next(
+        module for module in pipeline.processes if module.label == "gui"
+    )
+
+    # The replies and the audio events are also sent to the benchmark
+    collector = pipeline.transport.queue()
+    for module in pipeline.processes:
+        if module.label in ("llm", "tts"):
+            module.add_output_queue(collector)
+
+    supervisor = Supervisor(pipeline)
+    supervisor.start()
+
+    session_ids = [f"learner-{i}" for i in range(args.learners)]
+    sessions = {session_id: queue.Queue() for session_id in session_ids}
+
+    stop = threading.Event()
+    router = threading.Thread(
+        target=_route, args=(collector, sessions, stop), daemon=True
+    )
+    router.start()
+
+    # The noisy session does not wait for its replies
+    for i in range(args.burst):
+        gui.input_queue.put(
+            {"data": f"Burst {i}", "source": "frontend", SESSION_KEY: "noisy"}
+        )
+
+    results = []
+    learners = [
+        threading.Thread(
+            target=_learner,
+            args=(session_id, gui.input_queue, sessions[session_id], args, results),
+        )
+        for session_id in session_ids
+    ]
+
+    start_time = time.time()
+    for learner in learners:
+        learner.start()
+    for learner in learners:
+        learner.join()
+    duration = time.time() - start_time
+
+    stop.set()
+    router.join()
+    supervisor.shutdown()
+
+    answered = [result for result in results if result["reply"] is not None]
+    session_latencies = [
+        statistics.mean(
+            result["reply"] for result in answered if result["session"] == session_id
+        )
+        for session_id in session_ids
+        if any(result["session"] == session_id for result in answered)
+    ]
+
+    # Each learner has to find its questions and the replies in its own history
+    stored = _stored_messages(store_path)
+    isolated = all(
+        stored.get(session_id, {}).get("frontend", 0) == args.turns
+        and stored.get(session_id, {}).get("llm", 0) == args.turns
+        for session_id in session_ids
+    )
+
+    return {
+        "commit": git_commit(),
+        "config": args.config,
+        "parameter": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("config", "output")
+        },
+        "duration_s": duration,
+        "turns": len(results),
+        "answered": len(answered),
+        "turns_per_s": len(answered) / duration if duration > 0 else 0.0,
+        "reply_latency_s": quantiles([result["reply"] for result in answered]),
+        "first_token_latency_s": quantiles(
+            [result["first_token"] for result in answered]
+        ),
+        "first_audio_latency_s": quantiles(
+            [result["audio"] for result in results if result["audio"] is not None]
+        ),
+        "session_reply_latency_s": {
+            "min": min(session_latencies, default=None),
+            "max": max(session_latencies, default=None),
+        },
+        "fairness_index": _jain_index(session_latencies),
+        "sessions_isolated": isolated,
+    }
+
+
+def main() -> None:
+    """Run the load test and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default=DEFAULT_CONFIG)
+    parser.add_argument("--learners", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument(
+        "--think-time", type=float, default=2.0, help="Mean seconds between turns"
+    )
+    parser.add_argument(
+        "--burst", type=int, default=0, help="Messages sent at once by a noisy session"
+    )
+    parser.add_argument("--scheduling", choices=("fifo", "fair"), default="fair")
+    parser.add_argument("--llm-workers", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--reply-words", type=int, default=20)
+    parser.add_argument("--tts-latency", type=float, default=0.15)
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="Append the result as JSON line to this file")
+    args = parser.parse_args()
+
+    result = run(load_config(args.config), args)
+    print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as file:
+            file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
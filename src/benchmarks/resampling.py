@@ -0,0 +1,129 @@
+"""Benchmark and accuracy check of the shared resampling.
+
+Compares `audio.resampling` with the resampling which was previously done inside the
+speech recognition (FFT based) and the OpenAi TTS (polyphase with float factor). The
+accuracy is measured as the signal to noise ratio against an ideal sine at the target
+sampling rate. The accuracy requirements are checked by `tests/test_resampling.py`. Run
+from the src folder with `python -m benchmarks.resampling`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+
+import numpy
+import scipy.signal
+
+from audio.resampling import StreamingResampler, resample
+
+RATE_PAIRS = ((44100, 16000), (48000, 16000), (24000, 44100), (24000, 48000))
+
+
+def _previous_stt_resample(data, in_rate, out_rate):
+    duration = int(len(data) / in_rate)
+    return scipy.signal.resample(data, duration * out_rate)
+
+
+def _previous_tts_resample(data, in_rate, out_rate):
+    resample_scale = out_rate / in_rate
+    return scipy.signal.resample_poly(data, resample_scale * 4, 4)
+
+
+def _streaming_resample(data, in_rate, out_rate, chunk_duration=0.02):
+    resampler = StreamingResampler(in_rate, out_rate)
+    chunk_length = int(chunk_duration * in_rate)
+    chunks = [
+        resampler.process(data[offset : offset + chunk_length])
+        for offset in range(0, len(data), chunk_length)
+    ]
+    chunks.append(resampler.flush())
+    return numpy.concatenate(chunks)
+
+
+def _snr_db(result, in_rate, out_rate, frequency, duration) -> float | None:
+    """Signal to noise ratio against the ideal sine, ignoring the borders of the signal.
+    None is returned if the result is missing a part of the signal."""
+    expected_length = int(duration * out_rate)
+    if len(result) < expected_length * 0.99:
+        return None
+
+    time_axis = numpy.arange(len(result)) / out_rate
+    expected = numpy.sin(2 * numpy.pi * frequency * time_axis)
+
+    border = int(0.05 * out_rate)
+    valid = slice(border, min(len(result), expected_length) - border)
+    noise = result[valid] - expected[valid]
+    return 10 * math.log10(
+        numpy.mean(expected[valid] ** 2) / max(numpy.mean(noise**2), 1e-20)
+    )
+
+
+def _measure(function, data, in_rate, out_rate, repeats, frequency, duration) -> dict:
+    try:
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            result = function(data, in_rate, out_rate)
+        elapsed = (time.perf_counter() - start_time) / repeats
+    except ValueError as error:
+        return {"error": str(error)}
+
+    return {
+        "time_ms": elapsed * 1e3,
+        "realtime_factor": elapsed / duration,
+        "output_length": len(result),
+        "expected_length": math.ceil(len(data) * out_rate / in_rate),
+        "snr_db": _snr_db(numpy.asarray(result), in_rate, out_rate, frequency, duration),
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=5.5)
+    parser.add_argument("--frequency", type=float, default=1000.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    functions = {
+        "previous_stt": _previous_stt_resample,
+        "previous_tts": _previous_tts_resample,
+        "resample": resample,
+        "streaming": _streaming_resample,
+    }
+
+    for in_rate, out_rate in RATE_PAIRS:
+        time_axis = numpy.arange(int(args.duration * in_rate)) / in_rate
+        data = numpy.sin(2 * numpy.pi * args.frequency * time_axis).astype(
+            numpy.float32
+        )
+
+        result = {"in_rate": in_rate, "out_rate": out_rate}
+        for name, function in functions.items():
+            result[name] = _measure(
+                function,
+                data,
+                in_rate,
+                out_rate,
+                args.repeats,
+                args.frequency,
+                args.duration,
+            )
+
+        # The streaming output has to match the resampling of the complete data
+        result["streaming_max_difference"] = float(
+            numpy.max(
+                numpy.abs(
+                    _streaming_resample(data, in_rate, out_rate)
+                    - resample(data, in_rate, out_rate)
+                )
+            )
+        )
+
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Helpers to summarize and label the results of the benchmarks."""
+
+from __future__ import annotations
+
+import os
+import subprocess
+
+# Configuration of main.py, which is used by the benchmarks of the complete pipeline
+DEFAULT_CONFIG = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        os.pardir,
+        os.pardir,
+        "resources",
+        "pipeline.toml",
+    )
+)
+
+
+def percentile(values: list, percentile_rank: float) -> float:
+    """Return the value below which the given percentage of the values lies, without
+    interpolation."""
+    values = sorted(values)
+    return values[min(int(len(values) * percentile_rank / 100), len(values) - 1)]
+
+
+def quantiles(values: list) -> dict | None:
+    """Return the p50, p95, p99 and the maximum of the values, or None without values."""
+    if len(values) == 0:
+        return None
+
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def git_commit() -> str | None:
+    """Return the short hash of the checked out commit, so that runs can be compared."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
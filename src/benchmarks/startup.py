@@ -0,0 +1,138 @@
+"""Benchmark of the application start up.
+
+Measures the import time of the modules used by the main process and lists the heavy
+libraries they load. Afterwards it starts a pipeline of modules with stub models and
+measures the time until all of them are ready. No network access or model download is
+required. Run from the src folder with `python -m benchmarks.startup`.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy
+
+from core.processing import AbstractActionProcess
+from core.transport import DirectTransport
+
+# Modules imported by main.py
+MAIN_MODULES = (
+    "core.processing",
+    "audio.whisper_speech_recognition",
+    "audio.openai_tts",
+    "gui.eel_gui",
+    "text.gpt4o_mini",
+)
+
+# Libraries which should only be loaded by the processes which use them
+HEAVY_LIBRARIES = ("torch", "whisper", "openai", "scipy", "eel", "gevent", "transformers")
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+try:
+    import {module}
+    error = None
+except Exception as exception:
+    error = repr(exception)
+print(json.dumps({{
+    "import_s": time.perf_counter() - start_time,
+    "error": error,
+    "heavy_libraries": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+class StubModelProcess(AbstractActionProcess):
+    """Module whose warm up simulates loading a model."""
+
+    def __init__(self, manager, load_time: float, model_size: int, output_queues=()):
+        """Constructor.
+
+        Args:
+            load_time (float): Time in seconds which the model takes to load.
+            model_size (int): Number of float32 weights of the stub model.
+        """
+        self.load_time = load_time
+        self.model_size = model_size
+        self.model = None
+        super().__init__(manager, "other", output_queues=output_queues)
+
+    def warm_up(self):
+        start_time = time.time()
+        self.model = numpy.ones(self.model_size, dtype=numpy.float32)
+        time.sleep(max(self.load_time - (time.time() - start_time), 0))
+
+    def process(self, data_in):
+        return self.create_output_data(float(self.model[0]) * data_in["data"])
+
+    def clean_up(self):
+        del self.model
+
+
+def _measure_import(module: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SCRIPT.format(module=module, heavy=HEAVY_LIBRARIES)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return {"module": module, **json.loads(output.splitlines()[-1])}
+
+
+def _measure_warm_up(module_count: int, load_time: float, model_size: int) -> dict:
+    transport = DirectTransport()
+
+    modules = [
+        StubModelProcess(transport, load_time, model_size) for _ in range(module_count)
+    ]
+    for module, next_module in zip(modules, modules[1:]):
+        module.connect_output_to(next_module)
+
+    result_queue = transport.queue()
+    modules[-1].add_output_queue(result_queue)
+
+    start_time = time.time()
+    for module in modules:
+        module.start()
+
+    for module in modules:
+        module.wait_ready()
+    ready_time = time.time()
+
+    # The first message passes all modules once they are ready
+    modules[0].input_queue.put({"data": 1.0})
+    result_queue.get()
+    first_output_time = time.time()
+
+    for module in modules:
+        module.terminate()
+        module.join()
+
+    return {
+        "modules": module_count,
+        "load_time_s": load_time,
+        "serial_load_s": module_count * load_time,
+        "ready_s": ready_time - start_time,
+        "first_output_s": first_output_time - start_time,
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modules", type=int, default=5)
+    parser.add_argument("--load-time", type=float, default=1.0)
+    parser.add_argument("--model-size", type=int, default=2**24)
+    args = parser.parse_args()
+
+    for module in MAIN_MODULES:
+        print(json.dumps(_measure_import(module)))
+
+    print(json.dumps(_measure_warm_up(args.modules, args.load_time, args.model_size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Deterministic stub engines which replace Whisper and the OpenAI API in the benchmarks.
+
+The stub modules are subclasses of the real modules, so the messages pass the same code as
+in the application, only the model or API call is replaced by a wait with a configurable
+latency.
+"""
+
+from __future__ import annotations
+
+import time
+from types import SimpleNamespace
+
+import numpy
+
+from audio.openai_tts import OpenAITTS
+from audio.tts_pipeline import NullSink
+from audio.whisper_speech_recognition import WhisperSpeechRecognitionModule
+from text.gpt4o_mini import GPT4oMiniTextProcessingModule
+
+
+class StubWhisperModule(WhisperSpeechRecognitionModule):
+    """Speech recognition which returns a fixed transcription after a delay."""
+
+    def __init__(
+        self,
+        manager,
+        input_fs,
+        output_queues=(),
+        latency: float = 0.1,
+        real_time_factor: float = 0.05,
+        text: str = "Where is the train station?",
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            latency (float, optional): Fixed time of each decoding in seconds. Defaults to 0.1.
+            real_time_factor (float, optional): Additional decoding time per second of audio.
+                                                Defaults to 0.05.
+            text (str, optional): The transcription of all utterances.
+        """
+        self.latency = latency
+        self.real_time_factor = real_time_factor
+        self.text = text
+        super().__init__(manager, input_fs, output_queues=output_queues, **kwargs)
+
+    def warm_up(self):
+        pass
+
+    def _decode(self, segments: list) -> list:
+        # The audio is resampled like for the real model, which also frees the shared memory
+        duration = sum(len(self._resample(data)) for data in segments) / self._target_fs
+        time.sleep(self.latency + self.real_time_factor * duration)
+
+        return [SimpleNamespace(text=self.text, language="en") for _ in segments]
+
+
+class _StubCompletions:
+    def __init__(self, latency: float, token_delay: float, reply_words: int):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.reply_words = reply_words
+
+    def create(self, model: str, messages: list, stream: bool = False):
+        """Return the reply in the form of the chat completion API."""
+        time.sleep(self.latency)
+
+        words = [f"Word{i}" for i in range(self.reply_words - 1)] + ["end."]
+        if stream:
+            return self._stream(words)
+
+        time.sleep(self.token_delay * len(words))
+        message = SimpleNamespace(role="assistant", content=" ".join(words))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def _stream(self, words: list):
+        for i, word in enumerate(words):
+            time.sleep(self.token_delay)
+            delta = SimpleNamespace(content=word if i == 0 else " " + word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class _StubSpeech:
+    def __init__(self, latency: float, seconds_per_character: float, sampling_rate: int):
+        self.latency = latency
+        self.seconds_per_character = seconds_per_character
+        self.sampling_rate = sampling_rate
+
+    def create(self, model: str, voice: str, response_format: str, input: str):
+        """Return silent 16 bit pcm audio in the form of the speech API."""
+        # pylint: disable=redefined-builtin
+        time.sleep(self.latency)
+
+        samples = int(len(input) * self.seconds_per_character * self.sampling_rate)
+        return SimpleNamespace(content=numpy.zeros(samples, dtype=numpy.int16).tobytes())
+
+
+class StubOpenAIClient:
+    """Client with the chat completion and speech endpoints of the OpenAI client."""
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        token_delay: float = 0.01,
+        reply_words: int = 20,
+        speech_latency: float = 0.1,
+        seconds_per_character: float = 0.05,
+    ):
+        """Constructor.
+
+        Args:
+            latency (float, optional): Time until the first token in seconds. Defaults to 0.2.
+            token_delay (float, optional): Time between two tokens in seconds. Defaults to 0.01.
+            reply_words (int, optional): Number of words of each reply. Defaults to 20.
+            speech_latency (float, optional): Time of each speech request in seconds.
+                                              Defaults to 0.1.
+            seconds_per_character (float, optional): Duration of the speech per character.
+                                              Defaults to 0.05.
+        """
+        self.chat = SimpleNamespace(
+            completions=_StubCompletions(latency, token_delay, reply_words)
+        )
+        self.audio = SimpleNamespace(
+            speech=_StubSpeech(
+                speech_latency, seconds_per_character, OpenAITTS.SAMPLING_RATE
+            )
+        )
+
+    def close(self) -> None:
+        pass
+
+
+class StubGPTModule(GPT4oMiniTextProcessingModule):
+    """GPT-4o mini module whose replies are created by the stub client."""
+
+    def __init__(
+        self,
+        manager,
+        output_queues=(),
+        latency: float = 0.2,
+        token_delay: float = 0.01,
+        reply_words: int = 20,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            latency (float, optional): Time until the first token in seconds. Defaults to 0.2.
+            token_delay (float, optional): Time between two tokens in seconds. Defaults to 0.01.
+            reply_words (int, optional): Number of words of each reply. Defaults to 20.
+        """
+        self.latency = latency
+        self.token_delay = token_delay
+        self.reply_words = reply_words
+        super().__init__(manager, output_queues=output_queues, **kwargs)
+
+    def create_client(self):
+        return StubOpenAIClient(self.latency, self.token_delay, self.reply_words)
+
+
+class StubOpenAITTS(OpenAITTS):
+    """OpenAI TTS module whose audio is created by the stub client and played by a sink
+    which only simulates the playback time.
+
+    Each sentence whose audio was written is sent as output, so that the benchmark can
+    measure the latency until the audio output. The same applies to a cancelled playback.
+    """
+
+    def __init__(
+        self,
+        manager,
+        output_queues=(),
+        latency: float = 0.1,
+        seconds_per_character: float = 0.05,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            latency (float, optional): Time of each speech request in seconds. Defaults to 0.1.
+            seconds_per_character (float, optional): Duration of the speech per character.
+                                              Defaults to 0.05.
+        """
+        self.latency = latency
+        self.seconds_per_character = seconds_per_character
+        kwargs.setdefault("use_cache", False)
+        super().__init__(manager, output_queues=output_queues, voice="alloy", **kwargs)
+
+    def create_client(self):
+        return StubOpenAIClient(
+            speech_latency=self.latency,
+            seconds_per_character=self.seconds_per_character,
+        )
+
+    def create_sink(self):
+        return NullSink(self.SAMPLING_RATE, realtime=True)
+
+    def create_session_sink(self, session_id):
+        # The remote sessions are simulated like the local one
+        return self.create_sink()
+
+    def _record_written(
+        self, submit_time: float, origin_time: float = None, session_id=None
+    ) -> None:
+        super()._record_written(submit_time, origin_time, session_id)
+        self.send_output(
+            self.create_output_data(
+                "audio", origin_time=origin_time, session_id=session_id
+            )
+        )
+
+    def on_cancel(self, session_id, before):
+        super().on_cancel(session_id, before)
+        # Time from the detected speech until the playback was stopped
+        self.send_output(
+            self.create_output_data(
+                "cancelled", cancel_latency=time.time() - before, session_id=session_id
+            )
+        )
@@ -0,0 +1,112 @@
+"""Benchmark of modules with several workers.
+
+A stub module processes messages of several sessions either by waiting, like a module which
+calls an API, or by computing, like a module which runs a model on the CPU. For each number
+of workers the benchmark reports the throughput and checks that the output of each session
+arrives in the order of its input. Run from the src folder with
+`python -m benchmarks.worker_pool`.
+"""
+
+import argparse
+import json
+import time
+
+from core.processing import AbstractActionProcess
+from core.transport import DirectTransport
+
+
+class StubWorkloadProcess(AbstractActionProcess):
+    """Module which waits or computes for a fixed time per message."""
+
+    def __init__(
+        self, manager, workload: str, process_time: float, output_queues=()
+    ):
+        """Constructor.
+
+        Args:
+            workload (str): "io" to wait and "cpu" to compute during the processing.
+            process_time (float): Processing time of each message in seconds.
+        """
+        self.workload = workload
+        self.process_time = process_time
+        super().__init__(manager, "other", output_queues=output_queues)
+
+    def process(self, data_in):
+        if self.workload == "io":
+            time.sleep(self.process_time)
+        else:
+            end_time = time.process_time() + self.process_time
+            while time.process_time() < end_time:
+                pass
+
+        return self.create_output_data(data_in["data"])
+
+    def clean_up(self):
+        pass
+
+
+def _run(
+    workload: str, workers: int, mode: str, messages: int, sessions: int, process_time: float
+) -> dict:
+    transport = DirectTransport()
+
+    module = StubWorkloadProcess(transport, workload, process_time)
+    module.configure_workers(workers, mode)
+
+    result_queue = transport.queue()
+    module.add_output_queue(result_queue)
+
+    module.start()
+    module.wait_ready()
+
+    start_time = time.time()
+    for i in range(messages):
+        module.input_queue.put({"data": i, "session_id": i % sessions})
+
+    received = dict()
+    for _ in range(messages):
+        result = result_queue.get()
+        received.setdefault(result["session_id"], []).append(result["data"])
+    duration = time.time() - start_time
+
+    module.terminate()
+    module.join()
+
+    return {
+        "workload": workload,
+        "mode": mode,
+        "workers": workers,
+        "messages": messages,
+        "duration_s": duration,
+        "messages_per_s": messages / duration,
+        "ordered": all(data == sorted(data) for data in received.values()),
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=64)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--process-time", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    for workload, mode in (("io", "thread"), ("io", "process"), ("cpu", "process")):
+        for workers in args.workers:
+            print(
+                json.dumps(
+                    _run(
+                        workload,
+                        workers,
+                        mode,
+                        args.messages,
+                        args.sessions,
+                        args.process_time,
+                    )
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Module containing the base class of processing modules whose `process` is a coroutine.
+
+The messages are processed concurrently inside one event loop, which suits modules that
+mostly wait for an API, e.g. several learners whose requests are sent through one pooled
+HTTP client. The output is sent in the order of the input messages of each session.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import random
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable
+
+from core.processing import AbstractActionProcess
+from core.workers import SESSION_KEY, OrderedOutput
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Return the delay before a retry with exponential backoff and full jitter, so that
+    concurrent requests which failed together are not retried together.
+
+    Args:
+        attempt (int): Number of the failed attempt, starting at 0.
+        base_delay (float): Maximal delay after the first attempt in seconds.
+        max_delay (float): Upper bound of the delay in seconds.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+class AbstractAsyncActionProcess(AbstractActionProcess):
+    """
+    This class represent an abstract processing module which runs inside its own process
+    and processes several messages concurrently inside an event loop.
+    """
+
+    # Maximal number of messages which are processed concurrently
+    max_concurrency = 8
+
+    # Retries of `retry`, the delay doubles with each attempt
+    max_retries = 3
+    retry_base_delay = 0.5
+    retry_max_delay = 8.0
+
+    # Errors after which `retry` calls the function again. Modules can set the errors of
+    # their client library during the warm up.
+    retryable_errors: tuple = (ConnectionError, TimeoutError)
+
+    # Event loop of the process, which is set while the messages are processed
+    _event_loop: asyncio.AbstractEventLoop = None
+
+    def configure_workers(self, workers: int, mode: str = "thread") -> None:
+        raise ValueError(
+            f"{self.__class__.__name__} processes its messages concurrently inside an event "
+            "loop, use max_concurrency instead of workers"
+        )
+
+    def _run(self, **kwargs) -> None:
+        asyncio.run(self._run_async())
+
+        self.clean_up()
+
+    async def _run_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        output = OrderedOutput(self.send_output, self._record_done)
+
+        # The input queue is read by its own thread, so that the loop is not blocked
+        reader = ThreadPoolExecutor(1)
+
+        # Last task of each session, if the messages of a session are processed serially
+        previous_tasks = dict()
+        # Running tasks with their input message, so that cancelled turns can be aborted
+        tasks = self._tasks = dict()
+
+        self._event_loop = loop
+
+        def untrack(task: asyncio.Task) -> None:
+            tasks.pop(task, None)
+
+        def forget(session, task: asyncio.Task) -> None:
+            if previous_tasks.get(session, None) is task:
+                del previous_tasks[session]
+
+        while not self._e_stop_process.is_set():
+            batch = [
+                in_data
+                for in_data in await loop.run_in_executor(reader, self._get_batch)
+                if not self._is_rejected_partial(in_data)
+                and not self._is_stale(in_data)
+                and not self._is_superseded(in_data)
+            ]
+
+            if len(batch) == 0:
+                if self._is_orphaned():
+                    break
+                continue
+
+            self._record_dequeue(batch)
+
+            for in_data in batch:
+                # Limits the concurrent requests and the number of waiting messages
+                await semaphore.acquire()
+
+                session = in_data.get(SESSION_KEY, None)
+                task = asyncio.create_task(
+                    self._handle(
+                        output.add(in_data),
+                        output,
+                        semaphore,
+                        previous_tasks.get(session, None),
+                    )
+                )
+                tasks[task] = in_data
+                task.add_done_callback(untrack)
+
+                if self.serialize_sessions:
+                    previous_tasks[session] = task
+                    task.add_done_callback(functools.partial(forget, session))
+
+        if tasks:
+            await asyncio.wait(list(tasks))
+
+        await self.async_clean_up()
+        reader.shutdown(wait=False)
+
+    async def _handle(
+        self,
+        entry,
+        output: OrderedOutput,
+        semaphore: asyncio.Semaphore,
+        previous_task: asyncio.Task = None,
+    ) -> None:
+        """Process one message and pass its output in order to the connected modules."""
+        try:
+            if previous_task is not None:
+                await asyncio.wait((previous_task,))
+
+            out_data = await self.process(entry.in_data)
+
+            if out_data is None:
+                return
+
+            # Streaming modules return an async iterator over the partial messages
+            if isinstance(out_data, dict):
+                output.emit(entry, out_data)
+            elif hasattr(out_data, "__aiter__"):
+                async for data in out_data:
+                    output.emit(entry, data)
+            else:
+                for data in out_data:
+                    output.emit(entry, data)
+        except asyncio.CancelledError:
+            # The turn was cancelled, the output which was already sent is kept
+            self.logger.debug("Cancelled the processing of a message")
+            self.metrics.increment("cancelled_requests_total")
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.logger.exception("Failed to process message")
+        finally:
+            output.finish(entry)
+            semaphore.release()
+
+    def on_cancel(self, session_id: str, before: float) -> None:
+        # The tasks belong to the event loop, the control thread only schedules their
+        # cancellation
+        if self._event_loop is not None:
+            self._event_loop.call_soon_threadsafe(self._cancel_tasks)
+
+    def _cancel_tasks(self) -> None:
+        """Cancel the running tasks of cancelled turns."""
+        for task, in_data in list(self._tasks.items()):
+            if self.is_cancelled(in_data):
+                task.cancel()
+
+    async def retry(self, function: Callable[..., Awaitable], *args, **kwargs):
+        """Await the coroutine function and call it again after a retryable error.
+
+        Args:
+            function (Callable[..., Awaitable]): The coroutine function, e.g. a request.
+            args: Positional arguments of the function.
+            kwargs: Keyword arguments of the function.
+
+        Returns:
+            The result of the function.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await function(*args, **kwargs)
+            except self.retryable_errors as error:
+                if attempt == self.max_retries:
+                    raise
+
+                delay = backoff_delay(
+                    attempt, self.retry_base_delay, self.retry_max_delay
+                )
+                self.logger.warning(
+                    f"Attempt {attempt + 1} failed with {error!r}, retry in {delay:.2f}s"
+                )
+                self.metrics.increment("retries_total")
+
+                await asyncio.sleep(delay)
+
+        return None
+
+    @abstractmethod
+    async def process(self, data_in: dict) -> dict | AsyncIterator[dict] | None:
+        """Coroutine which processes the data of one message, see
+        `AbstractActionProcess.process`. Streaming modules can return an async iterator over
+        the messages created with `create_stream_data`.
+
+        Several messages are processed concurrently, so the coroutine should await its
+        requests instead of blocking the event loop.
+        """
+
+    async def async_clean_up(self) -> None:
+        """Close the resources which require the event loop, like an async client. It is
+        called before `clean_up`."""
@@ -0,0 +1,53 @@
+"""Module containing the control channel of the pipeline.
+
+Besides its input queue each processing module has a control queue, which is read by a
+thread of the module, so that commands are handled immediately even while a message is
+processed. The `ControlBus` sends a command to the control queues of all modules.
+"""
+
+from __future__ import annotations
+
+import time
+
+
+class ControlBus:
+    """Sends commands to the control queues of the processing modules."""
+
+    def __init__(self, queues=()):
+        """Constructor.
+
+        Args:
+            queues (Iterable, optional): Control queues which receive the commands.
+        """
+        self.queues = list(queues)
+
+    def add(self, module) -> None:
+        """Send the commands also to the control queue of the module."""
+        self.queues.append(module.control_queue)
+
+    def send(self, command: dict) -> None:
+        """Send a command to all modules. The key "command" contains its name."""
+        for queue in self.queues:
+            queue.put(command)
+
+    def cancel(
+        self, session_id: str = None, turn_id: str = None, before: float = None
+    ) -> None:
+        """Cancel the turns of a session which started before the given time, e.g. because
+        the learner started to speak again. The modules drop the superseded messages and
+        abort their work on them.
+
+        Args:
+            session_id (str, optional): The session whose turns are cancelled.
+            turn_id (str, optional): Id of the new turn, which is only used for logging.
+            before (float, optional): Messages whose pipeline input was sent before this
+                                      time are cancelled. Defaults to now.
+        """
+        self.send(
+            {
+                "command": "cancel",
+                "session_id": session_id,
+                "turn_id": turn_id,
+                "time": before if before is not None else time.time(),
+            }
+        )
@@ -0,0 +1,293 @@
+"""Module containing the envelope of the messages sent between the processing modules.
+
+The modules exchange dicts, whose metadata grows with every stage. A `Message` keeps the
+fields every message carries in a fixed header: trace id, session, source, language,
+timestamps, the stream position and the kind of the payload. All other keys are kept in
+`extra`.
+
+`encode` turns a message into a list of frames, which can be sent one after another
+through a pipe. The header is packed with `struct`, text is encoded as UTF-8 and numpy
+arrays of plain dtypes, e.g. PCM audio, are passed as memoryview of the array, so they are
+written to the pipe without being copied into a pickle. Other payloads, including dates and
+structured arrays, are pickled with protocol 5, whose out-of-band buffers become frames of
+their own.
+"""
+
+from __future__ import annotations
+
+import enum
+import math
+import pickle
+import struct
+
+import numpy
+
+
+class PayloadKind(enum.IntEnum):
+    """Kind of the data of a message, which decides how it is encoded."""
+
+    NONE = 0
+    TEXT = 1
+    ARRAY = 2
+    BYTES = 3
+    OBJECT = 4
+
+
+# Version, payload kind, flags, number of frames, sequence, sent time, deadline
+_HEADER = struct.Struct("<BBBHqdd")
+# Length of the UTF-8 encoded strings of the header
+_LENGTH = struct.Struct("<I")
+_NO_STRING = 0xFFFFFFFF
+_VERSION = 2
+
+_PARTIAL = 1
+_PARTIAL_SET = 2
+_FINAL = 4
+_FINAL_SET = 8
+_SEQUENCE_SET = 16
+
+_STRING_FIELDS = ("trace_id", "session_id", "source", "language", "message_id")
+_TIME_FIELDS = ("sent_time", "deadline")
+
+
+class Message:
+    """Envelope of the data sent between the processing modules.
+
+    A header field which is None was not set. Values of header fields with another type than
+    expected, e.g. an integer session id, are kept in `extra`, so that `to_dict` returns the
+    original dict.
+    """
+
+    __slots__ = (
+        "data",
+        "kind",
+        "trace_id",
+        "session_id",
+        "source",
+        "language",
+        "message_id",
+        "sequence",
+        "partial",
+        "final",
+        "sent_time",
+        "deadline",
+        "extra",
+    )
+
+    def __init__(
+        self,
+        data=None,
+        trace_id: str = None,
+        session_id: str = None,
+        source: str = None,
+        language: str = None,
+        message_id: str = None,
+        sequence: int = None,
+        partial: bool = None,
+        final: bool = None,
+        sent_time: float = None,
+        deadline: float = None,
+        extra: dict = None,
+    ):
+        """Constructor.
+
+        Args:
+            data (optional): The payload. Its kind is derived from the type.
+            trace_id (str, optional): Id of the pipeline input the message belongs to.
+            session_id (str, optional): The session of the message.
+            source (str, optional): Name of the module which sent the message.
+            language (str, optional): Language of the text or speech.
+            message_id (str, optional): Id of the streamed output the message belongs to.
+            sequence (int, optional): Position of the message in the streamed output.
+            partial (bool, optional): Whether the message is a partial result.
+            final (bool, optional): Whether the message is the last of the streamed output.
+            sent_time (float, optional): Time the message was sent.
+            deadline (float, optional): Time after which the message is stale.
+            extra (dict, optional): All other metadata of the message.
+        """
+        self.data = data
+        self.kind = payload_kind(data)
+        self.trace_id = trace_id
+        self.session_id = session_id
+        self.source = source
+        self.language = language
+        self.message_id = message_id
+        self.sequence = sequence
+        self.partial = partial
+        self.final = final
+        self.sent_time = sent_time
+        self.deadline = deadline
+        self.extra = extra if extra is not None else {}
+
+    def __repr__(self) -> str:
+        return (
+            f"Message(kind={self.kind.name}, trace_id={self.trace_id}, "
+            f"session_id={self.session_id}, source={self.source}, "
+            f"sequence={self.sequence}, extra={sorted(self.extra)})"
+        )
+
+    @classmethod
+    def from_dict(cls, data_in: dict) -> Message:
+        """Create the envelope of a message dict of the processing modules."""
+        extra = dict(data_in)
+        fields = {"data": extra.pop("data", None)}
+
+        for key in _STRING_FIELDS:
+            if isinstance(extra.get(key), str):
+                fields[key] = extra.pop(key)
+        for key in _TIME_FIELDS:
+            if isinstance(extra.get(key), float):
+                fields[key] = extra.pop(key)
+        for key in ("partial", "final"):
+            if isinstance(extra.get(key), bool):
+                fields[key] = extra.pop(key)
+        if type(extra.get("sequence")) is int:
+            fields["sequence"] = extra.pop("sequence")
+
+        return cls(extra=extra, **fields)
+
+    def to_dict(self) -> dict:
+        """Return the message dict used by the processing modules."""
+        data_out = {"data": self.data}
+        for key in _STRING_FIELDS + _TIME_FIELDS + ("sequence", "partial", "final"):
+            value = getattr(self, key)
+            if value is not None:
+                data_out[key] = value
+
+        data_out.update(self.extra)
+        return data_out
+
+
+def payload_kind(data) -> PayloadKind:
+    """Return the kind of a payload."""
+    if data is None:
+        return PayloadKind.NONE
+    if isinstance(data, str):
+        return PayloadKind.TEXT
+    if type(data) is numpy.ndarray and _is_buffer_dtype(data.dtype):
+        return PayloadKind.ARRAY
+    if isinstance(data, bytes):
+        return PayloadKind.BYTES
+
+    return PayloadKind.OBJECT
+
+
+def _is_buffer_dtype(dtype: numpy.dtype) -> bool:
+    """Return true if arrays of the dtype can be sent as raw buffer and restored from its
+    dtype string. Objects, dates, time deltas and structured dtypes are pickled."""
+    return not dtype.hasobject and dtype.kind not in "Mm" and dtype.fields is None
+
+
+def _pack_string(value: str | None) -> bytes:
+    if value is None:
+        return _LENGTH.pack(_NO_STRING)
+
+    encoded = value.encode("utf-8")
+    return _LENGTH.pack(len(encoded)) + encoded
+
+
+def _unpack_string(header, offset: int) -> tuple:
+    (length,) = _LENGTH.unpack_from(header, offset)
+    offset += _LENGTH.size
+    if length == _NO_STRING:
+        return None, offset
+
+    return bytes(header[offset : offset + length]).decode("utf-8"), offset + length
+
+
+def encode(message: Message) -> list:
+    """Return the frames of a message.
+
+    The first frame is the header, the second the pickled extra metadata, which is empty
+    without metadata, and the remaining frames contain the payload. Array payloads are
+    not copied, so they must not be changed until the frames were sent.
+    """
+    flags = 0
+    if message.partial is not None:
+        flags |= _PARTIAL_SET | (_PARTIAL if message.partial else 0)
+    if message.final is not None:
+        flags |= _FINAL_SET | (_FINAL if message.final else 0)
+    if message.sequence is not None:
+        flags |= _SEQUENCE_SET
+
+    data = message.data
+    payload_info = b""
+    if message.kind == PayloadKind.TEXT:
+        payload = [data.encode("utf-8")]
+    elif message.kind == PayloadKind.ARRAY:
+        # Unlike ascontiguousarray, require keeps the shape of 0-d arrays
+        array = numpy.require(data, requirements="C")
+        payload_info = _pack_string(array.dtype.str) + struct.pack(
+            f"<B{array.ndim}q", array.ndim, *array.shape
+        )
+        payload = [memoryview(array.reshape(-1)).cast("B")]
+    elif message.kind == PayloadKind.BYTES:
+        payload = [data]
+    elif message.kind == PayloadKind.OBJECT:
+        buffers = []
+        payload = [pickle.dumps(data, protocol=5, buffer_callback=buffers.append)]
+        payload.extend(buffer.raw() for buffer in buffers)
+    else:
+        payload = []
+
+    header = [
+        _HEADER.pack(
+            _VERSION,
+            message.kind,
+            flags,
+            len(payload) + 2,
+            message.sequence if message.sequence is not None else 0,
+            message.sent_time if message.sent_time is not None else math.nan,
+            message.deadline if message.deadline is not None else math.nan,
+        )
+    ]
+    header.extend(_pack_string(getattr(message, key)) for key in _STRING_FIELDS)
+    header.append(payload_info)
+
+    extra = pickle.dumps(message.extra, protocol=5) if message.extra else b""
+    return [b"".join(header), extra] + payload
+
+
+def frame_count(header) -> int:
+    """Return the number of frames of a message from its header frame."""
+    return _HEADER.unpack_from(header)[3]
+
+
+def decode(frames: list) -> Message:
+    """Create a message from its frames. Arrays share the memory of their frame."""
+    header = frames[0]
+    version, kind, flags, count, sequence, sent_time, deadline = _HEADER.unpack_from(
+        header
+    )
+    if version != _VERSION or count != len(frames):
+        raise ValueError(f"Invalid message header with version {version}")
+
+    message = Message.__new__(Message)
+    offset = _HEADER.size
+    for key in _STRING_FIELDS:
+        value, offset = _unpack_string(header, offset)
+        setattr(message, key, value)
+
+    message.kind = PayloadKind(kind)
+    message.sequence = sequence if flags & _SEQUENCE_SET else None
+    message.partial = bool(flags & _PARTIAL) if flags & _PARTIAL_SET else None
+    message.final = bool(flags & _FINAL) if flags & _FINAL_SET else None
+    message.sent_time = None if math.isnan(sent_time) else sent_time
+    message.deadline = None if math.isnan(deadline) else deadline
+    message.extra = pickle.loads(frames[1]) if len(frames[1]) else {}
+
+    if message.kind == PayloadKind.TEXT:
+        message.data = bytes(frames[2]).decode("utf-8")
+    elif message.kind == PayloadKind.ARRAY:
+        dtype, offset = _unpack_string(header, offset)
+        (ndim,) = struct.unpack_from("<B", header, offset)
+        shape = struct.unpack_from(f"<{ndim}q", header, offset + 1)
+        message.data = numpy.frombuffer(frames[2], dtype=dtype).reshape(shape)
+    elif message.kind == PayloadKind.BYTES:
+        message.data = bytes(frames[2])
+    elif message.kind == PayloadKind.OBJECT:
+        message.data = pickle.loads(frames[2], buffers=frames[3:])
+    else:
+        message.data = None
+
+    return message
@@ -0,0 +1,300 @@
+"""Module containing the latency metrics of the processing modules.
+
+Each module keeps histograms of the time its messages wait inside the input queue and the
+time until their processing is done. The metrics are periodically written as JSON and in
+the Prometheus text format into the directory given by the METRICS_DIRECTORY environment
+variable, from where they can be collected by the textfile collector of the node exporter.
+
+Run `python -m core.metrics <directory>` from the src folder to print a summary of the
+dumped metrics of all modules.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+# Upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+class Histogram:
+    """Histogram with fixed buckets, like the Prometheus histogram."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """Constructor.
+
+        Args:
+            buckets (tuple, optional): Ascending upper bounds of the buckets.
+                                       Defaults to DEFAULT_BUCKETS.
+        """
+        self.buckets = tuple(buckets)
+        # The last count is the bucket for all values above the largest bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add a value to the histogram."""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, quantile: float) -> float:
+        """Return an estimate of the quantile. Like `histogram_quantile` of Prometheus, the
+        values are assumed to be evenly distributed inside their bucket, whose bounds are
+        limited by the smallest and the largest observed value."""
+        if self.count == 0:
+            return 0.0
+
+        rank = quantile * self.count
+        cumulative = 0
+        lower = self.min if self.min is not None else 0.0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            upper = min(bound, self.max)
+            if count > 0 and cumulative + count >= rank:
+                fraction = max(rank - cumulative, 0) / count
+                return lower + (upper - lower) * fraction
+
+            cumulative += count
+            lower = max(upper, lower)
+
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Return the histogram as JSON serializable dict."""
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Histogram:
+        """Restore a histogram from `to_dict`."""
+        histogram = cls(data["buckets"])
+        histogram.counts = list(data["counts"])
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class ModuleMetrics:
+    """Histograms and counters of one processing module. The methods are thread safe."""
+
+    def __init__(self, module: str, label: str):
+        """Constructor.
+
+        Args:
+            module (str): Name of the module, e.g. its class name.
+            label (str): Label of the module, e.g. "stt".
+        """
+        self.module = module
+        self.label = label
+
+        self.histograms = dict()
+        self.counters = dict()
+        self.gauges = dict()
+
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float) -> None:
+        """Add a value to the histogram with the given name."""
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Increase the counter with the given name."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name: str, value: float) -> None:
+        """Set the gauge with the given name."""
+        with self._lock:
+            self.gauges[name] = value
+
+    def to_dict(self) -> dict:
+        """Return all metrics as JSON serializable dict."""
+        with self._lock:
+            return {
+                "module": self.module,
+                "label": self.label,
+                "time": time.time(),
+                "histograms": {
+                    name: histogram.to_dict()
+                    for name, histogram in self.histograms.items()
+                },
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def to_prometheus(self) -> str:
+        """Return all metrics in the Prometheus text format."""
+        data = self.to_dict()
+        labels = f'module="{self.module}",label="{self.label}"'
+
+        lines = []
+        for name, histogram in data["histograms"].items():
+            metric = f"pipeline_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+
+            cumulative = 0
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+            lines.append(f"{metric}_sum{{{labels}}} {histogram['sum']}")
+            lines.append(f"{metric}_count{{{labels}}} {histogram['count']}")
+
+        for name, value in data["counters"].items():
+            lines.append(f"# TYPE pipeline_{name} counter")
+            lines.append(f"pipeline_{name}{{{labels}}} {value}")
+
+        for name, value in data["gauges"].items():
+            lines.append(f"# TYPE pipeline_{name} gauge")
+            lines.append(f"pipeline_{name}{{{labels}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Writes the metrics of a module periodically into a directory."""
+
+    def __init__(self, metrics: ModuleMetrics, directory: str, interval: float = 10.0):
+        """Constructor.
+
+        Args:
+            metrics (ModuleMetrics): The exported metrics.
+            directory (str): Directory of the JSON and Prometheus files.
+            interval (float, optional): Time between two dumps in seconds. Defaults to 10.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.metrics = metrics
+        self.directory = directory
+        self.interval = interval
+
+        self._path = os.path.join(
+            directory, f"{metrics.label}-{metrics.module}-{os.getpid()}"
+        )
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        """Start the periodic dump."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the periodic dump and write the metrics a last time."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.dump()
+
+    def dump(self) -> None:
+        """Write the current metrics."""
+        # The files are replaced atomically, so a reader never sees a partial file
+        for extension, content in (
+            ("json", json.dumps(self.metrics.to_dict())),
+            ("prom", self.metrics.to_prometheus()),
+        ):
+            temporary_path = f"{self._path}.{extension}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                file.write(content)
+            os.replace(temporary_path, f"{self._path}.{extension}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.dump()
+            except OSError:
+                self.logger.exception("Failed to write the metrics")
+
+
+def summarize(directory: str) -> list:
+    """Return the quantiles of all histograms of the JSON dumps inside the directory."""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+
+        for name, histogram in data["histograms"].items():
+            rows.append(
+                {
+                    "label": data["label"],
+                    "module": data["module"],
+                    "metric": name,
+                    "count": histogram["count"],
+                    "mean_s": histogram["sum"] / max(histogram["count"], 1),
+                    "p50_s": histogram["p50"],
+                    "p95_s": histogram["p95"],
+                    "max_s": histogram["max"],
+                }
+            )
+
+    return rows
+
+
+def main() -> None:
+    """Print a summary of the dumped metrics."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "directory", nargs="?", default=os.environ.get("METRICS_DIRECTORY")
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'label':<6} {'module':<40} {'metric':<28} {'count':>7} {'mean':>8} "
+        f"{'p50':>8} {'p95':>8}"
+    )
+    for row in summarize(args.directory):
+        print(
+            f"{row['label']:<6} {row['module']:<40} {row['metric']:<28} {row['count']:>7} "
+            f"{row['mean_s']:>8.3f} {row['p50_s']:>8.3f} {row['p95_s']:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
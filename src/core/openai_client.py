@@ -0,0 +1,43 @@
+"""Module containing the helper to create the OpenAI client of the async API modules.
+
+The API address is taken from the OPENAI_BASE_URL environment variable, so the modules can
+be run against a local mock server, see `benchmarks.mock_openai`.
+"""
+
+
+def create_async_client(max_connections: int = 16, timeout: float = 60.0):
+    """Return an `AsyncOpenAI` client whose HTTP connections are kept open and shared by all
+    concurrent requests of the module. The client does not retry itself, the retries are
+    done by `AbstractAsyncActionProcess.retry`.
+
+    Args:
+        max_connections (int, optional): Maximal number of open connections. Defaults to 16.
+        timeout (float, optional): Timeout of a request in seconds. Defaults to 60.
+    """
+    # pylint: disable=import-outside-toplevel
+    import httpx
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(
+        max_retries=0,
+        timeout=timeout,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=timeout,
+        ),
+    )
+
+
+def retryable_errors() -> tuple:
+    """Return the errors of the OpenAI client after which a request can be retried."""
+    # pylint: disable=import-outside-toplevel
+    import openai
+
+    return (
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
@@ -3,15 +3,22 @@
 from __future__ import annotations
 
 import logging
+import os
+import signal
+import threading
+import time
+import uuid
 
 from abc import abstractmethod
-from multiprocessing import Queue
+from collections import deque
+from multiprocessing import Process, Queue
 from multiprocessing.managers import SyncManager
-from typing import Iterable, Literal
+from queue import Empty
+from typing import Iterable, Iterator, Literal
 
-import torch
-
-from torch.multiprocessing import Process
+from core.metrics import MetricsExporter, ModuleMetrics
+from core.transport import Transport, as_transport
+from core.workers import SESSION_KEY, WorkerPool, parent_exited
 
 
 class AbstractActionProcess(Process):
@@ -22,30 +29,145 @@ class AbstractActionProcess(Process):
 
     _logger = None
 
+    # Keys which describe a streamed message. They belong to the message itself and are
+    # therefore not copied from the input into the output of a module.
+    STREAM_KEYS = ("message_id", "sequence", "partial", "final", "stable")
+
+    # Keys of the latency trace. Each module adds its stage to a new trace list, so they are
+    # not copied from the input either.
+    TRACE_KEYS = ("trace", "dequeue_time")
+
+    # Keys which a module adds to its input for its own use, e.g. the position of a message
+    # in the history of the GUI. They are not copied into the output of the module.
+    LOCAL_KEYS = ()
+
+    # Modules which can handle partial messages of a stream have to set this to true.
+    # All other modules only receive the final message, which contains the complete data.
+    accepts_partial = False
+
+    # Maximal number of queued messages which are passed together to `process_batch`
+    batch_size = 1
+
+    # Maximal number of waiting input messages, 0 means unbounded. What happens if the
+    # bound is reached is defined by the policy:
+    # - "block": The sending module waits until there is space in the queue.
+    # - "drop_oldest": The oldest waiting message is dropped.
+    # - "coalesce": Partial messages of a stream are replaced by the newest partial message
+    #   of the same stream, before the oldest messages are dropped. This is only suitable
+    #   for streams whose partial messages contain the complete data.
+    input_queue_size = 0
+    input_policy: Literal["block", "drop_oldest", "coalesce"] = "block"
+
+    # Order in which the waiting messages are processed:
+    # - "fifo": In the order they were received.
+    # - "fair": Round robin between the sessions, starting with the session which was
+    #   served least recently, so that a session with many messages does not delay the
+    #   others. If the bound of a dropping policy is reached, the messages of the session
+    #   with the most waiting messages are dropped first.
+    session_scheduling: Literal["fifo", "fair"] = "fifo"
+
+    # If set, the output of the module has to be processed within this time in seconds.
+    # Later modules skip the message after its deadline.
+    message_ttl: float = None
+
+    # If true, messages whose deadline passed are dropped. Modules which have to see every
+    # message, like the GUI which stores the conversation, set this to false.
+    expires = True
+
+    # Number of workers which process the input messages concurrently. Thread workers share
+    # the models of the module, process workers load their own copy. Only modules whose
+    # `process` can run concurrently should use more than one worker.
+    workers = 1
+    worker_mode: Literal["thread", "process"] = "thread"
+
+    # If true, the messages of one session are processed one after another by the same
+    # worker, e.g. because the module keeps a state per session. Otherwise they are
+    # processed concurrently and only their output is sent in order.
+    serialize_sessions = False
+
+    # If true, messages of a turn which was cancelled through the control queue, e.g.
+    # because the learner started to speak again, are dropped. Modules which have to see
+    # every message, like the GUI which shows the conversation, set this to false.
+    cancellable = True
+
+    # Maximal time in seconds the module waits for a message before it checks whether it
+    # should stop
+    poll_timeout = 0.5
+
     def __init__(
         self,
-        manager: SyncManager,
+        manager: SyncManager | Transport,
         label: Literal["stt", "tts", "llm", "gui", "other"],
         *args,
         output_queues: Iterable[Queue] = None,
         **kwargs,
     ):
-        self._e_stop_process = manager.Event()
+        """Constructor.
+
+        Args:
+            manager (SyncManager | Transport): Transport used to create the queues and events
+                of the module. A `SyncManager` is wrapped into a `ManagerTransport`.
+            label (Literal["stt", "tts", "llm", "gui", "other"]): Label of the module.
+            output_queues (Iterable[Queue], optional): Queues which receive the output.
+        """
+        self.transport = as_transport(manager)
+
+        self._e_stop_process = self.transport.event()
+
+        # Set once the module finished its warm up and processes its input
+        self._e_ready = self.transport.event()
+
+        self.input_queue = self.transport.queue()
+
+        # Commands like the cancellation of a turn, see `core.control`
+        self.control_queue = self.transport.queue()
+
+        # Set by the pipeline, so that a module can send commands to all modules
+        self.control_bus = None
 
-        self.input_queue = manager.Queue()
+        # Set by the pipeline, commands for the supervisor of the pipeline, e.g. to shut
+        # the application down
+        self.command_queue = None
+
+        # Messages of a session which were sent into the pipeline before this time are
+        # cancelled
+        self._cancelled = dict()
 
         self.label = label
 
-        self.output_queues = manager.list()
+        # Device used for the models of the module. If not set the fastest available
+        # device is used.
+        self.process_device = None
+
+        self.output_queues = self.transport.list()
         if output_queues is not None:
             self.output_queues.extend(output_queues)
 
+        # Created inside the process
+        self.metrics: ModuleMetrics = None
+
+        # Waiting input messages if a dropping policy or the fair scheduling is used
+        self._backlog = deque()
+
+        # Number of the message with which each waiting session was served last
+        self._last_served = dict()
+        self._served_messages = 0
+
+        # Created inside the process if the module has several workers
+        self._pool: WorkerPool = None
+
         # Initiliase the process
         Process.__init__(self, args=args, kwargs=kwargs)
 
-    @staticmethod
-    def get_process_device() -> str:
-        """Return the fastest available device."""
+    def get_process_device(self) -> str:
+        """Return the configured device or the fastest available device."""
+        if self.process_device is not None:
+            return self.process_device
+
+        # torch is only imported by the processes which use a model
+        # pylint: disable=import-outside-toplevel
+        import torch
+
         return (
             "cuda"
             if torch.cuda.is_available()
@@ -54,6 +176,48 @@ class AbstractActionProcess(Process):
             else "cpu"
         )
 
+    def configure_input(
+        self,
+        maxsize: int,
+        policy: Literal["block", "drop_oldest", "coalesce"] = "block",
+    ) -> None:
+        """Limit the number of waiting input messages. This replaces the input queue, so it
+        has to be called before the module is connected and started.
+
+        Args:
+            maxsize (int): Maximal number of waiting messages, 0 means unbounded.
+            policy (Literal["block", "drop_oldest", "coalesce"], optional): Behaviour if
+                the bound is reached, see `input_policy`. Defaults to "block".
+        """
+        if policy not in ("block", "drop_oldest", "coalesce"):
+            raise ValueError(f"Unknown input policy {policy}")
+
+        self.input_queue_size = maxsize
+        self.input_policy = policy
+
+        # With the dropping policies the module takes all messages from the queue and
+        # applies the bound itself, so the sending modules never wait
+        self.input_queue = self.transport.queue(maxsize if policy == "block" else 0)
+
+    def configure_workers(
+        self, workers: int, mode: Literal["thread", "process"] = "thread"
+    ) -> None:
+        """Process the input messages with several workers. It has to be called before the
+        module is started.
+
+        Args:
+            workers (int): Number of workers.
+            mode (Literal["thread", "process"], optional): Kind of the workers, see
+                `workers`. Defaults to "thread".
+        """
+        if workers < 1:
+            raise ValueError(f"At least one worker is required, got {workers}")
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker mode {mode}")
+
+        self.workers = workers
+        self.worker_mode = mode
+
     def add_output_queue(self, queue: Queue) -> None:
         """Adds a module which will receive the output of this module."""
         self.output_queues.append(queue)
@@ -63,27 +227,374 @@ class AbstractActionProcess(Process):
         self.output_queues.append(module.input_queue)
 
     def run(self, **kwargs) -> None:
+        # Ctrl+C is handled by the main process, which stops the modules gracefully
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        self.metrics = ModuleMetrics(self.__class__.__name__, self.label)
+
+        # The metrics are only written if a directory is configured
+        exporter = None
+        if os.environ.get("METRICS_DIRECTORY", None):
+            exporter = MetricsExporter(
+                self.metrics,
+                os.environ["METRICS_DIRECTORY"],
+                float(os.environ.get("METRICS_INTERVAL", 10.0)),
+            )
+            exporter.start()
+
+        # Commands are handled by their own thread, so that they also reach a module which
+        # is busy with a message
+        threading.Thread(target=self._run_control, daemon=True).start()
+
+        start_time = time.time()
+        if self.workers > 1:
+            # The workers run the warm up themselves
+            pool = WorkerPool(
+                self, self.workers, self.worker_mode, self.serialize_sessions
+            )
+            pool.start()
+            self._pool = pool
+        else:
+            self.warm_up()
+        self.metrics.set("warm_up_seconds", time.time() - start_time)
+        self.logger.info(f"Ready after {time.time() - start_time:.2f}s")
+
+        self._e_ready.set()
+
         self._run(**kwargs)
 
+        if exporter is not None:
+            exporter.stop()
+
+    def warm_up(self) -> None:
+        """Load the models and other resources of the module. It is called inside the
+        process before the first input is processed. All modules are started together, so
+        their warm up runs concurrently. Heavy libraries should be imported here and not at
+        the top of the module, so that they are not loaded by the main process."""
+
+    def is_ready(self) -> bool:
+        """Return true if the module finished its warm up."""
+        return self._e_ready.is_set()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Wait until the module finished its warm up.
+
+        Returns:
+            bool: False if the timeout was reached.
+        """
+        return self._e_ready.wait(timeout)
+
     def _run(self, **kwargs) -> None:
         """Run function which executes the process method."""
         while not self._e_stop_process.is_set():
             # Get data to process
-            in_data = self.input_queue.get()
+            batch = [
+                in_data
+                for in_data in self._get_batch()
+                if not self._is_rejected_partial(in_data)
+                and not self._is_stale(in_data)
+                and not self._is_superseded(in_data)
+            ]
+
+            if len(batch) == 0:
+                if self._is_orphaned():
+                    break
+                continue
+
+            self._record_dequeue(batch)
+
+            if self._pool is not None:
+                self._pool.submit(batch)
+                continue
 
             # Process the data
-            out_data = self.process(in_data)
+            for in_data, out_data in zip(batch, self.process_batch(batch)):
+                if out_data is not None:
+                    # Streaming modules return an iterator over the partial messages
+                    if isinstance(out_data, dict):
+                        out_data = (out_data,)
+
+                    for data in out_data:
+                        self.send_output(data, in_data)
+
+                self._record_done(in_data)
+
+        if self._pool is None:
+            self.clean_up()
+            return
+
+        self._pool.stop()
+        # Process workers clean up their own models
+        if self.worker_mode == "thread":
+            self.clean_up()
+
+    def _record_dequeue(self, batch: list) -> None:
+        """Stamp the messages with the time they were taken from the queue."""
+        now = time.time()
+        for in_data in batch:
+            in_data["dequeue_time"] = now
+            self.metrics.observe(
+                "queue_wait_seconds", now - in_data.get("sent_time", now)
+            )
+        self.metrics.increment("messages_total", len(batch))
+
+    def _record_done(self, in_data: dict) -> None:
+        """Record the processing time of a message once all its output was sent."""
+        now = time.time()
+        self.metrics.observe("process_seconds", now - in_data["dequeue_time"])
+
+        trace_start = self.trace_start(in_data)
+        if trace_start is not None and not self.is_partial(in_data):
+            self.metrics.observe("origin_latency_seconds", now - trace_start)
+
+    def _is_orphaned(self) -> bool:
+        """Return true if the main process ended without stopping the module, so that the
+        process does not keep its models in memory."""
+        if not parent_exited():
+            return False
+
+        self.logger.warning("The main process ended, stopping")
+        return True
+
+    def _get_batch(self) -> list:
+        """Wait for the next message and add up to `batch_size` - 1 already queued messages.
+        Returns an empty list if no message arrived within the poll timeout."""
+        if self.input_policy != "block" or self.session_scheduling == "fair":
+            return self._get_backlog_batch()
+
+        try:
+            batch = [self.input_queue.get(timeout=self.poll_timeout)]
+        except Empty:
+            return []
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.input_queue.get_nowait())
+            except Empty:
+                break
+
+        return batch
+
+    def _get_backlog_batch(self) -> list:
+        """Take all waiting messages from the queue, apply the input policy and return the
+        next messages according to the session scheduling."""
+        if len(self._backlog) == 0:
+            try:
+                self._backlog.append(self.input_queue.get(timeout=self.poll_timeout))
+            except Empty:
+                return []
+
+        # With the blocking policy the bounded queue keeps the remaining messages, so that
+        # the sending modules still wait
+        while self.input_policy != "block" or not (
+            0 < self.input_queue_size <= len(self._backlog)
+        ):
+            try:
+                self._backlog.append(self.input_queue.get_nowait())
+            except Empty:
+                break
+
+        if self.input_policy != "block" and 0 < self.input_queue_size < len(self._backlog):
+            if self.input_policy == "coalesce":
+                self._coalesce_backlog()
+
+            while len(self._backlog) > self.input_queue_size:
+                self._discard(self._pop_overflow(), "dropped_overflow_total")
+
+        count = min(self.batch_size, len(self._backlog))
+        if self.session_scheduling == "fair":
+            return [self._pop_fair() for _ in range(count)]
+
+        return [self._backlog.popleft() for _ in range(count)]
+
+    def _pop_fair(self) -> dict:
+        """Remove the oldest waiting message of the session which was served least
+        recently. Sessions which were not served yet come first."""
+        oldest = dict()
+        for i, in_data in enumerate(self._backlog):
+            oldest.setdefault(in_data.get(SESSION_KEY, None), i)
+
+        session = min(oldest, key=lambda s: (self._last_served.get(s, -1), oldest[s]))
+        in_data = self._backlog[oldest[session]]
+        del self._backlog[oldest[session]]
+
+        # Only the waiting sessions are remembered, a returning session is served first
+        self._served_messages += 1
+        self._last_served = {
+            s: served for s, served in self._last_served.items() if s in oldest
+        }
+        self._last_served[session] = self._served_messages
+
+        return in_data
+
+    def _pop_overflow(self) -> dict:
+        """Remove the message which is dropped if the backlog exceeds its bound."""
+        if self.session_scheduling != "fair":
+            return self._backlog.popleft()
+
+        # The oldest message of the session with the most waiting messages
+        counts = dict()
+        for in_data in self._backlog:
+            session = in_data.get(SESSION_KEY, None)
+            counts[session] = counts.get(session, 0) + 1
+
+        session = max(counts, key=counts.get)
+        for i, in_data in enumerate(self._backlog):
+            if in_data.get(SESSION_KEY, None) == session:
+                del self._backlog[i]
+                return in_data
+
+    def _coalesce_backlog(self) -> None:
+        """Remove partial messages which are followed by a newer message of their stream."""
+        newest = dict()
+        for i, in_data in enumerate(self._backlog):
+            if "message_id" in in_data:
+                newest[in_data["message_id"]] = i
+
+        backlog = deque()
+        for i, in_data in enumerate(self._backlog):
+            if self.is_partial(in_data) and newest[in_data["message_id"]] != i:
+                self._discard(in_data, "coalesced_total")
+            else:
+                backlog.append(in_data)
+
+        self._backlog = backlog
+
+    def _is_rejected_partial(self, in_data: dict) -> bool:
+        """Return true and drop the message if it is a partial message and the module only
+        accepts the final messages of a stream."""
+        if self.accepts_partial or not self.is_partial(in_data):
+            return False
+
+        self._discard(in_data, "dropped_partial_total")
+        return True
+
+    def _is_stale(self, in_data: dict) -> bool:
+        """Return true and drop the message if its deadline has passed."""
+        deadline = in_data.get("deadline", None)
+        if not self.expires or deadline is None or time.time() <= deadline:
+            return False
+
+        self._discard(in_data, "dropped_stale_total")
+        return True
+
+    def _is_superseded(self, in_data: dict) -> bool:
+        """Return true and drop the message if its turn was cancelled."""
+        if not self.is_cancelled(in_data):
+            return False
+
+        self._discard(in_data, "dropped_cancelled_total")
+        self.on_superseded(in_data)
+        return True
+
+    def is_cancelled(self, data: dict) -> bool:
+        """Return true if the message belongs to a cancelled turn of its session. Modules
+        can call it while they process a message to abort the work on it."""
+        if not self.cancellable:
+            return False
+
+        cutoff = self._cancelled.get(data.get(SESSION_KEY, None), None)
+        origin_time = self.trace_start(data)
+
+        return cutoff is not None and origin_time is not None and origin_time < cutoff
+
+    def _run_control(self) -> None:
+        """Handle the commands of the control queue until the process ends."""
+        while True:
+            self._handle_control(self.control_queue.get())
+
+    def _handle_control(self, command: dict) -> None:
+        if command["command"] != "cancel":
+            self.logger.warning(f"Unknown command {command['command']}")
+            return
+
+        if not self.cancellable:
+            return
+
+        self.logger.info(
+            f"Cancelled the turns of session {command.get('session_id', None)} before "
+            f"turn {command.get('turn_id')}"
+        )
+        self.metrics.increment("cancelled_turns_total")
+
+        # Process workers run their own copy of the module
+        if self._pool is not None:
+            self._pool.forward_control(command)
+
+        self._cancel(command)
+
+    def _cancel(self, command: dict) -> None:
+        """Mark the turns of a cancel command as cancelled and abort the work on them."""
+        session = command.get("session_id", None)
+        before = command["time"]
+        self._cancelled[session] = max(self._cancelled.get(session, 0.0), before)
+
+        self.on_cancel(session, before)
+
+    def on_cancel(self, session_id: str, before: float) -> None:
+        """Abort the work on the messages of the session which were sent into the pipeline
+        before the given time. It is called by the control thread, so it must not block and
+        has to be thread safe. Waiting messages are dropped by the base class, the default
+        implementation does nothing else."""
+
+    def on_superseded(self, data_in: dict) -> None:
+        """Called with each input message which is dropped because its turn was cancelled,
+        e.g. to keep the text of the learner in the conversation history."""
+
+    def _discard(self, in_data: dict, counter: str) -> None:
+        """Drop a message without processing it."""
+        self.logger.debug(f"Dropped message ({counter})")
+        self.metrics.increment(counter)
 
-            if out_data is not None:
-                # Update the output data set with the metadata contained inside the input
-                in_data.pop("data", None)
-                out_data.update(in_data)
-                out_data["source"] = self.label
+        # Data inside shared memory, like the audio of the recorder, has to be released
+        release = getattr(in_data.get("data", None), "release", None)
+        if release is not None:
+            release()
 
-                for queue in self.output_queues:
-                    queue.put(out_data)
+    def send_output(self, out_data: dict, in_data: dict = None) -> None:
+        """Send the output data to all connected modules.
 
-        self.clean_up()
+        Args:
+            out_data (dict): The output data of this module.
+            in_data (dict, optional): The processed input data. Its metadata is copied into
+                                      the output data.
+        """
+        if in_data is not None:
+            # Update the output data set with the metadata contained inside the input
+            out_data.update(
+                {
+                    key: value
+                    for key, value in in_data.items()
+                    if key != "data"
+                    and key not in self.STREAM_KEYS
+                    and key not in self.TRACE_KEYS
+                    and key not in self.LOCAL_KEYS
+                }
+            )
+
+            # Add the timing of this module to the trace of the input
+            out_data["trace"] = in_data.get("trace", []) + [
+                {
+                    "stage": self.label,
+                    "enqueue": in_data.get("sent_time", None),
+                    "dequeue": in_data.get("dequeue_time", None),
+                    "done": time.time(),
+                }
+            ]
+
+        if "trace_id" not in out_data:
+            out_data["trace_id"] = uuid.uuid4().hex
+
+        # A deadline of the input is kept, so it applies to the complete pipeline
+        if self.message_ttl is not None and "deadline" not in out_data:
+            out_data["deadline"] = time.time() + self.message_ttl
+
+        out_data["source"] = self.label
+        # Used by the receiving modules to measure the delivery latency
+        out_data["sent_time"] = time.time()
+
+        for queue in self.output_queues:
+            queue.put(out_data)
 
     def data_available(self) -> bool:
         """Return true if data is available for processing."""
@@ -108,16 +619,80 @@ class AbstractActionProcess(Process):
 
         return output
 
+    @staticmethod
+    def create_stream_data(
+        data_out, message_id: str, sequence: int, final: bool = False, **kwargs
+    ) -> dict:
+        """Generate one message of a stream. Partial messages contain the newly generated
+        part of the data, while the final message contains the complete data.
+
+        Streams whose partial data can change, like speech recognition hypotheses, send the
+        complete current data in each partial message together with the key "stable", which
+        contains the part which is not expected to change anymore.
+
+        Args:
+            data_out: The new data of the stream, or the complete data for the final message.
+            message_id (str): Id which is shared by all messages of the stream.
+            sequence (int): Position of the message inside the stream.
+            final (bool, optional): Is this the last message of the stream. Defaults to False.
+            kwargs: Additional parameter which should be included in the output dict.
+
+        Returns:
+            dict (dict): dict containing the output dict intented for the next module.
+        """
+        return AbstractActionProcess.create_output_data(
+            data_out,
+            message_id=message_id,
+            sequence=sequence,
+            partial=not final,
+            final=final,
+            **kwargs,
+        )
+
+    @staticmethod
+    def new_message_id() -> str:
+        """Return a new unique message id for a stream."""
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def trace_start(data: dict) -> float | None:
+        """Return the time at which the first module of the pipeline sent the data."""
+        trace = data.get("trace", None)
+        if trace:
+            return trace[0]["enqueue"] or trace[0]["dequeue"]
+
+        return data.get("sent_time", None)
+
+    @staticmethod
+    def is_partial(data: dict) -> bool:
+        """Return true if the data is a partial message of a stream."""
+        return data.get("partial", False)
+
     @abstractmethod
-    def process(self, data_in: dict) -> dict:
+    def process(self, data_in: dict) -> dict | Iterator[dict] | None:
         """This method should process the available data in data_in and put the result into
         data out. It has to be overwritten by any child class.
 
+        Streaming modules can return an iterator over the messages created with
+        `create_stream_data` instead of a single dict.
+
         Important is also that this function is called in the main processing loop. Therefore
         is should only process the data once it is available and should not have a loop which
         waits for more data.
         """
 
+    def process_batch(self, batch: list) -> list:
+        """Process several messages at once. The default implementation calls `process` for
+        each message, modules which can process a batch more efficiently can overwrite it.
+
+        Args:
+            batch (list): The input data, at most `batch_size` messages.
+
+        Returns:
+            list: The result of `process` for each message of the batch.
+        """
+        return [self.process(data_in) for data_in in batch]
+
     @abstractmethod
     def clean_up(self) -> None:
         """Cleans up the thread when it is killed."""
@@ -140,7 +715,12 @@ class AbstractActionProcess(Process):
 class LogActionProcess(AbstractActionProcess):
     """Dummy module which only logs the current data."""
 
-    def __init__(self, manager: SyncManager, output_queues: Iterable[Queue]):
+    cancellable = False
+    expires = False
+
+    def __init__(
+        self, manager: SyncManager | Transport, output_queues: Iterable[Queue] = None
+    ):
         super().__init__(manager, "other", output_queues=output_queues)
 
     def process(self, data_in):
@@ -0,0 +1,379 @@
+"""Module containing the registry of the processing modules and the construction of the
+pipeline from a configuration file.
+
+The configuration is a TOML file, which contains the modules with their parameter and the
+edges between them, e.g.
+
+    [pipeline]
+    transport = "direct"
+
+    [modules.stt]
+    type = "whisper"
+    process_device = "cpu"
+    input_fs = "$recorder.sampling_rate"
+    input_queue_size = 8
+    input_policy = "coalesce"
+
+    [modules.llm]
+    type = "gpt4o_mini"
+    workers = 4
+    worker_mode = "thread"
+    session_scheduling = "fair"
+
+    [[edges]]
+    from = "recorder"
+    to = "stt"
+
+String parameter starting with "$" reference an attribute of a module which is defined
+earlier in the file. The optional section "supervisor" contains the parameter of
+`core.supervisor.Supervisor`, which starts and stops the processes of the pipeline.
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import multiprocessing as mp
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from core.control import ControlBus
+from core.processing import AbstractActionProcess
+from core.transport import (
+    DirectTransport,
+    FramedTransport,
+    ManagerTransport,
+    Transport,
+)
+
+# Import path of the module classes. The classes are imported when they are used, so that
+# only the libraries of the configured modules are loaded.
+MODULE_REGISTRY = {
+    "sounddevice_recorder": "audio.sounddevice_recorder:SoundDeviceRecorderModule",
+    "wav_recorder": "audio.wav_recorder:WavFileRecorderModule",
+    "whisper": "audio.whisper_speech_recognition:WhisperSpeechRecognitionModule",
+    "gpt4o_mini": "text.gpt4o_mini:GPT4oMiniTextProcessingModule",
+    "gpt4o_mini_async": "text.gpt4o_mini_async:AsyncGPT4oMiniTextProcessingModule",
+    "phi": "text.phi:PhiMiniTextProcessingModule",
+    "gemma": "text.gemma:GemmaTextProcessingModule",
+    "openai_tts": "audio.openai_tts:OpenAITTS",
+    "xtts_v2": "audio.xtts_v2:XTTSV2Module",
+    "gtts": "audio.gtts:gTTSModule",
+    "eel_gui": "gui.eel_gui:EelGuiModule",
+    "log": "core.processing:LogActionProcess",
+}
+
+# Keys of a module configuration which are not passed to the constructor
+MODULE_KEYS = (
+    "type",
+    "process_device",
+    "wait_for",
+    "input_queue_size",
+    "input_policy",
+    "message_ttl",
+    "workers",
+    "worker_mode",
+    "session_scheduling",
+)
+
+
+class PipelineConfigError(ValueError):
+    """Raised if the pipeline configuration is invalid."""
+
+
+def register_module(name: str, import_path: str) -> None:
+    """Add a module type to the registry.
+
+    Args:
+        name (str): Name of the type inside the configuration.
+        import_path (str): Import path of the class in the form "package.module:Class".
+    """
+    MODULE_REGISTRY[name] = import_path
+
+
+def module_class(name: str) -> type:
+    """Return the class of a registered module type."""
+    if name not in MODULE_REGISTRY:
+        raise PipelineConfigError(
+            f"Unknown module type {name}, registered are {sorted(MODULE_REGISTRY)}"
+        )
+
+    module_name, class_name = MODULE_REGISTRY[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def load_config(path: str) -> dict:
+    """Load and validate a pipeline configuration file."""
+    with open(path, "rb") as file:
+        config = tomllib.load(file)
+
+    validate_config(config)
+    return config
+
+
+def validate_config(config: dict) -> None:
+    """Check the modules and edges of the configuration.
+
+    Raises:
+        PipelineConfigError: If an edge references an unknown module, the edges contain a
+            cycle which is not marked as feedback, or a module exceeds the maximal fan out.
+    """
+    modules = config.get("modules", {})
+    edges = config.get("edges", [])
+    max_fan_out = config.get("pipeline", {}).get("max_fan_out", None)
+
+    for name, module in modules.items():
+        if "type" not in module:
+            raise PipelineConfigError(f"Module {name} has no type")
+
+        if module.get("input_policy", "block") not in ("block", "drop_oldest", "coalesce"):
+            raise PipelineConfigError(
+                f"Module {name} has the unknown input policy {module['input_policy']}"
+            )
+
+        if module.get("worker_mode", "thread") not in ("thread", "process"):
+            raise PipelineConfigError(
+                f"Module {name} has the unknown worker mode {module['worker_mode']}"
+            )
+
+        if module.get("session_scheduling", "fifo") not in ("fifo", "fair"):
+            raise PipelineConfigError(
+                f"Module {name} has the unknown session scheduling "
+                f"{module['session_scheduling']}"
+            )
+
+        if module.get("workers", 1) < 1:
+            raise PipelineConfigError(f"Module {name} requires at least one worker")
+
+        for other in module.get("wait_for", []):
+            if other not in modules:
+                raise PipelineConfigError(f"Module {name} waits for unknown module {other}")
+
+    fan_out = {name: 0 for name in modules}
+    graph = {name: [] for name in modules}
+    for edge in edges:
+        for key in ("from", "to"):
+            if edge.get(key, None) not in modules:
+                raise PipelineConfigError(f"Edge {edge} references an unknown module")
+
+        fan_out[edge["from"]] += 1
+
+        # Feedback edges only forward some messages back, e.g. the text entered in the
+        # GUI, so they do not form a loop of messages
+        if not edge.get("feedback", False):
+            graph[edge["from"]].append(edge["to"])
+
+    if max_fan_out is not None:
+        for name, count in fan_out.items():
+            if count > max_fan_out:
+                raise PipelineConfigError(
+                    f"Module {name} sends its output to {count} modules, the maximum is "
+                    f"{max_fan_out}"
+                )
+
+    cycle = _find_cycle(graph)
+    if cycle is not None:
+        raise PipelineConfigError(
+            f"The edges contain the cycle {' -> '.join(cycle)}. Mark one edge as "
+            "feedback if only some messages are sent back."
+        )
+
+
+def _find_cycle(graph: dict) -> list | None:
+    """Return the modules of a cycle inside the directed graph or None."""
+    finished = set()
+
+    def visit(node: str, path: list) -> list | None:
+        if node in path:
+            return path[path.index(node) :] + [node]
+        if node in finished:
+            return None
+
+        for next_node in graph[node]:
+            cycle = visit(next_node, path + [node])
+            if cycle is not None:
+                return cycle
+
+        finished.add(node)
+        return None
+
+    for node in graph:
+        cycle = visit(node, [])
+        if cycle is not None:
+            return cycle
+
+    return None
+
+
+def create_transport(config: dict) -> Transport:
+    """Create the transport which is configured in the pipeline section."""
+    name = config.get("pipeline", {}).get("transport", "direct")
+    if name == "manager":
+        return ManagerTransport(mp.Manager())
+    if name == "direct":
+        return DirectTransport()
+    if name == "framed":
+        return FramedTransport()
+
+    raise PipelineConfigError(f"Unknown transport {name}")
+
+
+class Pipeline:
+    """The modules of a configuration and their connections."""
+
+    def __init__(self, config: dict, transport: Transport = None):
+        """Constructor. The modules are created in the order of the configuration.
+
+        Args:
+            config (dict): The validated pipeline configuration.
+            transport (Transport, optional): Transport used by the modules. Defaults to the
+                                             configured transport.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.config = config
+        self.transport = transport if transport is not None else create_transport(config)
+
+        self.modules = dict()
+        for name, module_config in config.get("modules", {}).items():
+            self.modules[name] = self._create_module(name, module_config)
+
+        for edge in config.get("edges", []):
+            # Also works for modules without an input, like the recorder
+            self.modules[edge["from"]].output_queues.append(
+                self.modules[edge["to"]].input_queue
+            )
+
+        # Commands like the cancellation of a turn reach all processes. Every module can
+        # send them, e.g. the recorder if the learner starts to speak.
+        self.control_bus = ControlBus()
+        for module in self.processes:
+            self.control_bus.add(module)
+        for module in self.modules.values():
+            module.control_bus = self.control_bus
+
+        # Commands for the supervisor, e.g. from the GUI
+        self.command_queue = self.transport.queue()
+        for module in self.processes:
+            module.command_queue = self.command_queue
+
+        for name, module_config in config.get("modules", {}).items():
+            if "wait_for" in module_config:
+                self.modules[name].wait_for(
+                    *(self.modules[other] for other in module_config["wait_for"])
+                )
+
+    def _create_module(self, name: str, module_config: dict):
+        parameter = {
+            key: self._resolve(value)
+            for key, value in module_config.items()
+            if key not in MODULE_KEYS
+        }
+
+        self.logger.debug(f"Create module {name} with {parameter}")
+        module = module_class(module_config["type"])(self.transport, **parameter)
+
+        if "process_device" in module_config:
+            module.process_device = module_config["process_device"]
+
+        if "input_queue_size" in module_config or "input_policy" in module_config:
+            module.configure_input(
+                module_config.get("input_queue_size", 0),
+                module_config.get("input_policy", "block"),
+            )
+
+        if "message_ttl" in module_config:
+            module.message_ttl = module_config["message_ttl"]
+
+        if "session_scheduling" in module_config:
+            module.session_scheduling = module_config["session_scheduling"]
+
+        if "workers" in module_config or "worker_mode" in module_config:
+            module.configure_workers(
+                module_config.get("workers", 1),
+                module_config.get("worker_mode", "thread"),
+            )
+
+        return module
+
+    def _resolve(self, value):
+        """Replace references to attributes of other modules by their value."""
+        if not isinstance(value, str) or not value.startswith("$"):
+            return value
+
+        name, _, attribute = value[1:].partition(".")
+        if name not in self.modules:
+            raise PipelineConfigError(
+                f"Reference {value} to a module which is not defined before"
+            )
+
+        return getattr(self.modules[name], attribute)
+
+    def __getitem__(self, name: str):
+        return self.modules[name]
+
+    @property
+    def processes(self) -> list:
+        """The modules which run inside their own process."""
+        return [
+            module
+            for module in self.modules.values()
+            if isinstance(module, AbstractActionProcess)
+        ]
+
+    def start(self) -> None:
+        """Start all processes. Their warm up runs concurrently."""
+        for module in self.processes:
+            module.start()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Wait until all processes finished their warm up.
+
+        Returns:
+            bool: False if the timeout was reached.
+        """
+        return all(module.wait_ready(timeout) for module in self.processes)
+
+    def kill(self) -> None:
+        """Stop all processes."""
+        for module in self.processes:
+            module.kill()
+
+    def recreate(self, name: str) -> AbstractActionProcess:
+        """Replace the process of a module by a new one, e.g. after it crashed. A process
+        can only be started once, so a new module is created from the configuration. It
+        takes over the queues and the ready event of the old module, so that the other
+        modules stay connected to it. The old process has to be stopped before and the new
+        one is not started.
+        """
+        old = self.modules[name]
+        module_config = self.config["modules"][name]
+
+        module = self._create_module(name, module_config)
+        module.input_queue = old.input_queue
+        module.control_queue = old.control_queue
+        self.transport.recover_queue(module.input_queue)
+        self.transport.recover_queue(module.control_queue)
+        module.output_queues = old.output_queues
+        module.control_bus = self.control_bus
+        module.command_queue = self.command_queue
+
+        # Other modules, like the GUI, wait for this event
+        # pylint: disable=protected-access
+        old._e_ready.clear()
+        module._e_ready = old._e_ready
+        # pylint: enable=protected-access
+
+        if "wait_for" in module_config:
+            module.wait_for(*(self.modules[other] for other in module_config["wait_for"]))
+
+        self.modules[name] = module
+        return module
+
+
+def build_pipeline(path: str, transport: Transport = None) -> Pipeline:
+    """Load the configuration file and create its pipeline."""
+    return Pipeline(load_config(path), transport)
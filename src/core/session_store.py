@@ -0,0 +1,173 @@
+"""Module containing the persistent store of the session history.
+
+The messages of a session are appended to a SQLite database. Only the newest messages are
+kept in memory, older messages are read from the database when they are requested.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+from collections import deque
+
+# Sources whose messages are inputs of the user respectively replies of the text modules
+USER_SOURCES = ("stt", "frontend")
+ASSISTANT_SOURCES = ("llm",)
+
+
+class SessionStore:
+    """Append only history of the messages of one session.
+
+    Appended messages are buffered and written in one transaction by `flush`. The store
+    keeps a bounded tail of the newest messages in memory, reads of older messages are
+    served by the database.
+    """
+
+    DEFAULT_PATH = os.path.join(
+        os.path.expanduser("~"), ".cache", "ai_language_learning_assistant", "sessions.db"
+    )
+
+    def __init__(self, path: str = None, session_id: str = "default", tail_size: int = 500):
+        """Constructor.
+
+        Args:
+            path (str, optional): Path of the database. Defaults to the SESSION_STORE_PATH
+                                  environment variable or DEFAULT_PATH.
+            session_id (str, optional): Id of the session. Messages of an existing session
+                                        are continued. Defaults to "default".
+            tail_size (int, optional): Number of the newest messages which are kept in
+                                       memory. Defaults to 500.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.path = path or os.environ.get("SESSION_STORE_PATH", self.DEFAULT_PATH)
+        self.session_id = session_id
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        # The text modules read the database while the GUI writes to it
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                message_index INTEGER NOT NULL,
+                source TEXT,
+                message TEXT NOT NULL,
+                PRIMARY KEY (session_id, message_index)
+            )"""
+        )
+        self._connection.commit()
+
+        self._total = self._connection.execute(
+            "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+
+        self._pending = []
+        self._tail = deque(maxlen=tail_size)
+        self._tail.extend(self._select(max(self._total - tail_size, 0), tail_size))
+
+        if self._total > 0:
+            self.logger.info(f"Continue session {session_id} with {self._total} messages")
+
+    def __len__(self) -> int:
+        return self._total
+
+    def append(self, message: dict) -> int:
+        """Add a message to the session. It is written to the database by the next `flush`.
+
+        Returns:
+            int: Index of the message inside the session.
+        """
+        index = self._total
+        self._total += 1
+
+        self._pending.append(
+            (
+                self.session_id,
+                index,
+                message.get("source", None),
+                json.dumps(message, ensure_ascii=False, default=str),
+            )
+        )
+        self._tail.append(message)
+
+        return index
+
+    def flush(self) -> None:
+        """Write the pending messages in one transaction."""
+        if len(self._pending) == 0:
+            return
+
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?)", self._pending
+            )
+        self._pending.clear()
+
+    def read(self, start: int, count: int) -> list:
+        """Return up to count messages starting at the given index."""
+        start = max(start, 0)
+        end = min(start + count, self._total)
+
+        tail_start = self._total - len(self._tail)
+        if start >= tail_start:
+            return [self._tail[i - tail_start] for i in range(start, end)]
+
+        self.flush()
+        return self._select(start, end - start)
+
+    def _select(self, start: int, count: int) -> list:
+        rows = self._connection.execute(
+            "SELECT message FROM messages WHERE session_id = ? AND message_index >= ? "
+            "ORDER BY message_index LIMIT ?",
+            (self.session_id, start, count),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def conversation(self, max_messages: int = None) -> list:
+        """Return the inputs of the user and the replies of the text modules as
+        role/content messages, e.g. to resume the conversation of a text module.
+
+        Args:
+            max_messages (int, optional): Maximal number of the newest messages.
+        """
+        self.flush()
+
+        sources = USER_SOURCES + ASSISTANT_SOURCES
+        rows = self._connection.execute(
+            f"SELECT source, message FROM messages WHERE session_id = ? AND source IN "
+            f"({', '.join('?' * len(sources))}) ORDER BY message_index DESC LIMIT ?",
+            (self.session_id, *sources, -1 if max_messages is None else max_messages),
+        ).fetchall()
+
+        return [
+            {
+                "role": "assistant" if source in ASSISTANT_SOURCES else "user",
+                "content": json.loads(message)["data"],
+            }
+            for source, message in reversed(rows)
+        ]
+
+    def close(self) -> None:
+        """Write the pending messages and close the database."""
+        self.flush()
+        self._connection.close()
+
+
+def load_conversation(session_id: str, path: str = None, max_messages: int = 100) -> list:
+    """Return the stored conversation of a session as role/content messages.
+
+    Args:
+        session_id (str): Id of the session.
+        path (str, optional): Path of the database. Defaults to the default of `SessionStore`.
+        max_messages (int, optional): Maximal number of the newest messages. Defaults to 100.
+    """
+    store = SessionStore(path, session_id, tail_size=0)
+    try:
+        return store.conversation(max_messages)
+    finally:
+        store.close()
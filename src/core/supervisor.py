@@ -0,0 +1,452 @@
+"""Module containing the supervisor, which owns the lifecycle of the pipeline processes.
+
+The supervisor starts the processes, checks their health, restarts processes which crashed
+and shuts the pipeline down gracefully. It is controlled by commands, which are sent by the
+hotkeys of main.py, the GUI or as JSON lines through a local socket:
+
+- "record" / "halt": Start and stop the recording.
+- "cancel": Interrupt the current reply.
+- "status": Return the state of all modules.
+- "restart": Restart the process given by "module".
+- "shutdown": Drain the queues and stop all processes.
+
+All commands are executed one after another by the thread which calls `run`. Run
+`python -m core.supervisor status` from the src folder to send a command to the running
+application.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+
+from core.processing import AbstractActionProcess
+from core.registry import Pipeline
+
+DEFAULT_CONTROL_PORT = 8765
+
+COMMANDS = ("record", "halt", "cancel", "status", "restart", "shutdown")
+
+
+class Supervisor:
+    """Starts, monitors, restarts and stops the processes of a pipeline."""
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        ready_timeout: float = None,
+        health_interval: float = 1.0,
+        max_restarts: int = 3,
+        restart_window: float = 300.0,
+        drain_timeout: float = 5.0,
+        shutdown_timeout: float = 10.0,
+        control_port: int = None,
+    ):
+        """Constructor.
+
+        Args:
+            pipeline (Pipeline): The pipeline which is supervised.
+            ready_timeout (float, optional): Maximal time in seconds for the warm up of the
+                        processes. Defaults to no limit.
+            health_interval (float, optional): Time between two health checks in seconds.
+                        Defaults to 1.
+            max_restarts (int, optional): Maximal number of restarts of a process within
+                        the restart window. A process which crashes more often is not
+                        restarted again. Defaults to 3.
+            restart_window (float, optional): Length of the restart window in seconds.
+                        Defaults to 300.
+            drain_timeout (float, optional): Maximal time in seconds the shutdown waits for
+                        the queued messages to be processed. Defaults to 5.
+            shutdown_timeout (float, optional): Maximal time in seconds the processes get to
+                        stop before they are terminated. Defaults to 10.
+            control_port (int, optional): Port on localhost at which commands are accepted.
+                        Defaults to no socket.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.pipeline = pipeline
+        self.ready_timeout = ready_timeout
+        self.health_interval = health_interval
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.drain_timeout = drain_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.control_port = control_port
+
+        # Commands together with the queue which receives their result
+        self._commands = queue.Queue()
+        self._stopped = threading.Event()
+        self._shutdown_requested = False
+
+        # Restart times of each process
+        self._restarts = {name: deque() for name in pipeline.modules}
+        # Processes which crashed too often and are not restarted again
+        self._failed = set()
+
+        self._server = None
+
+        self._handlers = {
+            "record": self.record,
+            "halt": self.halt,
+            "cancel": self.cancel,
+            "status": self.status,
+            "restart": self.restart,
+            "shutdown": self._request_shutdown,
+        }
+
+    @property
+    def recorders(self) -> list:
+        """The modules which do not run inside their own process, i.e. the recorder."""
+        return [
+            module
+            for module in self.pipeline.modules.values()
+            if not isinstance(module, AbstractActionProcess)
+        ]
+
+    def start(self) -> bool:
+        """Start all processes and the command sources. The processes are started in the
+        order of the configuration and warm up concurrently. Commands are only accepted once
+        all processes are ready, so that no recording starts before.
+
+        Returns:
+            bool: False if not all processes were ready within the ready timeout.
+        """
+        start_time = time.time()
+        self.pipeline.start()
+
+        ready = self.pipeline.wait_ready(self.ready_timeout)
+        if ready:
+            self.logger.info(f"Pipeline ready after {time.time() - start_time:.2f}s")
+        else:
+            not_ready = [
+                name
+                for name, module in self._processes().items()
+                if not module.is_ready()
+            ]
+            self.logger.error(f"Modules {not_ready} are not ready, check their logs")
+
+        threading.Thread(target=self._read_command_queue, daemon=True).start()
+
+        if self.control_port is not None:
+            self._server = _CommandServer(("127.0.0.1", self.control_port), self)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            self.logger.info(
+                f"Accepting commands on port {self._server.server_address[1]}"
+            )
+
+        return ready
+
+    def submit(self, command: dict | str, wait: bool = False, timeout: float = None):
+        """Queue a command for `run`. It can be called from any thread.
+
+        Args:
+            command (dict | str): The command, either its name or a dict whose key "command"
+                                  contains the name together with its arguments.
+            wait (bool, optional): Wait for the result of the command. Defaults to False.
+            timeout (float, optional): Maximal time to wait for the result.
+
+        Returns:
+            The result of the command if waited for, otherwise None.
+        """
+        if isinstance(command, str):
+            command = {"command": command}
+
+        if not wait:
+            self._commands.put((command, None))
+            return None
+
+        result = queue.Queue(1)
+        self._commands.put((command, result))
+        try:
+            return result.get(timeout=timeout)
+        except queue.Empty:
+            return {"ok": False, "error": "The command timed out"}
+
+    def run(self) -> None:
+        """Execute the commands and check the health of the processes until the pipeline is
+        shut down."""
+        next_check = time.time() + self.health_interval
+        while not self._stopped.is_set():
+            try:
+                command, result = self._commands.get(
+                    timeout=max(next_check - time.time(), 0)
+                )
+            except queue.Empty:
+                pass
+            else:
+                reply = self._execute(command)
+                if result is not None:
+                    result.put(reply)
+
+            if self._shutdown_requested:
+                self.shutdown()
+            elif time.time() >= next_check:
+                self.check_health()
+                next_check = time.time() + self.health_interval
+
+    def wait(self, timeout: float = None) -> bool:
+        """Wait until the pipeline was shut down.
+
+        Returns:
+            bool: False if the timeout was reached.
+        """
+        return self._stopped.wait(timeout)
+
+    def _execute(self, command: dict) -> dict:
+        """Execute a command and return its result in the form which is sent to clients."""
+        name = command.get("command", None)
+        if name not in self._handlers:
+            self.logger.warning(f"Unknown command {name}")
+            return {"ok": False, "error": f"Unknown command {name}"}
+
+        arguments = {key: value for key, value in command.items() if key != "command"}
+        self.logger.info(f"Command {name} {arguments if arguments else ''}")
+        try:
+            return {"ok": True, "result": self._handlers[name](**arguments)}
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            self.logger.exception(f"Command {name} failed")
+            return {"ok": False, "error": repr(error)}
+
+    def _read_command_queue(self) -> None:
+        """Forward the commands of the modules, e.g. the buttons of the GUI."""
+        while not self._stopped.is_set():
+            try:
+                command = self.pipeline.command_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                # The queue was closed during the shutdown
+                return
+
+            self.submit(command)
+
+    def _processes(self) -> dict:
+        return {
+            name: module
+            for name, module in self.pipeline.modules.items()
+            if isinstance(module, AbstractActionProcess)
+        }
+
+    def record(self) -> None:
+        """Start the recording."""
+        for module in self.recorders:
+            module.start()
+
+    def halt(self) -> None:
+        """Stop the recording, the current utterance is still sent."""
+        for module in self.recorders:
+            if module.is_active():
+                module.halt()
+
+    def cancel(self, session_id: str = None) -> None:
+        """Interrupt the current reply of the session."""
+        self.pipeline.control_bus.cancel(session_id)
+
+    def status(self) -> dict:
+        """Return the state of each module."""
+        status = dict()
+        for name, module in self.pipeline.modules.items():
+            if not isinstance(module, AbstractActionProcess):
+                status[name] = {"recording": module.is_active()}
+                continue
+
+            status[name] = {
+                "pid": module.pid,
+                "alive": module.is_alive(),
+                "ready": module.is_ready(),
+                "exitcode": module.exitcode,
+                "restarts": len(self._restarts[name]),
+                "failed": name in self._failed,
+            }
+
+        return status
+
+    def check_health(self) -> None:
+        """Restart the processes which ended unexpectedly."""
+        for name, module in self._processes().items():
+            if module.is_alive() or module.exitcode is None or name in self._failed:
+                continue
+
+            if module.exitcode == 0:
+                # The module stopped itself, e.g. the GUI whose window was closed
+                self.logger.warning(f"Module {name} stopped")
+                self._failed.add(name)
+                continue
+
+            self.logger.error(f"Module {name} crashed with exit code {module.exitcode}")
+            self.restart(name)
+
+    def restart(self, module: str) -> bool:
+        """Stop the process of the module if it is still running and start a new one.
+
+        Args:
+            module (str): Name of the module inside the configuration.
+
+        Returns:
+            bool: False if the module was restarted too often within the restart window.
+        """
+        name = module
+        if name not in self._processes():
+            raise ValueError(f"{name} is not a module with its own process")
+
+        restarts = self._restarts[name]
+        now = time.time()
+        while restarts and now - restarts[0] > self.restart_window:
+            restarts.popleft()
+
+        if len(restarts) >= self.max_restarts:
+            self.logger.error(
+                f"Module {name} was restarted {len(restarts)} times within "
+                f"{self.restart_window:.0f}s, it is not restarted again"
+            )
+            self._failed.add(name)
+            return False
+
+        restarts.append(now)
+        self._failed.discard(name)
+
+        self._stop_processes([self.pipeline.modules[name]], self.shutdown_timeout)
+
+        self.logger.info(f"Restart module {name}")
+        self.pipeline.recreate(name).start()
+        return True
+
+    def _request_shutdown(self) -> str:
+        # The shutdown is run after the result was sent
+        self._shutdown_requested = True
+        return "shutting down"
+
+    def shutdown(self) -> None:
+        """Stop the recording, wait until the queued messages were processed and stop all
+        processes. Processes which do not stop within the shutdown timeout are terminated."""
+        if self._stopped.is_set():
+            return
+
+        start_time = time.time()
+        self.logger.info("Shutting down")
+
+        # The last utterance is still sent and answered
+        self.halt()
+        self._drain()
+
+        for module in self.recorders:
+            module.close()
+
+        self._stop_processes(list(self._processes().values()), self.shutdown_timeout)
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+        self._stopped.set()
+        self.pipeline.transport.close()
+
+        self.logger.info(f"Shut down after {time.time() - start_time:.2f}s")
+
+    def _drain(self) -> None:
+        """Wait until the input queues of all running processes stay empty."""
+        end_time = time.time() + self.drain_timeout
+        empty_checks = 0
+        while time.time() < end_time and empty_checks < 3:
+            if all(
+                module.input_queue.empty()
+                for module in self._processes().values()
+                if module.is_alive()
+            ):
+                empty_checks += 1
+            else:
+                empty_checks = 0
+            time.sleep(0.1)
+
+        if empty_checks < 3:
+            self.logger.warning("Not all queued messages were processed before the shutdown")
+
+    def _stop_processes(self, modules: list, timeout: float) -> None:
+        """Ask the processes to stop, then terminate and finally kill the ones which are
+        still running after the timeout."""
+        running = [module for module in modules if module.is_alive()]
+        for module in running:
+            module.kill()
+
+        end_time = time.time() + timeout
+        for module in running:
+            module.join(max(end_time - time.time(), 0))
+
+        for module in running:
+            if module.is_alive():
+                self.logger.warning(f"{module.__class__.__name__} did not stop, terminate it")
+                module.terminate()
+                module.join(1.0)
+
+            if module.is_alive():
+                # `kill` of the module only sets its stop event
+                mp.Process.kill(module)
+                module.join()
+
+
+class _CommandServer(socketserver.ThreadingTCPServer):
+    """Accepts one JSON command per line, or only the name of a command, and replies with
+    the result as JSON line."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, supervisor: Supervisor):
+        self.supervisor = supervisor
+        super().__init__(address, _CommandHandler)
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.decode().strip()
+            if not line:
+                continue
+
+            try:
+                command = json.loads(line) if line.startswith("{") else line
+            except json.JSONDecodeError as error:
+                reply = {"ok": False, "error": f"Invalid command: {error}"}
+            else:
+                reply = self.server.supervisor.submit(command, wait=True, timeout=60.0)
+
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+def send_command(
+    command: dict | str, port: int = DEFAULT_CONTROL_PORT, timeout: float = 60.0
+) -> dict:
+    """Send a command to the supervisor of a running application and return its result."""
+    if isinstance(command, str):
+        command = {"command": command}
+
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as connection:
+        connection.sendall((json.dumps(command) + "\n").encode())
+        return json.loads(connection.makefile().readline())
+
+
+def main() -> None:
+    """Send a command to the running application and print the result."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("module", nargs="?", help="Module of the restart command")
+    parser.add_argument("--port", type=int, default=DEFAULT_CONTROL_PORT)
+    args = parser.parse_args()
+
+    command = {"command": args.command}
+    if args.module is not None:
+        command["module"] = args.module
+
+    print(json.dumps(send_command(command, args.port), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Module containing the transports which provide the queues and events used to connect
+the processing modules."""
+
+from __future__ import annotations
+
+import collections
+import logging
+import multiprocessing as mp
+import struct
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from multiprocessing import context, util
+from multiprocessing.managers import SyncManager
+from queue import Empty, Full
+
+from core.message import Message, decode, encode
+
+logger = logging.getLogger(__name__)
+
+
+class Transport(ABC):
+    """Factory for the inter process primitives used by the processing modules."""
+
+    @abstractmethod
+    def queue(self, maxsize: int = 0):
+        """Return a new queue which can be used between processes."""
+
+    @abstractmethod
+    def event(self):
+        """Return a new event which can be used between processes."""
+
+    @abstractmethod
+    def list(self) -> list:
+        """Return a new list which is used to store the output queues of a module."""
+
+    def recover_queue(self, queue) -> None:
+        """Make a queue usable for a new reader after its previous reader was killed."""
+
+    def close(self) -> None:
+        """Free the resources of the transport once all modules were stopped."""
+
+
+class ManagerTransport(Transport):
+    """Transport which creates all primitives through a `SyncManager`.
+
+    Every operation is a round trip to the manager process, but queues can be connected
+    even after the modules have been started.
+    """
+
+    def __init__(self, manager: SyncManager):
+        self.manager = manager
+
+    def queue(self, maxsize: int = 0):
+        return self.manager.Queue(maxsize)
+
+    def event(self):
+        return self.manager.Event()
+
+    def list(self) -> list:
+        return self.manager.list()
+
+    def close(self) -> None:
+        # Stops the manager process
+        self.manager.shutdown()
+
+
+class DirectTransport(Transport):
+    """Transport which uses `multiprocessing` queues and events directly.
+
+    The data is send through pipes between the processes without passing the manager
+    process. The output queues are stored inside a plain list which is copied into the
+    process when it is started, so all modules have to be connected before they are started.
+    """
+
+    def __init__(self, context=None):
+        """Constructor.
+
+        Args:
+            context (optional): Multiprocessing context used to create the primitives.
+                                Defaults to the default context.
+        """
+        self.context = context if context is not None else mp.get_context()
+
+    def queue(self, maxsize: int = 0):
+        return self.context.Queue(maxsize)
+
+    def event(self):
+        return self.context.Event()
+
+    def list(self) -> list:
+        return list()
+
+    def recover_queue(self, queue) -> None:
+        # A process which is killed while it waits inside `get` never releases the lock of
+        # the readers. Only the module itself reads its queues, so a new lock is passed to
+        # the new process, the writers do not use it.
+        # pylint: disable=protected-access
+        queue._rlock = self.context.Lock()
+
+
+class FramedTransport(DirectTransport):
+    """Transport which sends the messages through pipes like the `DirectTransport`, but
+    encodes them as `Message` frames instead of pickling the dicts. Numpy payloads are
+    written to the pipe without being copied into a pickle, which pays off for audio.
+    """
+
+    def queue(self, maxsize: int = 0):
+        return FramedQueue(maxsize, self.context)
+
+
+_PREFIX = struct.Struct("<BH")
+_SIZE = struct.Struct("<Q")
+# Frames up to this size are sent together with the prefix in a single write
+_INLINE_LIMIT = 64 * 1024
+_DICT, _MESSAGE, _OBJECT = range(3)
+_SENTINEL = object()
+
+
+class FramedQueue:
+    """Queue between processes which sends each item as frames of the `Message` codec.
+
+    Dicts are converted into a `Message` and back, other objects are sent as its payload.
+    Like for a `multiprocessing.Queue` the items are encoded and written to the pipe by a
+    feeder thread, so `put` does not wait for the reader. The small frames of an item are
+    sent in a single write, larger frames are written separately without copying them.
+    """
+
+    def __init__(self, maxsize: int = 0, ctx=None):
+        """Constructor.
+
+        Args:
+            maxsize (int, optional): Maximum number of items, 0 for no limit. Defaults to 0.
+            ctx (optional): Multiprocessing context used to create the locks. Defaults to
+                            the default context.
+        """
+        ctx = ctx if ctx is not None else mp.get_context()
+        self._maxsize = maxsize
+        self._reader, self._writer = ctx.Pipe(duplex=False)
+        self._rlock = ctx.Lock()
+        self._wlock = ctx.Lock()
+        self._sem = ctx.BoundedSemaphore(maxsize) if maxsize > 0 else None
+        self._reset()
+
+        util.register_after_fork(self, FramedQueue._reset)
+
+    def __getstate__(self):
+        context.assert_spawning(self)
+        return (
+            self._maxsize,
+            self._reader,
+            self._writer,
+            self._rlock,
+            self._wlock,
+            self._sem,
+        )
+
+    def __setstate__(self, state):
+        (
+            self._maxsize,
+            self._reader,
+            self._writer,
+            self._rlock,
+            self._wlock,
+            self._sem,
+        ) = state
+        self._reset()
+
+    def _reset(self) -> None:
+        self._buffer = collections.deque()
+        self._notempty = threading.Condition(threading.Lock())
+        self._thread = None
+
+    def put(self, obj, block: bool = True, timeout: float = None) -> None:
+        """Put an item into the queue, raise `queue.Full` if no slot became free."""
+        if self._sem is not None and not self._sem.acquire(block, timeout):
+            raise Full
+
+        with self._notempty:
+            if self._thread is None:
+                self._start_thread()
+            self._buffer.append(obj)
+            self._notempty.notify()
+
+    def put_nowait(self, obj) -> None:
+        self.put(obj, False)
+
+    def get(self, block: bool = True, timeout: float = None):
+        """Remove and return an item, raise `queue.Empty` if none arrived in time."""
+        if block and timeout is None:
+            with self._rlock:
+                kind, frames = self._recv()
+        else:
+            deadline = time.monotonic() + timeout if block else None
+            if not self._rlock.acquire(block, timeout):
+                raise Empty
+            try:
+                remaining = max(deadline - time.monotonic(), 0) if block else 0
+                if not self._reader.poll(remaining):
+                    raise Empty
+                kind, frames = self._recv()
+            finally:
+                self._rlock.release()
+
+        if self._sem is not None:
+            self._sem.release()
+
+        # The frames are decoded after the lock was released
+        message = decode(frames)
+        if kind == _DICT:
+            return message.to_dict()
+        if kind == _MESSAGE:
+            return message
+
+        return message.data
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def empty(self) -> bool:
+        return not self._reader.poll()
+
+    def _recv(self) -> tuple:
+        # The small frames are copied into a bytearray, so that the arrays decoded from
+        # them are writable like those of the large frames
+        prefix = memoryview(bytearray(self._reader.recv_bytes()))
+        kind, count = _PREFIX.unpack_from(prefix)
+        offset = _PREFIX.size
+        sizes = [
+            _SIZE.unpack_from(prefix, offset + i * _SIZE.size)[0] for i in range(count)
+        ]
+        offset += count * _SIZE.size
+
+        frames = []
+        for size in sizes:
+            if size < _INLINE_LIMIT:
+                frames.append(prefix[offset : offset + size])
+                offset += size
+            else:
+                # Received into a bytearray, so that arrays decoded from it are writable
+                frame = bytearray(size)
+                self._reader.recv_bytes_into(frame)
+                frames.append(frame)
+
+        return kind, frames
+
+    def _start_thread(self) -> None:
+        self._thread = threading.Thread(
+            target=FramedQueue._feed,
+            args=(self._buffer, self._notempty, self._writer, self._wlock, self._sem),
+            name="FramedQueueFeederThread",
+            daemon=True,
+        )
+        self._thread.start()
+
+        # The items are sent before the process exits, like by `multiprocessing.Queue`
+        util.Finalize(
+            self._thread,
+            FramedQueue._finalize_join,
+            [weakref.ref(self._thread)],
+            exitpriority=-5,
+        )
+        util.Finalize(
+            self,
+            FramedQueue._finalize_close,
+            [self._buffer, self._notempty],
+            exitpriority=10,
+        )
+
+    @staticmethod
+    def _finalize_join(thread_ref) -> None:
+        thread = thread_ref()
+        if thread is not None:
+            thread.join()
+
+    @staticmethod
+    def _finalize_close(buffer, notempty) -> None:
+        with notempty:
+            buffer.append(_SENTINEL)
+            notempty.notify()
+
+    @staticmethod
+    def _feed(buffer, notempty, writer, wlock, sem) -> None:
+        while True:
+            with notempty:
+                while not buffer:
+                    notempty.wait()
+                obj = buffer.popleft()
+
+            if obj is _SENTINEL:
+                return
+
+            try:
+                if isinstance(obj, dict):
+                    kind, frames = _DICT, encode(Message.from_dict(obj))
+                elif isinstance(obj, Message):
+                    kind, frames = _MESSAGE, encode(obj)
+                else:
+                    kind, frames = _OBJECT, encode(Message(obj))
+
+                sizes = [memoryview(frame).nbytes for frame in frames]
+                prefix = [_PREFIX.pack(kind, len(frames))]
+                prefix.extend(_SIZE.pack(size) for size in sizes)
+                prefix.extend(
+                    frame for frame, size in zip(frames, sizes) if size < _INLINE_LIMIT
+                )
+
+                with wlock:
+                    writer.send_bytes(b"".join(prefix))
+                    for frame, size in zip(frames, sizes):
+                        if size >= _INLINE_LIMIT:
+                            writer.send_bytes(frame)
+            except Exception:  # pylint: disable=broad-except
+                if util.is_exiting():
+                    return
+
+                # The item is dropped, so its slot is freed again
+                logger.exception("Could not send an item of a framed queue")
+                if sem is not None:
+                    sem.release()
+
+
+def as_transport(manager: SyncManager | Transport) -> Transport:
+    """Return the given transport, or wrap a `SyncManager` into a `ManagerTransport`."""
+    if isinstance(manager, Transport):
+        return manager
+
+    return ManagerTransport(manager)
@@ -0,0 +1,386 @@
+"""Module containing the worker pool of processing modules with several workers.
+
+The process of the module takes the messages from its input queue and passes them to the
+workers, which process them concurrently. Thread workers share the models of the module and
+are suitable for modules which mostly wait for an API. Process workers load their own copy
+of the models and can use several CPU cores or model replicas. The cancel commands of the
+module are forwarded to them, so `is_cancelled` and `on_cancel` work in both modes.
+
+The output is sent by the process of the module in the order of the input messages of each
+session, so a message whose processing finished early waits for the messages of its session
+which were received before.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import zlib
+from collections import deque
+from typing import Callable, Literal
+
+from core.metrics import MetricsExporter, ModuleMetrics
+
+# Metadata key which identifies the session of a message. Messages without it belong to
+# one common session.
+SESSION_KEY = "session_id"
+
+_logger = logging.getLogger("WorkerPool")
+
+
+class _Entry:
+    """A message which is processed by a worker and its output which is not sent yet."""
+
+    __slots__ = ("in_data", "outputs", "done")
+
+    def __init__(self, in_data: dict):
+        self.in_data = in_data
+        self.outputs = []
+        self.done = False
+
+
+class OrderedOutput:
+    """Sends the output of concurrently processed messages in the order of their input
+    messages per session. The methods are thread safe."""
+
+    def __init__(self, send: Callable, done: Callable):
+        """Constructor.
+
+        Args:
+            send (Callable): Called with the output and the input data to send an output.
+            done (Callable): Called with the input data once all its output was sent.
+        """
+        self._send = send
+        self._done = done
+
+        self._sessions = dict()
+        self._lock = threading.Lock()
+
+    def add(self, in_data: dict) -> _Entry:
+        """Add a message in the order in which it was received."""
+        entry = _Entry(in_data)
+        with self._lock:
+            self._sessions.setdefault(in_data.get(SESSION_KEY, None), deque()).append(
+                entry
+            )
+
+        return entry
+
+    def emit(self, entry: _Entry, out_data: dict) -> None:
+        """Send an output of the message, or keep it until the previous messages of the
+        session are done."""
+        with self._lock:
+            entry.outputs.append(out_data)
+            self._flush(entry.in_data.get(SESSION_KEY, None))
+
+    def finish(self, entry: _Entry) -> None:
+        """Mark the message as done."""
+        with self._lock:
+            entry.done = True
+            self._flush(entry.in_data.get(SESSION_KEY, None))
+
+    def _flush(self, session) -> None:
+        # The oldest message of the session streams its output directly, the output of
+        # the others is kept until it is their turn
+        entries = self._sessions[session]
+        while entries:
+            entry = entries[0]
+            for out_data in entry.outputs:
+                self._send(out_data, entry.in_data)
+            entry.outputs.clear()
+
+            if not entry.done:
+                return
+
+            entries.popleft()
+            self._done(entry.in_data)
+
+        del self._sessions[session]
+
+
+def process_task(module, batch: list, emit: Callable, finish: Callable) -> None:
+    """Process a batch of messages and pass each output with the index of its input.
+
+    Args:
+        module (AbstractActionProcess): The module which processes the batch.
+        batch (list): The input messages.
+        emit (Callable): Called with the index of the input message and an output.
+        finish (Callable): Called with the index of the input message once it is done.
+    """
+    try:
+        results = list(module.process_batch(batch))
+    except Exception:  # pylint: disable=broad-exception-caught
+        _logger.exception("Failed to process a batch")
+        results = []
+
+    for i in range(len(batch)):
+        try:
+            out_data = results[i] if i < len(results) else None
+            if out_data is not None:
+                # Streaming modules return an iterator over the partial messages
+                if isinstance(out_data, dict):
+                    out_data = (out_data,)
+
+                for data in out_data:
+                    emit(i, data)
+        except Exception:  # pylint: disable=broad-exception-caught
+            _logger.exception("Failed to create the output of a message")
+        finally:
+            finish(i)
+
+
+def parent_exited() -> bool:
+    """Return true if the process which started the current process ended."""
+    parent = mp.parent_process()
+    if parent is None:
+        return False
+
+    # Forked siblings inherit the sentinel of the parent, so it is not closed while they
+    # run. On POSIX an orphaned process is also detected by its new parent id.
+    return not parent.is_alive() or os.getppid() != parent.pid
+
+
+def _run_worker_control(module, control) -> None:
+    """Apply the cancel commands which the process of the module forwarded to a worker."""
+    while True:
+        command = control.get()
+        if command is None:
+            break
+
+        module._cancel(command)  # pylint: disable=protected-access
+
+
+def _process_worker(module, tasks, results, control) -> None:
+    """Main function of a process worker. The worker loads its own models and sends the
+    output back to the process of the module."""
+    module.metrics = ModuleMetrics(module.__class__.__name__, module.label)
+
+    # The control thread of the module process does not exist inside the worker
+    threading.Thread(
+        target=_run_worker_control, args=(module, control), daemon=True
+    ).start()
+
+    exporter = None
+    if os.environ.get("METRICS_DIRECTORY", None):
+        exporter = MetricsExporter(
+            module.metrics,
+            os.environ["METRICS_DIRECTORY"],
+            float(os.environ.get("METRICS_INTERVAL", 10.0)),
+        )
+        exporter.start()
+
+    module.warm_up()
+    results.put(("ready", None, None, None))
+
+    # The worker stops if the process of the module was terminated
+    while True:
+        try:
+            task = tasks.get(timeout=1.0)
+        except queue.Empty:
+            if parent_exited():
+                break
+            continue
+
+        if task is None:
+            break
+
+        task_id, batch = task
+        process_task(
+            module,
+            batch,
+            lambda i, out_data, task_id=task_id: results.put(
+                ("output", task_id, i, out_data)
+            ),
+            lambda i, task_id=task_id: results.put(("done", task_id, i, None)),
+        )
+
+    module.clean_up()
+
+    if exporter is not None:
+        exporter.stop()
+
+
+class WorkerPool:
+    """Workers which process the input messages of a module concurrently."""
+
+    def __init__(
+        self,
+        module,
+        workers: int,
+        mode: Literal["thread", "process"] = "thread",
+        serialize_sessions: bool = False,
+        max_pending: int = None,
+    ):
+        """Constructor.
+
+        Args:
+            module (AbstractActionProcess): The module whose messages are processed.
+            workers (int): Number of workers.
+            mode (Literal["thread", "process"], optional): Kind of the workers.
+                Defaults to "thread".
+            serialize_sessions (bool, optional): Process the messages of a session one after
+                another by the same worker. Otherwise they are processed concurrently and
+                only their output is ordered. Defaults to False.
+            max_pending (int, optional): Maximal number of messages which are passed to the
+                workers but not done yet. Defaults to twice the number of workers.
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker mode {mode}")
+
+        self.module = module
+        self.workers = workers
+        self.mode = mode
+        self.serialize_sessions = serialize_sessions
+        self.max_pending = max_pending if max_pending is not None else 2 * workers
+
+        self.output = OrderedOutput(module.send_output, self._done)
+
+        self._pending = 0
+        self._condition = threading.Condition()
+
+        self._tasks = dict()
+        self._next_task_id = 0
+
+        self._task_queues = []
+        self._threads = []
+        self._processes = []
+        self._results = None
+        self._controls = []
+
+    def start(self) -> None:
+        """Start the workers and wait until they finished their warm up."""
+        queue_type = queue.Queue if self.mode == "thread" else mp.Queue
+
+        # Sessions are assigned to a fixed worker if their messages are processed serially,
+        # otherwise all workers share one queue
+        if self.serialize_sessions:
+            self._task_queues = [queue_type() for _ in range(self.workers)]
+        else:
+            self._task_queues = [queue_type()] * self.workers
+
+        if self.mode == "thread":
+            # The threads share the models of the module
+            self.module.warm_up()
+            for tasks in self._task_queues:
+                thread = threading.Thread(
+                    target=self._thread_worker, args=(tasks,), daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            return
+
+        self._results = mp.Queue()
+        self._controls = [mp.Queue() for _ in self._task_queues]
+        for tasks, control in zip(self._task_queues, self._controls):
+            process = mp.Process(
+                target=_process_worker,
+                args=(self.module, tasks, self._results, control),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+        for _ in self._processes:
+            self._results.get()
+
+        reader = threading.Thread(target=self._read_results, daemon=True)
+        reader.start()
+        self._threads.append(reader)
+
+    def submit(self, batch: list) -> None:
+        """Pass a batch of messages to the workers. Waits while too many messages are
+        pending."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending < self.max_pending)
+            self._pending += len(batch)
+
+        entries = [self.output.add(in_data) for in_data in batch]
+
+        if self.serialize_sessions:
+            # Each message is passed to the worker of its session
+            for entry in entries:
+                self._put(
+                    self._worker_of(entry.in_data.get(SESSION_KEY, None)), [entry]
+                )
+        else:
+            self._put(0, entries)
+
+    def forward_control(self, command: dict) -> None:
+        """Pass a control command of the module to the process workers. Thread workers
+        share the module, so they need no forwarding."""
+        for control in self._controls:
+            control.put(command)
+
+    def stop(self) -> None:
+        """Wait until the pending messages are done and stop the workers."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending == 0)
+
+        for tasks in self._task_queues[: self.workers]:
+            tasks.put(None)
+
+        for control in self._controls:
+            control.put(None)
+
+        for process in self._processes:
+            process.join()
+
+        if self._results is not None:
+            self._results.put(None)
+
+        for thread in self._threads:
+            thread.join()
+
+    def _put(self, worker: int, entries: list) -> None:
+        batch = [entry.in_data for entry in entries]
+
+        if self.mode == "thread":
+            self._task_queues[worker].put(entries)
+            return
+
+        # The output of a process worker is assigned to the entries by the task id
+        task_id = self._next_task_id
+        self._next_task_id += 1
+        self._tasks[task_id] = entries
+        self._task_queues[worker].put((task_id, batch))
+
+    def _worker_of(self, session) -> int:
+        return zlib.crc32(str(session).encode()) % self.workers
+
+    def _thread_worker(self, tasks) -> None:
+        while True:
+            entries = tasks.get()
+            if entries is None:
+                break
+
+            process_task(
+                self.module,
+                [entry.in_data for entry in entries],
+                lambda i, out_data: self.output.emit(entries[i], out_data),
+                lambda i: self.output.finish(entries[i]),
+            )
+
+    def _read_results(self) -> None:
+        while True:
+            result = self._results.get()
+            if result is None:
+                break
+
+            kind, task_id, i, out_data = result
+            entries = self._tasks[task_id]
+            if kind == "output":
+                self.output.emit(entries[i], out_data)
+            else:
+                self.output.finish(entries[i])
+                if all(entry.done for entry in entries):
+                    del self._tasks[task_id]
+
+    def _done(self, in_data: dict) -> None:
+        self.module._record_done(in_data)  # pylint: disable=protected-access
+
+        with self._condition:
+            self._pending -= 1
+            self._condition.notify_all()
@@ -1,87 +1,536 @@
-"""Module for graphical user interface using eel."""
+"""Module for graphical user interface using eel.
 
+Besides the window of the local learner, further browsers can open the page with the
+parameter `?session=<id>`. Their input is sent with the session id, so the following
+modules answer it within its own conversation. The messages and the audio of a session are
+only sent to the pages of the session, and the exposed functions only act within the
+session of the calling page. The application is only controlled by the window of the local
+learner, which is opened with a random token.
+"""
+
+import base64
+import itertools
+import json
+import secrets
+import time
+from collections import OrderedDict
 from multiprocessing import Queue
 from multiprocessing.managers import SyncManager
+from queue import Empty
 from typing import Iterable
 
-import eel
 from core.processing import AbstractActionProcess
+from core.session_store import SessionStore
+from core.transport import Transport
+from core.workers import SESSION_KEY
 
 
 class EelGuiModule(AbstractActionProcess):
     """Graphical user interface using eel."""
 
+    # Partial messages are shown as soon as they arrive
+    accepts_partial = True
+
+    # Pending messages are sent to the frontend together
+    batch_size = 64
+
+    # The conversation is shown completely, also the replies which were interrupted or
+    # arrived after their deadline
+    cancellable = False
+    expires = False
+
+    # The position in the history is only valid for the message the GUI received, it must
+    # not be passed on to the replies of the following modules
+    LOCAL_KEYS = ("history_index",)
+
     def __init__(
         self,
-        manager: SyncManager,
+        manager: SyncManager | Transport,
         *args,
         output_queues: Iterable[Queue] = None,
+        poll_timeout: float = 0.5,
+        session_id: str = "default",
+        session_store_path: str = None,
+        history_tail_size: int = 500,
+        max_sessions: int = 100,
+        headless: bool = False,
         **kwargs,
     ):
+        """Constructor.
+
+        Args:
+            poll_timeout (float, optional): Maximal time in seconds the process waits for a
+                                            message before checking the stop event.
+                                            Defaults to 0.5.
+            session_id (str, optional): Id of the stored session of the local learner, an
+                                        existing session is continued. Remote sessions
+                                        are stored with their own id. Defaults to
+                                        "default".
+            session_store_path (str, optional): Path of the session database. Defaults to
+                                        the default of `SessionStore`.
+            history_tail_size (int, optional): Number of the newest messages which are kept
+                                        in memory. Defaults to 500.
+            max_sessions (int, optional): Maximal number of remote sessions whose history
+                                        is kept open. Defaults to 100.
+            headless (bool, optional): Do not start the frontend. The messages are stored
+                                        and counted as if they were delivered, which is used
+                                        by the benchmarks. Defaults to False.
+        """
         super().__init__(manager, "gui", *args, output_queues=output_queues, **kwargs)
-        self.history: list = list()
+        # History of the local learner and of the remote sessions
+        self.history: SessionStore = None
+        self.session_histories = OrderedDict()
+        self.poll_timeout = poll_timeout
+        self.session_id = session_id
+        self.session_store_path = session_store_path
+        self.history_tail_size = history_tail_size
+        self.max_sessions = max_sessions
+        self.headless = headless
 
-    def run(self, *args, **kwargs) -> None:
+        # Connected pages of the frontend by their id
+        self.pages = dict()
+        self._page_ids = itertools.count()
+        # Only the window of the local learner knows the token
+        self.page_token = None
+        # The function of eel which serves the web sockets
+        self._eel_websocket = None
+
+        # Ready events of the modules which have to finish their warm up before the input
+        # of the frontend is accepted
+        self._pipeline_ready_events = []
+        self.pipeline_ready = False
+
+        # Delivery statistic
+        self.delivered_messages = 0
+        self.delivered_batches = 0
+        self.max_queue_depth = 0
+        self.latency_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def wait_for(self, *modules: AbstractActionProcess) -> None:
+        """Accept input of the frontend only after the given modules are ready. This has to
+        be called before the module is started."""
+        self._pipeline_ready_events.extend(module._e_ready for module in modules)
+
+    def warm_up(self) -> None:
         # Set global object so that the function used for eel can also access the object
         # pylint: disable=global-statement
         global _GUI_MODULE
         _GUI_MODULE = self
         # pylint: enable=global-statement
 
+        self.history = SessionStore(
+            self.session_store_path, self.session_id, self.history_tail_size
+        )
+
+        if self.headless:
+            return
+
+        # pylint: disable=import-outside-toplevel
+        import eel
+
+        eel.expose(register_page)
+        eel.expose(process_frontend_text)
+        eel.expose(get_history)
+        eel.expose(is_pipeline_ready)
+        eel.expose(send_command)
+
+        # The web sockets of the pages are served by `_page_websocket`
+        websocket_route, options = eel.BOTTLE_ROUTES["/eel"]
+        eel.BOTTLE_ROUTES["/eel"] = (_page_websocket, options)
+        self._eel_websocket = websocket_route
+
+        self.page_token = secrets.token_urlsafe(16)
         eel.init("resources/web_folder")
-        eel.start("main.html", block=False, size=(1000, 1000))
+        eel.start(
+            f"main.html?token={self.page_token}",
+            block=False,
+            size=(1000, 1000),
+            close_callback=_on_window_closed,
+        )
+
+    def _update_pipeline_ready(self) -> None:
+        if self.pipeline_ready:
+            return
+
+        if all(event.is_set() for event in self._pipeline_ready_events):
+            self.logger.info("Pipeline is ready")
+            self.pipeline_ready = True
+
+            if not self.headless:
+                # pylint: disable=import-outside-toplevel
+                import eel
+
+                eel.set_ready(True)
+
+    def _get_batch(self) -> list:
+        """Wait for the next messages without blocking the greenlets of eel."""
+        self._update_pipeline_ready()
+
+        if self.headless:
+            try:
+                batch = [self.input_queue.get(timeout=self.poll_timeout)]
+            except Empty:
+                return []
+        else:
+            batch = self._get_first_message()
+            if len(batch) == 0:
+                return []
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.input_queue.get_nowait())
+            except Empty:
+                break
+
+        return batch
 
-        super().run(*args, **kwargs)
+    def _get_first_message(self) -> list:
+        # pylint: disable=import-outside-toplevel
+        import gevent
 
-    def process(self, data_in: dict) -> None:
-        self.history.append(data_in)
-        eel.update(data_in)
+        # The blocking get runs inside a thread of the gevent pool, so the web socket of
+        # eel is served while the process waits for messages
+        try:
+            return [
+                gevent.get_hub().threadpool.apply(
+                    self.input_queue.get, kwds={"timeout": self.poll_timeout}
+                )
+            ]
+        except Empty:
+            return []
+
+    def local_session(self, session_id: str = None) -> str | None:
+        """Return the session id of a message or page, None is the local learner."""
+        if session_id == self.session_id:
+            return None
+
+        return session_id
+
+    def session_history(self, session_id: str = None) -> SessionStore:
+        """Return the history of a session. Messages without session id belong to the
+        local learner. If more than `max_sessions` remote histories are open, the least
+        recently used one is closed."""
+        session_id = self.local_session(session_id)
+        if session_id is None:
+            return self.history
+
+        if session_id in self.session_histories:
+            self.session_histories.move_to_end(session_id)
+            return self.session_histories[session_id]
+
+        history = SessionStore(
+            self.session_store_path, session_id, self.history_tail_size
+        )
+        self.session_histories[session_id] = history
+
+        while len(self.session_histories) > self.max_sessions:
+            _, removed = self.session_histories.popitem(last=False)
+            removed.close()
+
+        return history
+
+    def open_page(self, websocket) -> "_Page":
+        """Add the web socket of a new page, it has no session until it registers."""
+        page = _Page(next(self._page_ids), websocket)
+        self.pages[page.page_id] = page
+        return page
+
+    def close_page(self, page: "_Page") -> None:
+        """Remove a closed page. The history of a remote session is closed together with
+        its last page."""
+        self.pages.pop(page.page_id, None)
+
+        session_id = page.session_id
+        if session_id is None or any(
+            other.session_id == session_id for other in self.pages.values()
+        ):
+            return
+
+        history = self.session_histories.pop(session_id, None)
+        if history is not None:
+            history.close()
+
+    @staticmethod
+    def is_audio(data_in: dict) -> bool:
+        """Return true if the message contains the 16 bit PCM audio of a remote session,
+        which was sent by a TTS module."""
+        return "sampling_rate" in data_in
+
+    def process(self, data_in: dict) -> dict | None:
+        # The audio is only played by the browser of the session
+        if self.is_audio(data_in):
+            return None
+
+        # The final message of a stream contains the complete text, so the partial messages
+        # are not needed for the history
+        if not self.is_partial(data_in):
+            history = self.session_history(data_in.get(SESSION_KEY, None))
+            # The index is used by the frontend to request the pages of the history
+            data_in["history_index"] = len(history)
+            history.append(data_in)
+
+        # Text entered in the frontend is forwarded to the following modules
+        if data_in.get("source", None) == "frontend":
+            return self.create_output_data(data_in["data"], language="en")
 
         return None
 
-    def clean_up(self):
-        pass
+    def process_batch(self, batch: list) -> list:
+        outputs = [self.process(data_in) for data_in in batch]
+
+        # The messages of each session are written in one transaction
+        for session_id in {data_in.get(SESSION_KEY, None) for data_in in batch}:
+            self.session_history(session_id).flush()
+
+        if not self.headless:
+            self._send_to_frontend(batch)
+
+        self._update_statistic(batch)
+
+        return outputs
+
+    def _send_to_frontend(self, batch: list) -> None:
+        # Each page only receives the messages and the audio of its own session
+        sessions = dict()
+        for data_in in batch:
+            session_id = self.local_session(data_in.get(SESSION_KEY, None))
+            sessions.setdefault(session_id, []).append(data_in)
+
+        for page in list(self.pages.values()):
+            if not page.registered or page.session_id not in sessions:
+                continue
 
-    def _run(self, **kwargs) -> None:
-        """Run function which executes the process method."""
-        while not self._e_stop_process.is_set():
-            # Get data to process
-            eel.sleep(1)
-            if not self.input_queue.empty():
-                in_data = self.input_queue.get(block=False)
+            messages = sessions[page.session_id]
+            texts = [data_in for data_in in messages if not self.is_audio(data_in)]
+            if texts:
+                page.call("update_batch", texts)
 
-                # Process the data
-                self.process(in_data)
+            for data_in in messages:
+                if self.is_audio(data_in):
+                    page.call(
+                        "play_audio",
+                        base64.b64encode(data_in["data"].tobytes()).decode("ascii"),
+                        data_in["sampling_rate"],
+                    )
 
-                if "source" in in_data.keys():
-                    if in_data["source"] == "frontend":
-                        out_data = self.create_output_data(
-                            in_data["data"], language="en"
-                        )
+    def _update_statistic(self, batch: list) -> None:
+        now = time.time()
+        latencies = [
+            now - data_in["sent_time"] for data_in in batch if "sent_time" in data_in
+        ]
 
-                        # Update the output data set with the metadata contained inside the input
-                        in_data.pop("data", None)
-                        out_data.update(in_data)
-                        out_data["source"] = self.label
+        self.delivered_messages += len(batch)
+        self.delivered_batches += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(batch))
+        self.latency_count += len(latencies)
+        self.total_latency += sum(latencies)
+        self.max_latency = max([self.max_latency] + latencies)
 
-                        for queue in self.output_queues:
-                            queue.put(out_data)
+        self.logger.debug(
+            f"Delivered {len(batch)} messages, "
+            f"latency {max(latencies, default=0.0) * 1000:.1f}ms"
+        )
+
+    def clean_up(self):
+        if self.history is not None:
+            self.history.close()
+        for history in self.session_histories.values():
+            history.close()
+        self.session_histories.clear()
+
+        self.logger.info(
+            f"Delivered {self.delivered_messages} messages in {self.delivered_batches} "
+            f"updates, max queue depth {self.max_queue_depth}, mean latency "
+            f"{self.total_latency / max(self.latency_count, 1) * 1000:.1f}ms, "
+            f"max latency {self.max_latency * 1000:.1f}ms"
+        )
 
 
 _GUI_MODULE: EelGuiModule = None
 
 
-@eel.expose
-def process_frontend_text(data: dict) -> None:
-    """Function to process data from the frontend."""
-    print(data)
+class _Page:
+    """Web socket of a page of the frontend.
+
+    eel does not tell the exposed functions which page called them. The id of the page is
+    therefore inserted as first argument of each call, so a page cannot act within another
+    session by passing its id.
+    """
+
+    def __init__(self, page_id: int, websocket):
+        """Constructor.
+
+        Args:
+            page_id (int): Id of the page.
+            websocket: The web socket of eel.
+        """
+        self.page_id = page_id
+        self.websocket = websocket
+
+        # Set when the page registers, None is the session of the local learner
+        self.registered = False
+        self.session_id = None
+        # Only the window of the local learner may control the application
+        self.local = False
+
+        # Calls of the frontend functions whose return is not awaited
+        self._call_ids = set()
+        self._call_count = itertools.count()
+
+    def receive(self) -> str | None:
+        """Receive the next message for eel, None if the web socket was closed."""
+        while True:
+            message = self.websocket.receive()
+            if message is None:
+                return None
+
+            content = json.loads(message)
+            if "call" in content:
+                content["args"] = [self.page_id] + list(content.get("args", []))
+                return json.dumps(content)
+
+            if content.get("return") in self._call_ids:
+                self._call_ids.discard(content["return"])
+                continue
+
+            return message
+
+    def send(self, message: str) -> None:
+        """Send a message of eel."""
+        self.websocket.send(message)
+
+    def call(self, name: str, *args) -> None:
+        """Call a function the frontend exposed, without waiting for its return."""
+        call_id = f"page-{self.page_id}-{next(self._call_count)}"
+        self._call_ids.add(call_id)
+        self.send(
+            json.dumps(
+                {"call": call_id, "name": name, "args": list(args)},
+                default=lambda value: None,
+            )
+        )
+
+
+def _page_websocket(websocket) -> None:
+    """Serve the web socket of a page like eel, but with the page as first argument of
+    the exposed functions."""
+    page = _GUI_MODULE.open_page(websocket)
+    try:
+        # pylint: disable=protected-access
+        _GUI_MODULE._eel_websocket(page)
+    finally:
+        _GUI_MODULE.close_page(page)
+
+
+def _registered_page(page_id: int) -> _Page | None:
+    page = _GUI_MODULE.pages.get(page_id, None)
+    if page is None or not page.registered:
+        _GUI_MODULE.logger.warning(f"Rejected call of the unregistered page {page_id}")
+        return None
+
+    return page
+
+
+# The functions are exposed to the frontend when the module is started, eel passes the id
+# of the calling page as first argument
+
+
+def register_page(page_id: int, session_id: str = None, token: str = None) -> bool:
+    """Function for frontend to set the session of the page. Pages without session id
+    show the local learner, which requires the token of its window."""
+    page = _GUI_MODULE.pages[page_id]
+    session_id = _GUI_MODULE.local_session(session_id)
+
+    local = token is not None and secrets.compare_digest(token, _GUI_MODULE.page_token)
+    if session_id is None and not local:
+        _GUI_MODULE.logger.warning(f"Rejected page {page_id} without session or token")
+        return False
+
+    page.registered = True
+    page.session_id = session_id
+    page.local = session_id is None
+    return True
+
+
+def process_frontend_text(page_id: int, data: dict) -> None:
+    """Function to process data from the frontend. The input of remote pages is sent with
+    their session id."""
+    page = _registered_page(page_id)
+    if page is None:
+        return
+
+    if not _GUI_MODULE.pipeline_ready:
+        _GUI_MODULE.logger.warning("Dropped input, the pipeline is not ready yet")
+        return
+
     output_data = {"data": data, "source": "frontend"}
+    if page.session_id is not None:
+        output_data[SESSION_KEY] = page.session_id
 
     _GUI_MODULE.input_queue.put(output_data)
 
 
-@eel.expose
-def get_data() -> None:
-    """Function for frontend to fetch data."""
-    for data in _GUI_MODULE.history:
-        eel.update(data)
+def send_command(page_id: int, command: str) -> None:
+    """Function for the window of the local learner to control the application, see
+    `core.supervisor`."""
+    page = _registered_page(page_id)
+    if page is None or not page.local:
+        _GUI_MODULE.logger.warning(f"Rejected command {command} of page {page_id}")
+        return
+
+    _send_command(command)
+
+
+def _send_command(command: str) -> None:
+    if _GUI_MODULE.command_queue is None:
+        _GUI_MODULE.logger.warning(f"Dropped command {command}, no supervisor")
+        return
+
+    _GUI_MODULE.command_queue.put({"command": command})
+
+
+def _on_window_closed(page: str, sockets: list) -> None:
+    """Shut the application down once the last window was closed. Without this callback
+    eel would only end the process of the GUI."""
+    # pylint: disable=import-outside-toplevel,protected-access,unused-argument
+    import eel
+    import gevent
+
+    # Like eel itself, wait whether the page is only reloaded
+    gevent.sleep(1.0)
+    if len(eel._websockets) == 0:
+        _send_command("shutdown")
+
+
+def is_pipeline_ready(page_id: int) -> bool:  # pylint: disable=unused-argument
+    """Function for frontend to check if input is accepted."""
+    return _GUI_MODULE.pipeline_ready
+
+
+def get_history(page_id: int, start: int = None, count: int = 50) -> dict:
+    """Function for frontend to fetch a page of the history of its session.
+
+    Args:
+        page_id (int): Id of the calling page.
+        start (int, optional): Index of the first message. Defaults to the last page.
+        count (int, optional): Maximal number of messages. Defaults to 50.
+
+    Returns:
+        dict: The messages, the index of the first message and the size of the history.
+    """
+    page = _registered_page(page_id)
+    if page is None:
+        return {"start": 0, "messages": [], "total": 0}
+
+    history = _GUI_MODULE.session_history(page.session_id)
+    total = len(history)
+    if start is None:
+        start = max(total - count, 0)
+
+    return {
+        "start": start,
+        "messages": history.read(start, count),
+        "total": total,
+    }
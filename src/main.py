@@ -1,131 +1,67 @@
 """Main module."""
 
+import functools
 import logging
-import multiprocessing as mp
 import os
-import queue
+import signal
 
-from anyio import Path
 from pynput import keyboard
-import requests
 
-from audio.openai_tts import OpenAITTS
-from audio.sounddevice_recorder import SoundDeviceRecorderModule
-from audio.whisper_speech_recognition import WhisperSpeechRecognitionModule
-from core.processing import LogActionProcess
-from gui.eel_gui import EelGuiModule
-from text.gpt4o_mini import GPT4oMiniTextProcessingModule
+from core.registry import Pipeline, load_config
+from core.supervisor import Supervisor
 
 logging.basicConfig(level="INFO")
 
-key_queue = queue.Queue()
-
-
-def on_press(key):
-    """Key pressed callback."""
-    key_queue.put(("pressed", key))
-
-
-def on_release(key):
-    """Key release callback."""
-    key_queue.put(("released", key))
-
-
-RECORD_SOUND_KEY_COMBINATION = {
-    keyboard.Key.alt,
-    keyboard.Key.ctrl,
-    keyboard.KeyCode.from_char("r"),
-}
-STOP_SOUND_KEY_COMBINATION = {
-    keyboard.Key.alt,
-    keyboard.Key.ctrl,
-    keyboard.KeyCode.from_char("s"),
-}
-
-STOP_APPLICATION = {
-    keyboard.Key.alt,
-    keyboard.Key.ctrl,
-    keyboard.KeyCode.from_char("c"),
+# Hotkeys and the supervisor command they send
+HOTKEYS = {
+    "<ctrl>+<alt>+r": "record",
+    "<ctrl>+<alt>+s": "halt",
+    "<ctrl>+<alt>+x": "cancel",
+    "<ctrl>+<alt>+c": "shutdown",
 }
 
 
 if __name__ == "__main__":
-    # if not Path("/css/bootstrap/bootstrap.min.css").exists():
-    # requests.get()
-
-    manager = mp.Manager()
-
-    default_soundevice_input = os.environ.get("DEFAULT_SOUNDDEVICE", None)
-
-    if default_soundevice_input is not None:
-        soundDevice = SoundDeviceRecorderModule(
-            manager,
-            WhisperSpeechRecognitionModule.get_process_device(),
-            duration=WhisperSpeechRecognitionModule.SEGMENT_DURATION,
-            device=default_soundevice_input,
+    config = load_config(os.environ.get("PIPELINE_CONFIG", "resources/pipeline.toml"))
+
+    # The environment variables overwrite the configuration
+    if "PIPELINE_TRANSPORT" in os.environ:
+        config.setdefault("pipeline", {})["transport"] = os.environ["PIPELINE_TRANSPORT"]
+
+    if "DEFAULT_SOUNDDEVICE" in os.environ:
+        config["modules"]["recorder"]["device"] = os.environ["DEFAULT_SOUNDDEVICE"]
+
+    # The conversation of a stored session is continued after a restart
+    if "SESSION_ID" in os.environ:
+        for module_config in config["modules"].values():
+            for key in ("session_id", "resume_session"):
+                if key in module_config:
+                    module_config[key] = os.environ["SESSION_ID"]
+
+    pipeline = Pipeline(config)
+    supervisor = Supervisor(pipeline, **config.get("supervisor", {}))
+
+    # Ctrl+C and SIGTERM shut the pipeline down gracefully, also during the warm up
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    listener = None
+    try:
+        # The modules load their models concurrently
+        supervisor.start()
+
+        # The hotkeys are only handled once the pipeline is ready
+        listener = keyboard.GlobalHotKeys(
+            {
+                hotkey: functools.partial(supervisor.submit, command)
+                for hotkey, command in HOTKEYS.items()
+            }
         )
-    else:
-        soundDevice = SoundDeviceRecorderModule(
-            manager,
-            WhisperSpeechRecognitionModule.get_process_device(),
-            duration=WhisperSpeechRecognitionModule.SEGMENT_DURATION,
-        )
-
-    speechRecognition = WhisperSpeechRecognitionModule(
-        manager, soundDevice.sampling_rate
-    )
-
-    text_processing = GPT4oMiniTextProcessingModule(manager)
-
-    processing_1 = LogActionProcess(manager, None)
-
-    audio_out = OpenAITTS(manager)
-
-    gui = EelGuiModule(manager)
-
-    soundDevice.output_queues.append(speechRecognition.input_queue)
-
-    speechRecognition.connect_output_to(processing_1)
-    speechRecognition.connect_output_to(text_processing)
-    speechRecognition.connect_output_to(gui)
-
-    text_processing.connect_output_to(processing_1)
-    text_processing.connect_output_to(audio_out)
-    text_processing.connect_output_to(gui)
-
-    gui.connect_output_to(text_processing)
-
-    listener = keyboard.Listener(on_press=on_press, on_release=on_release)
-    listener.start()
-
-    # soundDevice.start()
-    gui.start()
-    speechRecognition.start()
-    processing_1.start()
-    text_processing.start()
-    audio_out.start()
-
-    pressend_keys = set()
-
-    while True:
-        keys = key_queue.get()
-
-        normalized_key = listener.canonical(keys[1])
-        if keys[0] == "released":
-            pressend_keys.remove(normalized_key)
-
-        if keys[0] == "pressed":
-            pressend_keys.add(normalized_key)
-
-        if all(k in pressend_keys for k in RECORD_SOUND_KEY_COMBINATION):
-            soundDevice.start()
-
-        if all(k in pressend_keys for k in STOP_SOUND_KEY_COMBINATION):
-            soundDevice.halt()
-
-        if all(k in pressend_keys for k in STOP_APPLICATION):
-            speechRecognition.kill()
-            processing_1.kill()
-            text_processing.kill()
-
-            exit()
+        listener.start()
+
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if listener is not None:
+            listener.stop()
+        supervisor.shutdown()
@@ -0,0 +1,234 @@
+"""Module containing the base classes of the text processing modules.
+
+Each session is answered within its own conversation history, see `text.history`. The
+handling of the histories is shared by all text modules through `ConversationMixin`, the
+local transformers models additionally share `AbstractTransformersTextModule`.
+"""
+
+from __future__ import annotations
+
+from abc import abstractmethod
+from typing import Callable, Iterator
+
+from core.processing import AbstractActionProcess
+from core.session_store import load_conversation
+from core.workers import SESSION_KEY
+from text.history import (
+    ConversationHistory,
+    SessionHistories,
+    summary_request,
+    tokenizer_counter,
+)
+from text.streaming import PipelineTextStream
+
+
+class ConversationMixin:
+    """Conversation histories of the sessions of a text module.
+
+    The mixin is combined with `AbstractActionProcess` or `AbstractAsyncActionProcess`.
+    Subclasses define the SYSTEM_PROMPT, count the tokens with `create_token_counter`,
+    summarize with `_summarize` and call `create_histories` at the end of their warm up.
+    """
+
+    SYSTEM_PROMPT = ""
+
+    # Prepend the system prompt to the first user message for models without system role
+    system_as_user = False
+
+    # Each session has its own conversation history, whose messages are processed in order
+    serialize_sessions = True
+
+    def __init__(
+        self,
+        manager,
+        *args,
+        output_queues=(),
+        stream=False,
+        history_token_budget=2048,
+        history_strategy="trim",
+        resume_session=None,
+        session_store_path=None,
+        max_sessions=100,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            stream (bool, optional): Send the reply as partial messages while it is
+                                     generated. Defaults to False.
+            history_token_budget (int, optional): Maximal prompt size in tokens. Defaults to 2048.
+            history_strategy (str, optional): "trim" removes the oldest turns, "summarize"
+                                     replaces them with a summary. Defaults to "trim".
+            resume_session (str, optional): Id of a stored GUI session whose conversation
+                                     is continued by the messages without session id. If
+                                     set, the other sessions also continue their stored
+                                     conversation. Defaults to None.
+            session_store_path (str, optional): Path of the session database of the GUI.
+                                     Defaults to the default of `SessionStore`.
+            max_sessions (int, optional): Maximal number of sessions whose history is kept.
+                                     Defaults to 100.
+        """
+        self.stream = stream
+
+        self.history_token_budget = history_token_budget
+        self.history_strategy = history_strategy
+        self.resume_session = resume_session
+        self.session_store_path = session_store_path
+        self.max_sessions = max_sessions
+        self.histories: SessionHistories = None
+
+        super().__init__(manager, "llm", *args, output_queues=output_queues, **kwargs)
+
+    @abstractmethod
+    def create_token_counter(self) -> Callable[[str], int]:
+        """Return the function which counts the tokens of a text for the model."""
+
+    @abstractmethod
+    def _summarize(self, messages: list) -> str:
+        """Summarize the messages which are removed from the history."""
+
+    def create_histories(self) -> None:
+        """Create the histories of the sessions, which requires the loaded model."""
+        self.histories = SessionHistories(self._create_history, self.max_sessions)
+
+    def session_history(self, data_in: dict) -> ConversationHistory:
+        """Return the history of the session of a message."""
+        return self.histories.get(data_in.get(SESSION_KEY, None))
+
+    def start_turn(self, data_in: dict) -> ConversationHistory:
+        """Add the text of the learner to the history of its session."""
+        history = self.session_history(data_in)
+        history.add_user(data_in["data"])
+        return history
+
+    def _create_history(self, session_id) -> ConversationHistory:
+        """Create the history of a session, which continues its stored conversation."""
+        history = ConversationHistory(
+            self.SYSTEM_PROMPT,
+            self.create_token_counter(),
+            self.history_token_budget,
+            self.history_strategy,
+            summarize=self._summarize,
+            system_as_user=self.system_as_user,
+        )
+        if self.resume_session is not None:
+            stored_session = self.resume_session if session_id is None else session_id
+            history.load(load_conversation(stored_session, self.session_store_path))
+
+        return history
+
+    def on_superseded(self, data_in: dict) -> None:
+        # The learner said it, even if the turn is not answered. The text is merged with
+        # the next message of the learner, see ConversationHistory
+        self.session_history(data_in).add_user(data_in["data"])
+
+
+class AbstractTransformersTextModule(ConversationMixin, AbstractActionProcess):
+    """Base class of the text modules which run a local chat model with transformers."""
+
+    DEFAULT_MODEL_NAME = None
+
+    def __init__(
+        self,
+        manager,
+        output_queues=(),
+        model_name=None,
+        history_token_budget=2048,
+        kv_cache=True,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            model_name (str, optional): Name of the model. Defaults to DEFAULT_MODEL_NAME.
+            history_token_budget (int, optional): Maximal prompt size in tokens. Defaults to 2048.
+            kv_cache (bool, optional): Keep the key/value cache of the previous turn, so that
+                                     only the new tokens of the prompt are processed.
+                                     Defaults to True.
+        """
+        self.model = None
+        self.model_name = model_name or self.DEFAULT_MODEL_NAME
+        self.kv_cache = kv_cache
+
+        super().__init__(
+            manager,
+            output_queues=output_queues,
+            history_token_budget=history_token_budget,
+            **kwargs,
+        )
+
+    def warm_up(self):
+        # pylint: disable=import-outside-toplevel
+        import torch
+        from transformers import pipeline
+
+        from text.transformers_backend import CachedTextGenerator
+
+        if self.kv_cache:
+            self.model = CachedTextGenerator(
+                self.model_name,
+                device=self.get_process_device(),
+                torch_dtype=torch.bfloat16,
+            )
+        else:
+            self.model = pipeline(
+                "text-generation",
+                model=self.model_name,
+                model_kwargs={"torch_dtype": torch.bfloat16},
+                device=self.get_process_device(),
+            )
+        self.create_histories()
+
+    def create_token_counter(self) -> Callable[[str], int]:
+        return tokenizer_counter(self.model.tokenizer)
+
+    def process(self, data_in):
+        history = self.start_turn(data_in)
+        messages = history.messages()
+        self.logger.info(f"Prompt statistic: {history.stats()}")
+
+        if self.stream:
+            return self._process_stream(messages, data_in, history)
+
+        # Process the current prompt
+        output = self.model(messages, max_new_tokens=500)
+
+        # The output contains the input plus the new additions of the model
+        reply = output[0]["generated_text"][-1]["content"].strip()
+        history.add_assistant(reply)
+
+        return self.create_output_data(reply)
+
+    def _summarize(self, messages: list) -> str:
+        output = self.model(
+            [{"role": "user", "content": summary_request(messages)}],
+            max_new_tokens=200,
+        )
+        return output[0]["generated_text"][-1]["content"].strip()
+
+    def _process_stream(
+        self, messages: list, data_in: dict, history: ConversationHistory
+    ) -> Iterator[dict]:
+        """Send the generated text as partial messages followed by a final message. The
+        generation stops early if the turn is cancelled."""
+        message_id = self.new_message_id()
+        sequence = 0
+
+        stream = PipelineTextStream(
+            self.model,
+            messages,
+            stop=lambda: self.is_cancelled(data_in),
+            max_new_tokens=500,
+        )
+        for text in stream:
+            yield self.create_stream_data(text, message_id, sequence)
+            sequence += 1
+
+        reply = stream.output[0]["generated_text"][-1]["content"].strip()
+        if reply:
+            history.add_assistant(reply)
+
+        yield self.create_stream_data(reply, message_id, sequence, final=True)
+
+    def clean_up(self):
+        del self.model
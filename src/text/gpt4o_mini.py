@@ -2,11 +2,14 @@
 https://huggingface.co/collections/google/gemma-2-release-667d6600fd5220e7b967f315
 """
 
-from openai import OpenAI
+from typing import Callable, Iterator
+
 from core.processing import AbstractActionProcess
+from text.conversation import ConversationMixin
+from text.history import ConversationHistory, summary_request, tiktoken_counter
 
 
-class GPT4oMiniTextProcessingModule(AbstractActionProcess):
+class GPT4oMiniTextProcessingModule(ConversationMixin, AbstractActionProcess):
     """Module for processing text using the chat model from Microsoft Phi-3.5-mini.
     See, https://huggingface.co/microsoft/Phi-3.5-mini-instruct
     """
@@ -16,33 +19,105 @@ class GPT4oMiniTextProcessingModule(AbstractActionProcess):
     SYSTEM_PROMPT = """ Keep yourself short.
     """
 
-    def __init__(self, manager, output_queues=(), model_name=DEFAULT_MODEL_NAME):
+    def __init__(
+        self,
+        manager,
+        output_queues=(),
+        model_name=DEFAULT_MODEL_NAME,
+        history_token_budget=4000,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            model_name (str, optional): Name of the model. Defaults to DEFAULT_MODEL_NAME.
+            history_token_budget (int, optional): Maximal prompt size in tokens. Defaults to 4000.
+        """
         self.client = None
         self.model = model_name
 
-        self.message_log = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+        super().__init__(
+            manager,
+            output_queues=output_queues,
+            history_token_budget=history_token_budget,
+            **kwargs,
+        )
 
-        super().__init__(manager, "llm", output_queues=output_queues)
+    def warm_up(self) -> None:
+        self.client = self.create_client()
+        self.create_histories()
 
-    def run(self, *args, **kwargs) -> None:
-        self.client = OpenAI()
+    def create_client(self):
+        """Create the client of the OpenAI API."""
+        # pylint: disable=import-outside-toplevel
+        from openai import OpenAI
 
-        super().run(*args, **kwargs)
+        return OpenAI()
 
     def process(self, data_in: dict) -> dict:
-        self.message_log.append({"role": "user", "content": data_in["data"]})
+        history = self.start_turn(data_in)
+        messages = history.messages()
+        self.logger.info(f"Prompt statistic: {history.stats()}")
+
+        if self.stream:
+            return self._process_stream(messages, data_in, history)
 
         output = (
+            self.client.chat.completions.create(model=self.model, messages=messages)
+            .choices[0]
+            .message.content
+        )
+
+        history.add_assistant(output)
+
+        return self.create_output_data(output)
+
+    def create_token_counter(self) -> Callable[[str], int]:
+        return tiktoken_counter(self.model)
+
+    def _summarize(self, messages: list) -> str:
+        """Summarize the messages which are removed from the history."""
+        return (
             self.client.chat.completions.create(
-                model=self.model, messages=self.message_log
+                model=self.model,
+                messages=[{"role": "user", "content": summary_request(messages)}],
             )
             .choices[0]
             .message.content
         )
 
-        self.message_log.append({"role": "system", "content": output})
+    def _process_stream(
+        self, messages: list, data_in: dict, history: ConversationHistory
+    ) -> Iterator[dict]:
+        """Send the generated text as partial messages followed by a final message. If the
+        turn is cancelled, the request is closed and the final message contains the text
+        which was generated until then."""
+        message_id = self.new_message_id()
+        sequence = 0
+        chunks = []
 
-        return self.create_output_data(output)
+        stream = self.client.chat.completions.create(
+            model=self.model, messages=messages, stream=True
+        )
+
+        for chunk in stream:
+            if self.is_cancelled(data_in):
+                self.logger.info("Stopped the reply of a cancelled turn")
+                stream.close()
+                break
+
+            if len(chunk.choices) == 0 or not chunk.choices[0].delta.content:
+                continue
+
+            chunks.append(chunk.choices[0].delta.content)
+            yield self.create_stream_data(chunks[-1], message_id, sequence)
+            sequence += 1
+
+        output = "".join(chunks)
+        if output:
+            history.add_assistant(output)
+
+        yield self.create_stream_data(output, message_id, sequence, final=True)
 
     def clean_up(self) -> None:
         del self.client
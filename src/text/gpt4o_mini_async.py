@@ -0,0 +1,153 @@
+"""Module for text processing using GPT-4o mini with the async OpenAI client.
+
+Several messages are sent concurrently through one pooled client, so the requests of
+different sessions overlap.
+"""
+
+import asyncio
+from typing import AsyncIterator, Callable
+
+from core.async_processing import AbstractAsyncActionProcess
+from core.openai_client import create_async_client, retryable_errors
+from text.conversation import ConversationMixin
+from text.history import ConversationHistory, summary_request, tiktoken_counter
+
+
+class AsyncGPT4oMiniTextProcessingModule(ConversationMixin, AbstractAsyncActionProcess):
+    """Module for processing text using the chat model GPT-4o mini.
+    See, https://platform.openai.com/docs/models/gpt-4o-mini
+    """
+
+    DEFAULT_MODEL_NAME = "gpt-4o-mini"
+
+    SYSTEM_PROMPT = """ Keep yourself short.
+    """
+
+    def __init__(
+        self,
+        manager,
+        output_queues=(),
+        model_name=DEFAULT_MODEL_NAME,
+        history_token_budget=4000,
+        max_concurrency=8,
+        max_retries=3,
+        timeout=60.0,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            model_name (str, optional): Name of the model. Defaults to DEFAULT_MODEL_NAME.
+            history_token_budget (int, optional): Maximal prompt size in tokens. Defaults to 4000.
+            max_concurrency (int, optional): Maximal number of concurrent requests.
+                                     Defaults to 8.
+            max_retries (int, optional): Retries of a failed request. Defaults to 3.
+            timeout (float, optional): Timeout of a request in seconds. Defaults to 60.
+        """
+        self.client = None
+        self.model = model_name
+        self.timeout = timeout
+
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+        # Loop of the process, used by the summary which is created outside of it
+        self._loop = None
+
+        super().__init__(
+            manager,
+            output_queues=output_queues,
+            history_token_budget=history_token_budget,
+            **kwargs,
+        )
+
+    def warm_up(self) -> None:
+        self.client = create_async_client(self.max_concurrency, self.timeout)
+        self.retryable_errors = retryable_errors()
+
+        self.create_histories()
+
+    async def process(self, data_in: dict) -> dict | AsyncIterator[dict]:
+        self._loop = asyncio.get_running_loop()
+
+        history = self.start_turn(data_in)
+        if self.history_strategy == "summarize":
+            # The summary is requested while the history is updated, which must not block
+            # the other requests
+            messages = await asyncio.to_thread(history.messages)
+        else:
+            messages = history.messages()
+        self.logger.info(f"Prompt statistic: {history.stats()}")
+
+        if self.stream:
+            return self._process_stream(messages, history)
+
+        response = await self.retry(
+            self.client.chat.completions.create, model=self.model, messages=messages
+        )
+        output = response.choices[0].message.content
+
+        history.add_assistant(output)
+
+        return self.create_output_data(output)
+
+    def create_token_counter(self) -> Callable[[str], int]:
+        return tiktoken_counter(self.model)
+
+    def _summarize(self, messages: list) -> str:
+        """Summarize the messages which are removed from the history. It is called outside
+        of the event loop."""
+        return asyncio.run_coroutine_threadsafe(
+            self._summarize_async(messages), self._loop
+        ).result()
+
+    async def _summarize_async(self, messages: list) -> str:
+        response = await self.retry(
+            self.client.chat.completions.create,
+            model=self.model,
+            messages=[{"role": "user", "content": summary_request(messages)}],
+        )
+        return response.choices[0].message.content
+
+    async def _process_stream(
+        self, messages: list, history: ConversationHistory
+    ) -> AsyncIterator[dict]:
+        """Send the generated text as partial messages followed by a final message. If the
+        task is cancelled, the request is closed and the final message contains the text
+        which was generated until then."""
+        message_id = self.new_message_id()
+        sequence = 0
+        chunks = []
+
+        # Only the start of the request is retried, a partly received reply is not repeated
+        stream = await self.retry(
+            self.client.chat.completions.create,
+            model=self.model,
+            messages=messages,
+            stream=True,
+        )
+
+        try:
+            async for chunk in stream:
+                if len(chunk.choices) == 0 or not chunk.choices[0].delta.content:
+                    continue
+
+                chunks.append(chunk.choices[0].delta.content)
+                yield self.create_stream_data(chunks[-1], message_id, sequence)
+                sequence += 1
+        except asyncio.CancelledError:
+            # The turn was cancelled, the final message contains the text until then
+            self.logger.info("Stopped the reply of a cancelled turn")
+            await stream.close()
+
+        output = "".join(chunks)
+        if output:
+            history.add_assistant(output)
+
+        yield self.create_stream_data(output, message_id, sequence, final=True)
+
+    async def async_clean_up(self) -> None:
+        await self.client.close()
+
+    def clean_up(self) -> None:
+        del self.client
@@ -0,0 +1,272 @@
+"""Module containing the conversation history which is shared by the text processing modules.
+
+The history keeps the prompt of each turn inside a token budget by removing the oldest
+messages, or by replacing them with a summary. Each session has its own history, see
+`SessionHistories`.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import threading
+from collections import OrderedDict
+from typing import Callable, Literal
+
+# Tokens which are added by the chat template around the content of each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """Summarize the following conversation in a few sentences.
+Keep names, facts and the topics which were practiced.
+"""
+
+
+def summary_request(messages: list) -> str:
+    """Return the prompt which asks a model to summarize the given messages."""
+    transcript = "\n".join(
+        f"{message['role']}: {message['content']}" for message in messages
+    )
+    return SUMMARY_PROMPT + transcript
+
+
+def approximate_token_count(text: str) -> int:
+    """Estimate the number of tokens of a text if no tokenizer is available."""
+    return math.ceil(len(text) / 4)
+
+
+def tiktoken_counter(model_name: str) -> Callable[[str], int]:
+    """Return a token counter for OpenAI models. Falls back to an approximation if tiktoken
+    is not installed, does not know the model or cannot download its encoding."""
+    try:
+        # pylint: disable=import-outside-toplevel
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model(model_name)
+    except (ImportError, KeyError, OSError):
+        return approximate_token_count
+
+    return lambda text: len(encoding.encode(text))
+
+
+def tokenizer_counter(tokenizer) -> Callable[[str], int]:
+    """Return a token counter for a transformers tokenizer."""
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class ConversationHistory:
+    """Chat message history with a token budget.
+
+    The token count of each message is computed once when it is added. If the prompt
+    exceeds the budget, the oldest user/assistant turns are removed. With the "summarize"
+    strategy the removed turns are condensed into a summary by the given function.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        count_tokens: Callable[[str], int] = approximate_token_count,
+        token_budget: int = 2048,
+        strategy: Literal["trim", "summarize"] = "trim",
+        summarize: Callable[[list], str] = None,
+        system_as_user: bool = False,
+    ):
+        """Constructor.
+
+        Args:
+            system_prompt (str): Instructions for the model.
+            count_tokens (Callable[[str], int], optional): Returns the token count of a text.
+            token_budget (int, optional): Maximal number of tokens of the prompt. Defaults to 2048.
+            strategy (Literal["trim", "summarize"], optional): How removed turns are handled.
+                                            Defaults to "trim".
+            summarize (Callable[[list], str], optional): Creates a summary of the given
+                                            messages. Required for the "summarize" strategy.
+            system_as_user (bool, optional): Prepend the system prompt to the first user
+                                            message for models without a system role.
+                                            Defaults to False.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.strategy = strategy
+        self.summarize = summarize
+        self.system_as_user = system_as_user
+
+        if strategy == "summarize" and summarize is None:
+            raise ValueError("The summarize strategy requires a summarize function")
+
+        self.system_prompt = system_prompt
+        self._system_tokens = self._count(system_prompt)
+
+        self.summary = None
+        self._summary_tokens = 0
+
+        # Each entry contains the role, content and token count of a message
+        self._messages = []
+        self._message_tokens = 0
+
+        # Increased each time older messages are removed from the history
+        self.revision = 0
+
+        # Prompt size of each turn
+        self.prompt_tokens = []
+        self.removed_messages = 0
+
+    def _count(self, text: str) -> int:
+        return self.count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+    def add_user(self, content: str) -> None:
+        """Add a message of the user."""
+        self._add("user", content)
+
+    def add_assistant(self, content: str) -> None:
+        """Add a reply of the model."""
+        self._add("assistant", content)
+
+    def _add(self, role: str, content: str) -> None:
+        # Consecutive user messages, e.g. if the reply to the first one was cancelled, are
+        # merged, because some chat templates require alternating roles
+        if role == "user" and self._messages and self._messages[-1]["role"] == "user":
+            content = self._pop_newest()["content"] + "\n" + content
+
+        tokens = self._count(content)
+        self._messages.append({"role": role, "content": content, "tokens": tokens})
+        self._message_tokens += tokens
+
+    def _pop_oldest(self) -> dict:
+        message = self._messages.pop(0)
+        self._message_tokens -= message["tokens"]
+        return message
+
+    def _pop_newest(self) -> dict:
+        message = self._messages.pop()
+        self._message_tokens -= message["tokens"]
+        return message
+
+    def load(self, messages: list) -> None:
+        """Replace the conversation with the given role/content messages, e.g. to resume
+        a previous session."""
+        self._messages = []
+        self._message_tokens = 0
+        for message in messages:
+            self._add(message["role"], message["content"])
+        self.revision += 1
+
+    @property
+    def token_count(self) -> int:
+        """Current number of tokens of the prompt."""
+        return self._system_tokens + self._summary_tokens + self._message_tokens
+
+    def messages(self) -> list:
+        """Return the prompt for the next turn as list of role/content messages. Old turns
+        are removed before, if the prompt exceeds the token budget."""
+        self._enforce_budget()
+        self.prompt_tokens.append(self.token_count)
+
+        system_prompt = self.system_prompt
+        if self.summary is not None:
+            system_prompt += f"\nSummary of the earlier conversation: {self.summary}"
+
+        messages = [
+            {"role": message["role"], "content": message["content"]}
+            for message in self._messages
+        ]
+
+        if not self.system_as_user:
+            return [{"role": "system", "content": system_prompt}] + messages
+
+        if len(messages) > 0 and messages[0]["role"] == "user":
+            messages[0]["content"] = system_prompt + " " + messages[0]["content"]
+            return messages
+
+        return [{"role": "user", "content": system_prompt}] + messages
+
+    def _enforce_budget(self) -> None:
+        removed = []
+        while self.token_count > self.token_budget and len(self._messages) > 1:
+            # Remove a complete turn, so that the history still starts with a user message
+            removed.append(self._pop_oldest())
+            while len(self._messages) > 1 and self._messages[0]["role"] != "user":
+                removed.append(self._pop_oldest())
+
+        if len(removed) == 0:
+            return
+
+        self.revision += 1
+        self.removed_messages += len(removed)
+        self.logger.debug(f"Removed {len(removed)} messages from the history")
+
+        if self.strategy == "summarize":
+            summarized = [
+                {"role": message["role"], "content": message["content"]}
+                for message in removed
+            ]
+            if self.summary is not None:
+                summarized.insert(0, {"role": "system", "content": self.summary})
+
+            self.summary = self.summarize(summarized)
+            self._summary_tokens = self.count_tokens(self.summary)
+
+    def stats(self) -> dict:
+        """Return statistics about the prompt size."""
+        return {
+            "messages": len(self._messages),
+            "tokens": self.token_count,
+            "token_budget": self.token_budget,
+            "last_prompt_tokens": self.prompt_tokens[-1] if self.prompt_tokens else 0,
+            "max_prompt_tokens": max(self.prompt_tokens, default=0),
+            "removed_messages": self.removed_messages,
+            "summary_tokens": self._summary_tokens,
+        }
+
+
+class SessionHistories:
+    """Conversation histories of the sessions which are served by a module.
+
+    The history of a session is created by the given function when its first message is
+    processed. If more than `max_sessions` histories exist, the least recently used one is
+    removed, so its conversation starts again if the session returns. The methods are
+    thread safe.
+    """
+
+    def __init__(
+        self,
+        create: Callable[[object], ConversationHistory],
+        max_sessions: int = 100,
+    ):
+        """Constructor.
+
+        Args:
+            create (Callable[[object], ConversationHistory]): Returns a new history for the
+                                            given session id.
+            max_sessions (int, optional): Maximal number of kept histories. Defaults to 100.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.create = create
+        self.max_sessions = max_sessions
+
+        self._histories = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id=None) -> ConversationHistory:
+        """Return the history of a session. Messages without session id share one session."""
+        with self._lock:
+            if session_id in self._histories:
+                self._histories.move_to_end(session_id)
+                return self._histories[session_id]
+
+            history = self.create(session_id)
+            self._histories[session_id] = history
+
+            while len(self._histories) > self.max_sessions:
+                removed, _ = self._histories.popitem(last=False)
+                self.logger.info(f"Removed the history of the inactive session {removed}")
+
+            return history
+
+    def __len__(self) -> int:
+        return len(self._histories)
+
+    def __contains__(self, session_id) -> bool:
+        return session_id in self._histories
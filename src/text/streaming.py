@@ -0,0 +1,83 @@
+"""Module containing helper to stream the output of transformers text generation pipelines."""
+
+from threading import Thread
+from typing import Callable, Iterator
+
+
+class PipelineTextStream:
+    """Runs a text generation pipeline in a background thread and iterates over the newly
+    generated text while the model is still generating."""
+
+    def __init__(
+        self,
+        model,
+        messages: list,
+        stop: Callable[[], bool] = None,
+        **generate_kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            model: The transformers text generation pipeline.
+            messages (list): The chat messages passed to the pipeline.
+            stop (Callable[[], bool], optional): Checked after each generated token, the
+                generation ends early once it returns true.
+            generate_kwargs: Additional parameter for the pipeline.
+        """
+        # pylint: disable=import-outside-toplevel
+        from transformers import StoppingCriteriaList, TextIteratorStreamer
+
+        if stop is not None:
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList(
+                [_CallbackStoppingCriteria(stop)]
+            )
+
+        self.output = None
+        self._error = None
+
+        self._streamer = TextIteratorStreamer(
+            model.tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+        self._thread = Thread(
+            target=self._generate,
+            args=(model, messages),
+            kwargs=generate_kwargs,
+            daemon=True,
+        )
+
+    def _generate(self, model, messages: list, **generate_kwargs) -> None:
+        try:
+            self.output = model(messages, streamer=self._streamer, **generate_kwargs)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # Stop the iteration, the error is raised again in the consuming thread
+            self._error = error
+            self._streamer.end()
+
+    def __iter__(self) -> Iterator[str]:
+        self._thread.start()
+
+        for text in self._streamer:
+            if text:
+                yield text
+
+        # The pipeline output is available once the generation thread is done
+        self._thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+
+class _CallbackStoppingCriteria:
+    """Stopping criteria of the generation which asks a callback, e.g. whether the turn was
+    cancelled."""
+
+    def __init__(self, stop: Callable[[], bool]):
+        self.stop = stop
+
+    def __call__(self, input_ids, scores, **kwargs):
+        # pylint: disable=import-outside-toplevel
+        import torch
+
+        return torch.full(
+            (input_ids.shape[0],), self.stop(), dtype=torch.bool, device=input_ids.device
+        )
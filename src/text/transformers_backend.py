@@ -0,0 +1,191 @@
+"""Module containing a text generation backend for local transformers models, which reuses
+the key/value cache of the previous turn.
+
+A chat conversation only grows at its end, so the prompt of the next turn starts with the
+prompt and reply of the previous turn. Only the tokens after this common prefix have to be
+processed, instead of the complete conversation. Models which need another cache than the
+`DynamicCache`, e.g. the `HybridCache` with sliding window layers of Gemma 2, cannot be
+cropped and process the complete prompt in each turn.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
+from transformers.generation.streamers import BaseStreamer
+
+
+class _TimingStreamer(BaseStreamer):
+    """Records the time of the first generated token and forwards all tokens to another
+    streamer."""
+
+    def __init__(self, streamer: BaseStreamer = None):
+        self.streamer = streamer
+        self.first_token_time = None
+        self._prompt_received = False
+
+    def put(self, value):
+        # The first call contains the prompt, all following calls the generated tokens
+        if self._prompt_received and self.first_token_time is None:
+            self.first_token_time = time.time()
+        self._prompt_received = True
+
+        if self.streamer is not None:
+            self.streamer.put(value)
+
+    def end(self):
+        if self.streamer is not None:
+            self.streamer.end()
+
+
+class CachedTextGenerator:
+    """Chat text generation which keeps the key/value cache between the calls.
+
+    It can be called like a transformers text generation pipeline with a list of chat
+    messages. Before each generation the tokenized prompt is compared with the tokens of the
+    cache. The cache is cropped to the common prefix, so that it is invalidated correctly if
+    the beginning of the conversation changed, e.g. because old turns were removed from the
+    history.
+    """
+
+    def __init__(self, model_name: str, device: str = "cpu", torch_dtype=None):
+        """Constructor.
+
+        Args:
+            model_name (str): Name of the model.
+            device (str, optional): Device of the model. Defaults to "cpu".
+            torch_dtype (torch.dtype, optional): Data type of the model weights.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForCausalLM.from_pretrained(
+            model_name, torch_dtype=torch_dtype
+        ).to(device)
+        self.model.eval()
+
+        self._cache = None
+        # Tokens whose key/values are stored inside the cache
+        self._cached_ids = None
+
+        # Only the DynamicCache can be cropped to the common prefix
+        cache_implementation = getattr(
+            self.model.generation_config, "cache_implementation", None
+        )
+        self.reuse_cache = cache_implementation in (None, "dynamic")
+        if not self.reuse_cache:
+            self.logger.warning(
+                f"The {cache_implementation} cache of {model_name} cannot be reused, "
+                "the complete prompt is processed in each turn"
+            )
+
+        # Statistic of the last generation
+        self.last_stats = dict()
+
+    def reset(self) -> None:
+        """Remove the cached key/values."""
+        self._cache = None
+        self._cached_ids = None
+
+    def _reusable_length(self, input_ids: torch.Tensor) -> int:
+        """Return the number of prompt tokens whose key/values are inside the cache."""
+        if not self.reuse_cache or self._cached_ids is None:
+            return 0
+
+        length = min(len(self._cached_ids), len(input_ids))
+        mismatch = (self._cached_ids[:length] != input_ids[:length]).nonzero()
+        if len(mismatch) > 0:
+            length = int(mismatch[0])
+
+        # At least one token must be processed to compute the logits of the next token
+        return min(length, len(input_ids) - 1)
+
+    @torch.inference_mode()
+    def __call__(
+        self, messages: list, max_new_tokens: int = 500, streamer=None, **generate_kwargs
+    ) -> list:
+        """Generate the reply to the chat messages.
+
+        Args:
+            messages (list): The chat messages.
+            max_new_tokens (int, optional): Maximal length of the reply. Defaults to 500.
+            streamer (BaseStreamer, optional): Receives the generated tokens.
+
+        Returns:
+            list: The output in the format of the text generation pipeline, the messages
+                  including the generated reply.
+        """
+        input_ids = self.tokenizer.apply_chat_template(
+            messages, add_generation_prompt=True, return_tensors="pt"
+        )[0].to(self.model.device)
+
+        reused = self._reusable_length(input_ids)
+        if not self.reuse_cache:
+            # The model creates its own cache
+            self._cache = None
+        elif reused == 0:
+            self._cache = DynamicCache()
+        else:
+            self._cache.crop(reused)
+
+        timing = _TimingStreamer(streamer)
+        start_time = time.time()
+
+        output = self.model.generate(
+            input_ids[None],
+            attention_mask=torch.ones_like(input_ids)[None],
+            past_key_values=self._cache,
+            max_new_tokens=max_new_tokens,
+            streamer=timing,
+            return_dict_in_generate=True,
+            **generate_kwargs,
+        )
+        end_time = time.time()
+
+        sequence = output.sequences[0]
+        if self.reuse_cache:
+            self._cache = output.past_key_values
+            self._cached_ids = sequence[: self._cache.get_seq_length()]
+
+        generated = sequence[len(input_ids) :]
+        reply = self.tokenizer.decode(generated, skip_special_tokens=True)
+
+        self._log_stats(len(input_ids), reused, len(generated), start_time, timing, end_time)
+
+        return [
+            {"generated_text": list(messages) + [{"role": "assistant", "content": reply}]}
+        ]
+
+    def _log_stats(
+        self,
+        prompt_tokens: int,
+        reused_tokens: int,
+        generated_tokens: int,
+        start_time: float,
+        timing: _TimingStreamer,
+        end_time: float,
+    ) -> None:
+        first_token_time = timing.first_token_time or end_time
+        prefill_tokens = prompt_tokens - reused_tokens
+        prefill_time = first_token_time - start_time
+        decode_time = end_time - first_token_time
+
+        self.last_stats = {
+            "prompt_tokens": prompt_tokens,
+            "reused_tokens": reused_tokens,
+            "prefill_tokens": prefill_tokens,
+            "prefill_tokens_per_second": prefill_tokens / max(prefill_time, 1e-6),
+            "decode_tokens": generated_tokens,
+            "decode_tokens_per_second": max(generated_tokens - 1, 0)
+            / max(decode_time, 1e-6),
+        }
+
+        self.logger.info(
+            f"Prefill {prefill_tokens} of {prompt_tokens} tokens "
+            f"({self.last_stats['prefill_tokens_per_second']:.1f} tokens/s), "
+            f"decode {generated_tokens} tokens "
+            f"({self.last_stats['decode_tokens_per_second']:.1f} tokens/s)"
+        )
@@ -0,0 +1,6 @@
+"""The modules import each other relative to the src folder, like in main.py."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
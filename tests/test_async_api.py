@@ -0,0 +1,72 @@
+"""Tests of the async GPT-4o mini module against the local mock of the OpenAI API."""
+
+from queue import Empty
+
+import pytest
+
+from benchmarks.mock_openai import MockOpenAIServer
+from core.transport import DirectTransport
+from text.gpt4o_mini_async import AsyncGPT4oMiniTextProcessingModule
+
+pytest.importorskip("openai")
+
+MESSAGES = 8
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # Every other request fails, so that most messages need a retry
+    server = MockOpenAIServer(latency=0.02, token_delay=0.001, failure_rate=0.5, seed=0)
+    server.start()
+
+    # The environment is inherited by the process of the module
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_replies_with_retries(server, stream):
+    transport = DirectTransport()
+    module = AsyncGPT4oMiniTextProcessingModule(
+        transport, stream=stream, max_concurrency=4, max_retries=10
+    )
+    module.retry_base_delay = 0.01
+    results = transport.queue()
+    module.add_output_queue(results)
+
+    module.start()
+    try:
+        assert module.wait_ready(30)
+
+        for i in range(MESSAGES):
+            module.input_queue.put({"data": f"Message {i}", "session_id": f"s{i % 3}"})
+
+        replies = dict()
+        partials = 0
+        while len(replies) < MESSAGES:
+            try:
+                result = results.get(timeout=30)
+            except Empty:
+                pytest.fail(f"Received only {len(replies)} of {MESSAGES} replies")
+
+            if module.is_partial(result):
+                partials += 1
+                continue
+            replies[result["data"].strip()] = result["session_id"]
+    finally:
+        module.terminate()
+        module.join()
+
+    assert replies == {
+        f"Mock reply to: Message {i}": f"s{i % 3}" for i in range(MESSAGES)
+    }
+    assert (partials > 0) == stream
+
+    # Each failed request was retried until it succeeded
+    stats = server.stats()
+    assert stats["failures"] > 0
+    assert stats["requests"] == MESSAGES + stats["failures"]
+    assert stats["max_concurrent"] > 1
@@ -0,0 +1,187 @@
+"""Tests of the GUI module, which run the module inside the test process."""
+
+import json
+import queue
+
+import numpy
+
+from benchmarks.stub_engines import StubGPTModule
+from core.transport import DirectTransport
+from gui import eel_gui
+from gui.eel_gui import EelGuiModule
+
+
+def _sent(module) -> list:
+    """Return the messages the module sent into its test output queue."""
+    messages = []
+    while not module.output_queues[0].empty():
+        messages.append(module.output_queues[0].get())
+    return messages
+
+
+def test_streamed_reply_to_typed_input(tmp_path):
+    transport = DirectTransport()
+    gui = EelGuiModule(
+        transport,
+        output_queues=[queue.Queue()],
+        session_store_path=str(tmp_path / "sessions.db"),
+        headless=True,
+    )
+    llm = StubGPTModule(
+        transport,
+        output_queues=[queue.Queue()],
+        latency=0.0,
+        token_delay=0.0,
+        reply_words=3,
+        stream=True,
+    )
+    gui.warm_up()
+    llm.warm_up()
+
+    typed = {"data": "Where is the station?", "source": "frontend"}
+    for in_data, out_data in zip([typed], gui.process_batch([typed])):
+        gui.send_output(out_data, in_data)
+    (llm_in,) = _sent(gui)
+
+    # The typed text is stored as first message of the history
+    assert typed["history_index"] == 0
+    assert "history_index" not in llm_in
+
+    for out_data in llm.process(llm_in):
+        llm.send_output(out_data, llm_in)
+    replies = _sent(llm)
+    gui.process_batch(replies)
+
+    # The frontend shows the partial replies only if they have no index of the history
+    partials = [reply for reply in replies if reply["partial"]]
+    assert len(partials) == 3
+    assert all("history_index" not in reply for reply in partials)
+    assert replies[-1]["final"] and replies[-1]["history_index"] == 1
+    assert replies[-1]["data"] == "Word0 Word1 end."
+
+    gui.clean_up()
+
+
+class _WebSocket:
+    """Web socket of a page, which records the calls of the frontend functions."""
+
+    def __init__(self):
+        self.received = queue.Queue()
+        self.sent = []
+
+    def receive(self):
+        return self.received.get_nowait()
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+    def calls(self, name) -> list:
+        return [call["args"] for call in self.sent if call.get("name") == name]
+
+
+def _call(page, name, *args):
+    """Call an exposed function like eel does for a message of the page."""
+    page.websocket.received.put(json.dumps({"call": 1, "name": name, "args": args}))
+    call = json.loads(page.receive())
+    return getattr(eel_gui, call["name"])(*call["args"])
+
+
+def _started_gui(tmp_path, **kwargs) -> EelGuiModule:
+    gui = EelGuiModule(
+        DirectTransport(),
+        output_queues=[queue.Queue()],
+        session_store_path=str(tmp_path / "sessions.db"),
+        headless=True,
+        **kwargs,
+    )
+    gui.warm_up()
+    gui.page_token = "token"
+    gui.command_queue = queue.Queue()
+    return gui
+
+
+def test_pages_only_receive_their_session(tmp_path):
+    gui = _started_gui(tmp_path)
+    local = gui.open_page(_WebSocket())
+    remote = gui.open_page(_WebSocket())
+    other = gui.open_page(_WebSocket())
+    assert _call(local, "register_page", None, "token")
+    assert _call(remote, "register_page", "learner-a", None)
+    assert _call(other, "register_page", "learner-b", None)
+
+    batch = [
+        {"data": "Local", "source": "stt"},
+        {"data": "Remote", "source": "frontend", "session_id": "learner-a"},
+        {
+            "data": numpy.zeros(4, dtype=numpy.int16),
+            "sampling_rate": 24000,
+            "session_id": "learner-a",
+        },
+    ]
+    gui.process_batch(batch)
+    gui._send_to_frontend(batch)
+
+    assert [
+        [data["data"] for data in args[0]]
+        for args in local.websocket.calls("update_batch")
+    ] == [["Local"]]
+    assert [
+        [data["data"] for data in args[0]]
+        for args in remote.websocket.calls("update_batch")
+    ] == [["Remote"]]
+    assert len(remote.websocket.calls("play_audio")) == 1
+    assert other.websocket.sent == []
+
+    # The history is read from the session of the calling page
+    page = _call(remote, "get_history", None, 50)
+    assert [data["data"] for data in page["messages"]] == ["Remote"]
+
+    gui.clean_up()
+
+
+def test_exposed_functions_check_the_calling_page(tmp_path):
+    gui = _started_gui(tmp_path)
+    gui.pipeline_ready = True
+    local = gui.open_page(_WebSocket())
+    remote = gui.open_page(_WebSocket())
+    forged = gui.open_page(_WebSocket())
+
+    assert _call(local, "register_page", None, "token")
+    assert _call(remote, "register_page", "learner-a", None)
+    # Pages without the token cannot show the local learner
+    assert not _call(forged, "register_page", None, "guess")
+    assert not _call(forged, "register_page", "default", None)
+    assert _call(forged, "get_history", None, 50)["messages"] == []
+
+    _call(remote, "send_command", "shutdown")
+    _call(forged, "send_command", "restart")
+    assert gui.command_queue.empty()
+    _call(local, "send_command", "shutdown")
+    assert gui.command_queue.get_nowait() == {"command": "shutdown"}
+
+    # The input is sent with the session of the page
+    _call(remote, "process_frontend_text", "Hello")
+    _call(forged, "process_frontend_text", "Hello")
+    assert gui.input_queue.get(timeout=1.0)["session_id"] == "learner-a"
+    assert gui.input_queue.qsize() == 0
+
+    gui.clean_up()
+
+
+def test_session_histories_are_bounded_and_closed(tmp_path):
+    gui = _started_gui(tmp_path, max_sessions=2)
+    pages = [gui.open_page(_WebSocket()) for _ in range(2)]
+    for page in pages:
+        _call(page, "register_page", "learner-a", None)
+
+    for session_id in ("learner-a", "learner-b", "learner-c"):
+        gui.session_history(session_id)
+    assert list(gui.session_histories) == ["learner-b", "learner-c"]
+
+    gui.session_history("learner-a")
+    gui.close_page(pages[0])
+    assert "learner-a" in gui.session_histories
+    gui.close_page(pages[1])
+    assert "learner-a" not in gui.session_histories
+
+    gui.clean_up()
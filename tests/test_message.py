@@ -0,0 +1,71 @@
+"""Tests of the message envelope and its frame encoding."""
+
+import numpy
+import pytest
+
+from core.message import Message, PayloadKind, decode, encode, payload_kind
+from core.transport import FramedQueue
+
+ARRAYS = {
+    "scalar": numpy.array(0.5, dtype=numpy.float32),
+    "audio": numpy.linspace(-1, 1, 480, dtype=numpy.float32),
+    "fortran": numpy.asfortranarray(numpy.arange(12, dtype=numpy.int16).reshape(3, 4)),
+    "empty": numpy.zeros((0, 2)),
+    "datetime": numpy.array(["2024-05-01", "2024-05-02"], dtype="datetime64[D]"),
+    "timedelta": numpy.array([1, 2], dtype="timedelta64[ms]"),
+    "structured": numpy.zeros(2, dtype=[("start", "f8"), ("end", "f8")]),
+}
+
+
+@pytest.mark.parametrize("name", ARRAYS)
+def test_array_round_trip(name):
+    array = ARRAYS[name]
+
+    decoded = decode(encode(Message(array, session_id="learner"))).data
+
+    assert decoded.dtype == array.dtype
+    assert decoded.shape == array.shape
+    numpy.testing.assert_array_equal(decoded, array)
+
+
+@pytest.mark.parametrize("name", ["datetime", "timedelta", "structured"])
+def test_arrays_without_buffer_dtype_are_pickled(name):
+    assert payload_kind(ARRAYS[name]) == PayloadKind.OBJECT
+
+
+def test_masked_array_keeps_its_mask():
+    array = numpy.ma.masked_array([1.0, 2.0], mask=[False, True])
+
+    decoded = decode(encode(Message(array))).data
+
+    assert payload_kind(array) == PayloadKind.OBJECT
+    numpy.testing.assert_array_equal(decoded.mask, array.mask)
+
+
+def test_framed_queue_sends_datetime_arrays():
+    queue = FramedQueue()
+
+    queue.put({"data": ARRAYS["datetime"], "source": "test"})
+    message = queue.get(timeout=5)
+
+    numpy.testing.assert_array_equal(message["data"], ARRAYS["datetime"])
+    assert message["source"] == "test"
+
+
+def test_long_strings_round_trip():
+    session_id = "learner-" + "x" * 70000
+
+    decoded = decode(encode(Message("Hello", session_id=session_id)))
+
+    assert decoded.session_id == session_id
+
+
+@pytest.mark.parametrize("size", [16, 64 * 1024])
+def test_framed_queue_arrays_are_writable(size):
+    queue = FramedQueue()
+
+    queue.put({"data": numpy.zeros(size, dtype=numpy.float32)})
+    array = queue.get(timeout=5)["data"]
+
+    assert array.flags.writeable
+    array[0] = 1.0
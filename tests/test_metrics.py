@@ -0,0 +1,51 @@
+"""Tests of the latency histograms of the modules."""
+
+import random
+
+import pytest
+
+from core.metrics import Histogram
+
+
+def _percentile(values: list, quantile: float) -> float:
+    return sorted(values)[int(quantile * (len(values) - 1))]
+
+
+@pytest.mark.parametrize("low, high", [(0.0005, 0.0013), (0.02, 0.4), (1.0, 20.0)])
+def test_quantiles_are_interpolated(low, high):
+    rng = random.Random(0)
+    values = [rng.uniform(low, high) for _ in range(2000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+
+    for quantile in (0.5, 0.95):
+        expected = _percentile(values, quantile)
+        assert histogram.quantile(quantile) == pytest.approx(expected, rel=0.15)
+
+
+def test_quantiles_inside_one_bucket_are_between_min_and_max():
+    histogram = Histogram()
+    for value in (0.30, 0.31, 0.32, 0.33):
+        histogram.observe(value)
+
+    assert 0.30 < histogram.quantile(0.5) < 0.33
+    assert histogram.quantile(1.0) == 0.33
+
+
+def test_restored_histogram_has_the_same_quantiles():
+    histogram = Histogram()
+    for value in (0.002, 0.004, 200.0):
+        histogram.observe(value)
+
+    restored = Histogram.from_dict(histogram.to_dict())
+
+    assert restored.min == 0.002
+    for quantile in (0.0, 0.5, 0.99):
+        assert restored.quantile(quantile) == histogram.quantile(quantile)
+
+    data = histogram.to_dict()
+    del data["min"]
+    with pytest.raises(KeyError):
+        Histogram.from_dict(data)
+    assert Histogram().quantile(0.5) == 0.0
@@ -0,0 +1,59 @@
+"""Tests of the message handling of the processing modules, which run inside the test
+process."""
+
+import queue
+import time
+
+import numpy
+
+from audio.shared_audio import SharedAudioRing
+from core.metrics import ModuleMetrics
+from core.processing import LogActionProcess
+from core.transport import DirectTransport
+from core.workers import WorkerPool
+
+
+class WaitForCancelProcess(LogActionProcess):
+    """Module which waits until the turn of its message is cancelled."""
+
+    cancellable = True
+
+    def process(self, data_in):
+        deadline = time.time() + 5.0
+        while not self.is_cancelled(data_in) and time.time() < deadline:
+            time.sleep(0.01)
+        return self.create_output_data(self.is_cancelled(data_in))
+
+
+def test_rejected_partial_releases_its_shared_audio():
+    module = LogActionProcess(DirectTransport())
+    module.metrics = ModuleMetrics("LogActionProcess", "other")
+    ring = SharedAudioRing(slot_count=1, slot_length=16)
+    data = numpy.zeros(16, dtype=numpy.float32)
+
+    slot = ring.write(data, 16000)
+    assert module._is_rejected_partial({"data": slot, "partial": True})
+    assert module.metrics.counters["dropped_partial_total"] == 1
+
+    # The final message of the utterance is passed in shared memory again
+    final = {"data": ring.write(data, 16000), "partial": False, "final": True}
+    assert final["data"] is not None
+    assert not module._is_rejected_partial(final)
+
+    ring.close()
+
+
+def test_process_workers_see_the_cancelled_turns():
+    output = queue.Queue()
+    module = WaitForCancelProcess(DirectTransport(), output_queues=[output])
+    module.metrics = ModuleMetrics("WaitForCancelProcess", "other")
+    pool = WorkerPool(module, 2, "process")
+    pool.start()
+    module._pool = pool
+
+    now = time.time()
+    pool.submit([{"data": "hello", "sent_time": now, "dequeue_time": now}])
+    module._handle_control({"command": "cancel", "time": now + 1.0})
+
+    assert output.get(timeout=5.0)["data"] is True
+    pool.stop()
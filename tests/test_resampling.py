@@ -0,0 +1,72 @@
+"""Accuracy tests of the shared resampling for the sampling rates used by the modules."""
+
+import math
+
+import numpy
+import pytest
+
+from audio.resampling import StreamingResampler, resample
+
+RATE_PAIRS = ((44100, 16000), (48000, 16000), (24000, 44100), (24000, 48000))
+
+DURATION = 1.5
+FREQUENCY = 1000.0
+MIN_SNR_DB = 50.0
+
+
+def _sine(rate: float, length: int) -> numpy.ndarray:
+    time_axis = numpy.arange(length) / rate
+    return numpy.sin(2 * numpy.pi * FREQUENCY * time_axis).astype(numpy.float32)
+
+
+def _snr_db(result: numpy.ndarray, rate: float) -> float:
+    """Signal to noise ratio against the ideal sine, ignoring the borders of the signal."""
+    expected = _sine(rate, len(result)).astype(numpy.float64)
+    border = int(0.05 * rate)
+    valid = slice(border, len(result) - border)
+    noise = result[valid] - expected[valid]
+    return 10 * math.log10(numpy.mean(expected[valid] ** 2) / numpy.mean(noise**2))
+
+
+def _stream(data: numpy.ndarray, in_rate: float, out_rate: float, chunk_length: int):
+    resampler = StreamingResampler(in_rate, out_rate)
+    chunks = [
+        resampler.process(data[offset : offset + chunk_length])
+        for offset in range(0, len(data), chunk_length)
+    ]
+    chunks.append(resampler.flush())
+    return numpy.concatenate(chunks)
+
+
+@pytest.mark.parametrize("in_rate, out_rate", RATE_PAIRS)
+def test_resample(in_rate, out_rate):
+    data = _sine(in_rate, int(DURATION * in_rate))
+
+    result = resample(data, in_rate, out_rate)
+
+    assert result.dtype == numpy.float32
+    assert len(result) == math.ceil(len(data) * out_rate / in_rate)
+    assert _snr_db(result, out_rate) > MIN_SNR_DB
+
+
+@pytest.mark.parametrize("in_rate, out_rate", RATE_PAIRS)
+@pytest.mark.parametrize("chunk_duration", [0.02, 0.0013])
+def test_streaming_matches_offline(in_rate, out_rate, chunk_duration):
+    data = _sine(in_rate, int(DURATION * in_rate))
+
+    streamed = _stream(data, in_rate, out_rate, int(chunk_duration * in_rate))
+    offline = resample(data, in_rate, out_rate)
+
+    assert len(streamed) == len(offline)
+    numpy.testing.assert_allclose(streamed, offline, rtol=0, atol=1e-5)
+    assert _snr_db(streamed, out_rate) > MIN_SNR_DB
+
+
+def test_streaming_resampler_can_be_reused():
+    data = _sine(48000, 4800)
+    resampler = StreamingResampler(48000, 16000)
+
+    first = numpy.concatenate((resampler.process(data), resampler.flush()))
+    second = numpy.concatenate((resampler.process(data), resampler.flush()))
+
+    numpy.testing.assert_array_equal(first, second)
@@ -0,0 +1,47 @@
+"""Tests of the conversations which are continued from the session database of the GUI."""
+
+from core.registry import Pipeline, register_module
+from core.session_store import SessionStore
+
+register_module("stub_gpt", "benchmarks.stub_engines:StubGPTModule")
+
+
+def _config(store_path: str) -> dict:
+    return {
+        "modules": {
+            "gui": {
+                "type": "eel_gui",
+                "headless": True,
+                "session_store_path": store_path,
+            },
+            "llm": {
+                "type": "stub_gpt",
+                "resume_session": "default",
+                "session_store_path": "$gui.session_store_path",
+            },
+        },
+        "edges": [{"from": "gui", "to": "llm"}, {"from": "llm", "to": "gui"}],
+    }
+
+
+def _store(store_path: str, session_id: str, messages: list) -> None:
+    store = SessionStore(store_path, session_id)
+    for source, text in messages:
+        store.append({"data": text, "source": source})
+    store.flush()
+    store.close()
+
+
+def test_llm_resumes_sessions_from_the_database_of_the_gui(tmp_path):
+    store_path = str(tmp_path / "sessions.db")
+    _store(store_path, "default", [("frontend", "Hello"), ("llm", "Hi, how are you?")])
+    _store(store_path, "remote", [("frontend", "Bonjour"), ("llm", "Salut !")])
+
+    llm = Pipeline(_config(store_path))["llm"]
+    llm.warm_up()
+
+    assert llm.session_store_path == store_path
+    local = llm.histories.get(None).messages()
+    remote = llm.histories.get("remote").messages()
+    assert [message["content"] for message in local[1:]] == ["Hello", "Hi, how are you?"]
+    assert [message["content"] for message in remote[1:]] == ["Bonjour", "Salut !"]
@@ -0,0 +1,41 @@
+"""Tests of the shared memory ring which passes the recorded audio to the modules."""
+
+import numpy
+import pytest
+
+from audio.shared_audio import SharedAudioRing
+
+
+@pytest.fixture
+def ring():
+    ring = SharedAudioRing(slot_count=1, slot_length=16, max_readers=3)
+    yield ring
+    ring.close()
+
+
+def test_slot_is_reused_after_all_readers_released_it(ring):
+    data = numpy.arange(8, dtype=numpy.float32)
+    slot = ring.write(data, 16000, readers=2)
+    first, second = slot.for_reader(0), slot.for_reader(1)
+
+    first.release()
+    # The second reader still reads the data
+    assert ring.write(data, 16000) is None
+    numpy.testing.assert_array_equal(second.read(), data)
+
+    second.release()
+    assert ring.write(data, 16000) is not None
+
+
+def test_release_of_a_reader_is_idempotent(ring):
+    slot = ring.write(numpy.zeros(4, dtype=numpy.float32), 16000, readers=2)
+
+    slot.release()
+    slot.release()
+
+    assert ring.write(numpy.zeros(4, dtype=numpy.float32), 16000) is None
+
+
+def test_readers_are_limited(ring):
+    with pytest.raises(ValueError):
+        ring.write(numpy.zeros(4, dtype=numpy.float32), 16000, readers=4)
@@ -0,0 +1,167 @@
+"""Tests of the key/value cache reuse with a tiny random model, which runs offline."""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from core.transport import DirectTransport  # noqa: E402
+from text.gemma import GemmaTextProcessingModule  # noqa: E402
+from text.phi import PhiMiniTextProcessingModule  # noqa: E402
+from text.transformers_backend import CachedTextGenerator  # noqa: E402
+
+CHAT_TEMPLATE = (
+    "{% for message in messages %}<|{{ message['role'] }}|>{{ message['content'] }}"
+    "<|end|>{% endfor %}{% if add_generation_prompt %}<|assistant|>{% endif %}"
+)
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    # pylint: disable=import-outside-toplevel
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+    special_tokens = ["<|end|>", "<|system|>", "<|user|>", "<|assistant|>"]
+    vocab = {char: index for index, char in enumerate(bytes_to_unicode().values())}
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.add_special_tokens(special_tokens)
+
+    path = tmp_path_factory.mktemp("tiny_model")
+    transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, eos_token="<|end|>", chat_template=CHAT_TEMPLATE
+    ).save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=tokenizer.get_vocab_size(),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=1024,
+    )
+    transformers.LlamaForCausalLM(config).save_pretrained(path)
+    return str(path)
+
+
+def _conversation(*turns) -> list:
+    messages = [{"role": "system", "content": "Translate to German."}]
+    for user, assistant in turns:
+        messages.append({"role": "user", "content": user})
+        if assistant is not None:
+            messages.append({"role": "assistant", "content": assistant})
+    return messages
+
+
+def _prompt_length(generator, messages) -> int:
+    return len(
+        generator.tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+    )
+
+
+def _uncached_reply(generator, messages) -> str:
+    generator.reset()
+    return generator(messages, max_new_tokens=8, do_sample=False)[0]["generated_text"][
+        -1
+    ]
+
+
+def test_prefix_of_the_previous_turn_is_reused(model_path):
+    generator = CachedTextGenerator(model_path)
+    first = _conversation(("Good morning", None))
+    reply = generator(first, max_new_tokens=8, do_sample=False)[0]["generated_text"][-1]
+    assert generator.last_stats["reused_tokens"] == 0
+
+    second = _conversation(("Good morning", reply["content"]), ("How are you?", None))
+    cached = generator(second, max_new_tokens=8, do_sample=False)[0]["generated_text"][
+        -1
+    ]
+    assert generator.last_stats["reused_tokens"] >= _prompt_length(generator, first)
+    assert generator.last_stats["prefill_tokens"] < _prompt_length(generator, second)
+
+    assert cached == _uncached_reply(generator, second)
+
+
+def test_cache_is_rebuilt_after_the_history_is_trimmed(model_path):
+    generator = CachedTextGenerator(model_path)
+    history = _conversation(("Good morning", "Guten Morgen"), ("How are you?", None))
+    generator(history, max_new_tokens=8, do_sample=False)
+
+    # The oldest turn was removed, only the system prompt is still a common prefix
+    trimmed = _conversation(("How are you?", "Wie geht es dir?"), ("Thank you", None))
+    cached = generator(trimmed, max_new_tokens=8, do_sample=False)[0]["generated_text"][
+        -1
+    ]
+    old_ids = generator.tokenizer.apply_chat_template(
+        history, add_generation_prompt=True
+    )
+    new_ids = generator.tokenizer.apply_chat_template(
+        trimmed, add_generation_prompt=True
+    )
+    common = next(
+        index for index, (old, new) in enumerate(zip(old_ids, new_ids)) if old != new
+    )
+    assert generator.last_stats["reused_tokens"] == common
+    assert generator._cache.get_seq_length() == len(generator._cached_ids)
+
+    assert cached == _uncached_reply(generator, trimmed)
+
+    # A summary request shares no prefix with the conversation
+    summary = [{"role": "user", "content": "Summarize the conversation"}]
+    generator(summary, max_new_tokens=8, do_sample=False)
+    assert generator.last_stats["reused_tokens"] == 0
+
+
+def test_hybrid_cache_is_not_reused(model_path, tmp_path):
+    # The sliding window layers of Gemma 2 need a HybridCache, which cannot be cropped
+    tokenizer = transformers.AutoTokenizer.from_pretrained(model_path)
+    tokenizer.save_pretrained(tmp_path)
+    torch.manual_seed(0)
+    config = transformers.Gemma2Config(
+        vocab_size=len(tokenizer),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        head_dim=8,
+        sliding_window=16,
+    )
+    transformers.Gemma2ForCausalLM(config).save_pretrained(tmp_path)
+
+    generator = CachedTextGenerator(str(tmp_path))
+    assert not generator.reuse_cache
+
+    messages = _conversation(("Good morning", None))
+    generator(messages, max_new_tokens=4, do_sample=False)
+    generator(messages, max_new_tokens=4, do_sample=False)
+    assert generator.last_stats["reused_tokens"] == 0
+
+
+@pytest.mark.parametrize(
+    "module_class", [PhiMiniTextProcessingModule, GemmaTextProcessingModule]
+)
+def test_local_text_modules_answer_within_the_session(model_path, module_class):
+    module = module_class(
+        DirectTransport(), model_name=model_path, stream=True, history_token_budget=4096
+    )
+    module.warm_up()
+
+    for session_id in ("learner-a", "learner-b", "learner-a"):
+        data_in = {"data": "Good morning", "session_id": session_id}
+        *partials, final = module.process(data_in)
+        assert final["final"]
+        assert final["data"] == "".join(partial["data"] for partial in partials).strip()
+
+    # The replies are part of the history of their session only
+    for session_id, turns in (("learner-a", 2), ("learner-b", 1)):
+        roles = [
+            message["role"] for message in module.histories.get(session_id).messages()
+        ]
+        assert roles.count("assistant") == turns
+        assert roles[-2:] == ["user", "assistant"]
+    module.clean_up()
@@ -0,0 +1,94 @@
+"""Tests of the incremental TTS pipeline and the deadline of the replies."""
+
+import queue
+import time
+
+import numpy
+
+from audio.tts_pipeline import IncrementalTTSPipeline, NullSink
+from benchmarks.stub_engines import StubOpenAITTS
+from core.metrics import ModuleMetrics
+from core.transport import DirectTransport
+from gui.eel_gui import EelGuiModule
+
+
+def _synthesize(sentence: str, language: str = None) -> tuple:
+    return numpy.zeros(240, dtype=numpy.float32), 24000
+
+
+def test_reply_is_skipped_completely_if_its_start_is_stale():
+    written, dropped = [], []
+    pipeline = IncrementalTTSPipeline(
+        _synthesize,
+        NullSink(),
+        on_written=lambda submit_time, origin_time: written.append(origin_time),
+        on_dropped=dropped.append,
+    )
+    pipeline.start()
+
+    pipeline.submit("First.", origin_time=1.0, deadline=time.time() - 1)
+    pipeline.submit("Second.", origin_time=1.0)
+    pipeline.submit("Next reply.", origin_time=2.0)
+    pipeline.stop()
+
+    assert dropped == ["First.", "Second."]
+    assert written == [2.0]
+
+
+def _create_tts(transport) -> StubOpenAITTS:
+    tts = StubOpenAITTS(
+        transport,
+        output_queues=[queue.Queue()],
+        latency=0.0,
+        seconds_per_character=0.0001,
+    )
+    tts.metrics = ModuleMetrics("StubOpenAITTS", "tts")
+    tts.warm_up()
+    return tts
+
+
+def _stream(text: str, sequence: int, deadline: float, final: bool = False) -> dict:
+    return {
+        "data": text,
+        "sent_time": deadline - 0.5,
+        "message_id": "reply",
+        "sequence": sequence,
+        "partial": not final,
+        "final": final,
+        "deadline": deadline,
+    }
+
+
+def test_started_reply_is_played_after_its_deadline():
+    tts = _create_tts(DirectTransport())
+    deadline = time.time() + 0.5
+
+    tts.process(_stream("First sentence. Sec", 0, deadline))
+    time.sleep(0.6)
+
+    # The rest of the stream arrives after the deadline
+    for data_in in (
+        _stream("ond sentence. Last", 1, deadline),
+        _stream("First sentence. Second sentence. Last", 2, deadline, final=True),
+    ):
+        assert not tts._is_stale(data_in)
+        tts.process(data_in)
+    tts.clean_up()
+
+    audio = []
+    while not tts.output_queues[0].empty():
+        audio.append(tts.output_queues[0].get())
+    assert len(audio) == 3
+
+
+def test_reply_is_dropped_if_its_start_is_stale():
+    tts = _create_tts(DirectTransport())
+
+    assert tts._is_stale(_stream("First sentence. ", 0, time.time() - 1))
+    tts.clean_up()
+
+
+def test_gui_keeps_stale_messages():
+    gui = EelGuiModule(DirectTransport(), headless=True)
+
+    assert not gui._is_stale({"data": "Late reply", "deadline": time.time() - 1})
@@ -0,0 +1,88 @@
+"""Tests of the voice activity detection."""
+
+import numpy
+import pytest
+from scipy.io import wavfile
+
+from audio.vad import EnergyVoiceActivityDetector, read_wav, segment_wav
+
+FRAME_LENGTH = 480
+SAMPLING_RATE = 16000
+
+# Start and end in seconds of the speech inside the synthetic recording
+SPEECH = [(1.0, 2.0), (3.5, 4.3)]
+DURATION = 5.3
+
+
+def _noise(level_db: float, frames: int, seed: int = 0) -> numpy.ndarray:
+    rms = 10 ** (level_db / 20)
+    noise = numpy.random.default_rng(seed).normal(0, rms, (frames, FRAME_LENGTH))
+    return noise.astype(numpy.float32)
+
+
+def _tone(level_db: float, frames: int) -> numpy.ndarray:
+    amplitude = 10 ** (level_db / 20) * numpy.sqrt(2)
+    time = numpy.arange(frames * FRAME_LENGTH) / 16000
+    tone = amplitude * numpy.sin(2 * numpy.pi * 220 * time)
+    return tone.astype(numpy.float32).reshape(frames, FRAME_LENGTH)
+
+
+def test_noise_floor_reaches_loud_background_noise():
+    vad = EnergyVoiceActivityDetector()
+
+    speech = [vad.is_speech(frame) for frame in _noise(-40, 2000)]
+
+    # The noise is only classified as speech until the floor adapted
+    assert not any(speech[-1000:])
+    assert abs(vad.noise_floor_db + 40) < 3
+
+
+def test_speech_is_detected_above_background_noise():
+    vad = EnergyVoiceActivityDetector()
+    for frame in _noise(-40, 2000):
+        vad.is_speech(frame)
+
+    speech = [vad.is_speech(frame) for frame in _tone(-15, 100)]
+
+    assert all(speech)
+
+
+def test_quiet_room_is_not_speech():
+    vad = EnergyVoiceActivityDetector()
+
+    speech = [vad.is_speech(frame) for frame in _noise(-65, 500)]
+
+    assert not any(speech)
+
+
+def _recording() -> numpy.ndarray:
+    """Quiet noise with a tone at the positions of SPEECH."""
+    rng = numpy.random.default_rng(0)
+    data = rng.normal(0, 10 ** (-60 / 20), int(DURATION * SAMPLING_RATE))
+    for start, end in SPEECH:
+        time = numpy.arange(int(start * SAMPLING_RATE), int(end * SAMPLING_RATE))
+        data[time] = 0.3 * numpy.sin(2 * numpy.pi * 220 * time / SAMPLING_RATE)
+    return data
+
+
+@pytest.mark.parametrize("dtype", ["int16", "uint8"])
+def test_segment_wav_finds_the_utterance_boundaries(tmp_path, dtype):
+    data = _recording()
+    if dtype == "uint8":
+        samples = numpy.round(data * 127 + 128).astype(numpy.uint8)
+    else:
+        samples = numpy.round(data * 32767).astype(numpy.int16)
+    path = str(tmp_path / "speech.wav")
+    wavfile.write(path, SAMPLING_RATE, samples)
+
+    read, _ = read_wav(path)
+    numpy.testing.assert_allclose(read, data, atol=1 / 127)
+
+    utterances = segment_wav(path, pre_roll=0.3, trailing_silence=0.6)
+
+    # An utterance starts with the pre roll and ends after the trailing silence
+    assert len(utterances) == len(SPEECH)
+    for (start, end, audio), (speech_start, speech_end) in zip(utterances, SPEECH):
+        assert abs(start - (speech_start - 0.3)) < 0.05
+        assert abs(end - (speech_end + 0.6)) < 0.05
+        assert len(audio) == pytest.approx((end - start) * SAMPLING_RATE, abs=1)